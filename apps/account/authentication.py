@@ -0,0 +1,47 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .cache import USER_CACHE_FIELDS, user_cache_key
+
+logger = logging.getLogger(__name__)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication, который берёт пользователя из кэша на
+    AUTH_USER_CACHE_TIMEOUT секунд. Запись удаляется сигналами при
+    save/delete пользователя (активация, смена пароля, удаление аккаунта).
+
+    Из кэша собирается неполный User (только USER_CACHE_FIELDS): где нужны
+    пароль или email, пользователя надо перечитать из базы.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            username = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        key = user_cache_key(username)
+        try:
+            fields = cache.get(key)
+        except Exception:
+            logger.warning('User cache is unavailable', exc_info=True)
+            return super().get_user(validated_token)
+        # не словарь - запись старого формата с целым User
+        if not isinstance(fields, dict):
+            user = super().get_user(validated_token)
+            fields = {field: getattr(user, field) for field in USER_CACHE_FIELDS}
+            try:
+                cache.set(key, fields, settings.AUTH_USER_CACHE_TIMEOUT)
+            except Exception:
+                logger.warning('User cache is unavailable', exc_info=True)
+            return user
+        if not fields['is_active']:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return self.user_model(**fields)
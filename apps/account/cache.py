@@ -0,0 +1,33 @@
+"""
+Кэш пользователей для CachedJWTAuthentication. Отдельно от authentication:
+сигналам и воркеру (LIGHT_STARTUP, без simplejwt) нужна только инвалидация.
+"""
+import logging
+
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_KEY = 'account:user:{username}'
+# в кэше только поля для аутентификации и прав, без пароля и email
+USER_CACHE_FIELDS = ('username', 'is_active', 'is_staff')
+
+
+def user_cache_key(username):
+    return USER_CACHE_KEY.format(username=username)
+
+
+def invalidate_user(username):
+    """
+    Удаляет пользователя из кэша после коммита (вне транзакции - сразу):
+    иначе параллельный запрос успел бы закэшировать ещё старую запись.
+    """
+    transaction.on_commit(lambda: _invalidate_user(username))
+
+
+def _invalidate_user(username):
+    try:
+        cache.delete(user_cache_key(username))
+    except Exception:
+        logger.warning('Could not invalidate cached user %s', username, exc_info=True)
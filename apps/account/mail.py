@@ -0,0 +1,148 @@
+"""
+Исходящие письма аккаунтов. Сообщения копятся в списке Redis и уходят пачками
+по одному SMTP-соединению (задача deliver_outbox), без Redis - отдельной
+задачей Celery на каждое письмо.
+
+Пачка переносится LMOVE в список PROCESSING_KEY и удаляется оттуда только
+после отправки, так что упавший воркер писем не теряет: следующая доставка
+вернёт их в очередь. Письмо, которое не ушло ACCOUNT_MAIL_MAX_ATTEMPTS раз,
+откладывается в DEAD_KEY и больше не держит очередь.
+"""
+import json
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+
+from config.redis import get_redis
+
+OUTBOX_KEY = 'account:mail:outbox'
+SCHEDULED_KEY = 'account:mail:scheduled'
+PROCESSING_KEY = 'account:mail:processing'
+DEAD_KEY = 'account:mail:dead'
+LOCK_KEY = 'account:mail:lock'
+
+
+class DeliveryError(Exception):
+    def __init__(self, pending):
+        super().__init__(f'{len(pending)} messages were not delivered')
+        self.pending = pending
+
+
+@lru_cache(maxsize=None)
+def code_template():
+    # шаблон компилируется один раз на процесс, а не на каждое письмо
+    return get_template('account/code_mail.html')
+
+
+def message(subject, to, body='', html=None):
+    return {'subject': subject, 'to': to, 'body': body, 'html': html}
+
+
+def activation_message(email, code):
+    link = f'{settings.SITE_URL}/account/activate/{code}/'
+    return message(
+        'Activate your account!', email,
+        html=code_template().render({'activation_link': link})
+    )
+
+
+def restore_message(email, code):
+    return message('Password restore', email, body=f'Your code for password restore {code}')
+
+
+def build_email(data, connection):
+    email = EmailMultiAlternatives(
+        data['subject'], data['body'], settings.EMAIL_HOST_USER, [data['to']],
+        connection=connection
+    )
+    if data['html']:
+        email.attach_alternative(data['html'], 'text/html')
+    return email
+
+
+def deliver(messages, connection=None):
+    """
+    Отправляет сообщения по одному соединению. Если отправка оборвалась,
+    поднимает DeliveryError с ещё не отправленными сообщениями.
+    """
+    connection = connection or get_connection(fail_silently=False)
+    sent = 0
+    try:
+        with connection:
+            for data in messages:
+                connection.send_messages([build_email(data, connection)])
+                sent += 1
+    except Exception as exc:
+        raise DeliveryError(messages[sent:]) from exc
+    return sent
+
+
+def push(messages):
+    """Кладёт сообщения в очередь; возвращает True, если доставку нужно запланировать."""
+    client = get_redis()
+    pipe = client.pipeline()
+    pipe.rpush(OUTBOX_KEY, *[json.dumps(data) for data in messages])
+    pipe.set(SCHEDULED_KEY, 1, nx=True, ex=settings.ACCOUNT_MAIL_BATCH_DELAY * 10)
+    return bool(pipe.execute()[1])
+
+
+def acquire_lock():
+    """Одна доставка за раз: PROCESSING_KEY принадлежит владельцу блокировки."""
+    token = uuid.uuid4().hex
+    if get_redis().set(LOCK_KEY, token, nx=True, ex=settings.ACCOUNT_MAIL_LOCK_TIMEOUT):
+        return token
+    return None
+
+
+def release_lock(token):
+    client = get_redis()
+    if client.get(LOCK_KEY) == token:
+        client.delete(LOCK_KEY)
+
+
+def recover():
+    """Возвращает в начало очереди письма, оставшиеся от упавшей доставки."""
+    client = get_redis()
+    recovered = 0
+    while client.lmove(PROCESSING_KEY, OUTBOX_KEY, 'RIGHT', 'LEFT') is not None:
+        recovered += 1
+    return recovered
+
+
+def pop_batch(size):
+    client = get_redis()
+    client.expire(LOCK_KEY, settings.ACCOUNT_MAIL_LOCK_TIMEOUT)
+    pipe = client.pipeline()
+    for _ in range(size):
+        pipe.lmove(OUTBOX_KEY, PROCESSING_KEY, 'LEFT', 'RIGHT')
+    return [json.loads(data) for data in pipe.execute() if data is not None]
+
+
+def ack():
+    get_redis().delete(PROCESSING_KEY)
+
+
+def requeue(pending):
+    """
+    Возвращает неотправленные письма в начало очереди. Первое из них и
+    сорвало отправку: ему засчитывается попытка, а после
+    ACCOUNT_MAIL_MAX_ATTEMPTS оно уходит в DEAD_KEY.
+    """
+    failed, rest = dict(pending[0]), pending[1:]
+    failed['attempts'] = failed.get('attempts', 0) + 1
+    pipe = get_redis().pipeline()
+    pipe.delete(PROCESSING_KEY)
+    if failed['attempts'] >= settings.ACCOUNT_MAIL_MAX_ATTEMPTS:
+        pipe.rpush(DEAD_KEY, json.dumps(failed))
+    else:
+        rest = [failed] + rest
+    if rest:
+        pipe.lpush(OUTBOX_KEY, *[json.dumps(data) for data in reversed(rest)])
+    pipe.execute()
+
+
+def retry_delay(retries):
+    return min(settings.ACCOUNT_MAIL_RETRY_DELAY * 2 ** retries, 60 * 30)
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:43
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+import django.db.models.deletion
+
+
+def hash_code(code):
+    # копия models.hash_code на момент миграции: миграция не должна меняться вместе с моделью
+    return salted_hmac('account.OneTimeCode', code, algorithm='sha256').hexdigest()
+
+
+def move_activation_codes(apps, schema_editor):
+    # незакрытые коды из User.activation_code: у неактивных это активация,
+    # у активных - восстановление пароля; срок считается заново от миграции
+    User = apps.get_model('account', 'User')
+    OneTimeCode = apps.get_model('account', 'OneTimeCode')
+    now = timezone.now()
+    codes, seen = [], set()
+    users = User.objects.exclude(activation_code='').values_list('pk', 'activation_code', 'is_active')
+    for username, code, is_active in users.iterator():
+        code_hash = hash_code(code)
+        if code_hash in seen:
+            continue
+        seen.add(code_hash)
+        purpose = 'restore' if is_active else 'activation'
+        codes.append(OneTimeCode(
+            user_id=username, purpose=purpose, code_hash=code_hash,
+            expires_at=now + timedelta(seconds=settings.ACCOUNT_CODE_TTL[purpose])
+        ))
+    OneTimeCode.objects.bulk_create(codes, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OneTimeCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('purpose', models.CharField(choices=[('activation', 'Activation'), ('restore', 'Password restore')], max_length=12)),
+                ('code_hash', models.CharField(max_length=64, unique=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='codes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'One-time code',
+                'verbose_name_plural': 'One-time codes',
+            },
+        ),
+        migrations.RunPython(move_activation_codes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='user',
+            name='activation_code',
+        ),
+    ]
@@ -1,6 +1,10 @@
-from django.db import models
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
-from django.utils.crypto import get_random_string
+from django.utils import timezone
+from django.utils.crypto import get_random_string, salted_hmac
 
 
 class UserManager(BaseUserManager):
@@ -34,7 +38,6 @@ class User(AbstractBaseUser):
     email = models.EmailField('Email', max_length=255, unique=True)
     is_active = models.BooleanField(default=False)
     is_staff = models.BooleanField(default=False)
-    activation_code = models.CharField(max_length=8, blank=True)
 
     objects = UserManager()
 
@@ -50,14 +53,80 @@ class User(AbstractBaseUser):
     def has_perm(self, obj=None):
         return self.is_staff
 
-    def create_activation_code(self):
-        code = get_random_string(length=8)
-        if User.objects.filter(activation_code=code).exists():
-            self.create_activation_code()
-        self.activation_code = code
-        self.save()
-
     class Meta:
         verbose_name = 'User'
         verbose_name_plural = 'Users'
 
+
+def hash_code(code):
+    return salted_hmac('account.OneTimeCode', code, algorithm='sha256').hexdigest()
+
+
+class OneTimeCodeManager(models.Manager):
+    def issue(self, user, purpose):
+        """Создаёт новый код (старые коды той же цели удаляются) и возвращает его."""
+        length = settings.ACCOUNT_CODE_LENGTH[purpose]
+        expires_at = timezone.now() + timedelta(seconds=settings.ACCOUNT_CODE_TTL[purpose])
+        self.filter(user=user, purpose=purpose).delete()
+        while True:
+            code = get_random_string(length)
+            try:
+                with transaction.atomic():
+                    self.create(
+                        user=user, purpose=purpose,
+                        code_hash=hash_code(code), expires_at=expires_at
+                    )
+                return code
+            except IntegrityError:
+                continue
+
+    def active(self, code, purpose, email=None):
+        queryset = self.filter(
+            code_hash=hash_code(code), purpose=purpose, expires_at__gt=timezone.now()
+        )
+        if email is not None:
+            queryset = queryset.filter(user__email=email)
+        return queryset
+
+    def verify(self, code, purpose, email=None):
+        return self.active(code, purpose, email).exists()
+
+    def consume(self, code, purpose, email=None):
+        """Возвращает пользователя и удаляет код; None, если код неверен или истёк."""
+        token = self.active(code, purpose, email).select_related('user').first()
+        if token is None:
+            return None
+        deleted, _ = self.filter(pk=token.pk).delete()
+        # код мог погасить параллельный запрос
+        return token.user if deleted else None
+
+    def purge_expired(self):
+        deleted, _ = self.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+
+class OneTimeCode(models.Model):
+    ACTIVATION = 'activation'
+    RESTORE = 'restore'
+    PURPOSE_CHOICES = (
+        (ACTIVATION, 'Activation'),
+        (RESTORE, 'Password restore'),
+    )
+
+    user = models.ForeignKey(
+        to=User,
+        on_delete=models.CASCADE,
+        related_name='codes'
+    )
+    purpose = models.CharField(max_length=12, choices=PURPOSE_CHOICES)
+    code_hash = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    objects = OneTimeCodeManager()
+
+    def __str__(self) -> str:
+        return f'{self.purpose} code for {self.user_id}'
+
+    class Meta:
+        verbose_name = 'One-time code'
+        verbose_name_plural = 'One-time codes'
@@ -1,9 +1,9 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from django.core.mail import send_mail
-from django.conf import settings
 
-from .tasks import send_activation_code
+from . import mail
+from .models import OneTimeCode
+from .tasks import queue_mail
 
 
 User = get_user_model()
@@ -47,8 +47,8 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         user = User.objects.create_user(**validated_data)
-        user.create_activation_code()
-        send_activation_code.delay(user.email, user.activation_code)
+        code = OneTimeCode.objects.issue(user, OneTimeCode.ACTIVATION)
+        queue_mail(mail.activation_message(user.email, code))
         return user
 
 
@@ -57,8 +57,14 @@ class PasswordChangeSerializer(serializers.Serializer):
     new_password = serializers.CharField(max_length=128, required=True)
     new_pass_confirm = serializers.CharField(max_length=128, required=True)
 
+    def get_user(self):
+        # request.user может быть собран из кэша без пароля (см. CachedJWTAuthentication)
+        if not hasattr(self, '_user'):
+            self._user = User.objects.get(pk=self.context.get('request').user.pk)
+        return self._user
+
     def validate_old_password(self, old_password):
-        user = self.context.get('request').user
+        user = self.get_user()
         if not user.check_password(old_password):
             raise serializers.ValidationError(
                 'Wrong password'
@@ -73,7 +79,7 @@ class PasswordChangeSerializer(serializers.Serializer):
         return attrs
 
     def set_new_password(self):
-        user = self.context.get('request').user
+        user = self.get_user()
         password = self.validated_data.get('new_password')
         user.set_password(password)
         user.save()
@@ -89,13 +95,8 @@ class RestorePasswordSerializer(serializers.Serializer):
     def send_code(self):
         email = self.validated_data.get('email')
         user = User.objects.get(email=email)
-        user.create_activation_code()
-        send_mail(
-            subject='Password restore',
-            message=f'Your code for password restore {user.activation_code}',
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[email]
-        )
+        code = OneTimeCode.objects.issue(user, OneTimeCode.RESTORE)
+        queue_mail(mail.restore_message(email, code))
 
 
 class SetRestoredPasswordSerializer(serializers.Serializer):
@@ -108,13 +109,6 @@ class SetRestoredPasswordSerializer(serializers.Serializer):
     new_password = serializers.CharField(max_length=128, required=True)
     new_pass_confirm = serializers.CharField(max_length=128, required=True)
 
-    def validate_code(self, code):
-        if not User.objects.filter(activation_code=code).exists():
-            raise serializers.ValidationError(
-                'Wrong code'
-            )
-        return code
-
     def validate(self, attrs):
         new_password = attrs.get('new_password')
         new_pass_confirm = attrs.get('new_pass_confirm')
@@ -122,13 +116,21 @@ class SetRestoredPasswordSerializer(serializers.Serializer):
             raise serializers.ValidationError(
                 'Passwords do not match'
             )
+        if not OneTimeCode.objects.verify(attrs['code'], OneTimeCode.RESTORE, attrs['email']):
+            raise serializers.ValidationError(
+                {'code': 'Wrong code'}
+            )
         return attrs
 
     def set_new_password(self):
-        email = self.validated_data.get('email')
-        user = User.objects.get(email=email)
+        user = OneTimeCode.objects.consume(
+            self.validated_data.get('code'),
+            OneTimeCode.RESTORE,
+            self.validated_data.get('email')
+        )
+        if user is None:
+            raise serializers.ValidationError({'code': 'Wrong code'})
         new_password = self.validated_data.get('new_password')
         user.set_password(new_password)
-        user.activation_code = ''
         user.save()
 
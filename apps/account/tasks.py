@@ -1,20 +1,63 @@
-from django.core.mail import send_mail
+import redis
 from django.conf import settings
-from django.template.loader import render_to_string
+from django.db import transaction
 from config.celery import app
 
-@app.task
-def send_activation_code(email, activation_code):
-    activation_link = f'http://localhost:8000/account/activate/{activation_code}/'
-    html_message = render_to_string(
-        'account/code_mail.html', 
-        {'activation_link': activation_link}
+from config.redis import get_redis
+
+from . import mail
+from .models import OneTimeCode
+
+
+def queue_mail(*messages):
+    """Ставит письма в очередь; отправка начнётся после коммита транзакции."""
+    if settings.ACCOUNT_MAIL_QUEUE == 'redis':
+        try:
+            if mail.push(messages):
+                transaction.on_commit(lambda: deliver_outbox.apply_async(
+                    countdown=settings.ACCOUNT_MAIL_BATCH_DELAY
+                ))
+            return
+        except redis.RedisError:
+            pass
+    transaction.on_commit(lambda: send_messages.delay(list(messages)))
+
+
+@app.task(bind=True, max_retries=settings.ACCOUNT_MAIL_MAX_RETRIES)
+def send_messages(self, messages):
+    try:
+        return mail.deliver(messages)
+    except mail.DeliveryError as exc:
+        raise self.retry(
+            exc=exc, args=(exc.pending, ), countdown=mail.retry_delay(self.request.retries)
         )
-    send_mail(
-        'Activate your account!',
-        '',
-        settings.EMAIL_HOST_USER,
-        [email],
-        html_message=html_message,
-        fail_silently=False
-    )
\ No newline at end of file
+
+
+@app.task(bind=True, max_retries=settings.ACCOUNT_MAIL_MAX_RETRIES)
+def deliver_outbox(self):
+    # следующая пачка писем снова запланирует доставку
+    get_redis().delete(mail.SCHEDULED_KEY)
+    token = mail.acquire_lock()
+    if token is None:
+        # очередь уже разбирает другой воркер
+        return 0
+    sent = 0
+    try:
+        mail.recover()
+        while True:
+            messages = mail.pop_batch(settings.ACCOUNT_MAIL_BATCH_SIZE)
+            if not messages:
+                return sent
+            try:
+                sent += mail.deliver(messages)
+            except mail.DeliveryError as exc:
+                mail.requeue(exc.pending)
+                raise self.retry(exc=exc, countdown=mail.retry_delay(self.request.retries))
+            mail.ack()
+    finally:
+        mail.release_lock(token)
+
+
+@app.task
+def purge_expired_codes():
+    return OneTimeCode.objects.purge_expired()
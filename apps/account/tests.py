@@ -1,3 +1,227 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import mail as outbox
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.articles.tests import FakeRedisMixin
+
+from . import mail, tasks
+from .cache import user_cache_key
+from .models import OneTimeCode
+from .tasks import deliver_outbox, send_messages
+
+User = get_user_model()
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']
+)
+class CachedJWTAuthenticationTestCase(TestCase):
+    url = '/account/change-password/'
+    data = {'old_password': 'wrong', 'new_password': 'a', 'new_pass_confirm': 'a'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            'reader', 'reader@mail.com', 'password', is_active=True
+        )
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_user_is_cached(self):
+        # второй запрос - перечитывание пользователя для проверки пароля
+        with self.assertNumQueries(2):
+            response = self.client.post(self.url, self.data)
+        self.assertEqual(response.status_code, 400)
+        with self.assertNumQueries(1):
+            response = self.client.post(self.url, self.data)
+        self.assertEqual(response.status_code, 400)
+
+    def test_cache_holds_no_credentials(self):
+        self.client.post(self.url, self.data)
+        self.assertEqual(
+            cache.get(user_cache_key('reader')),
+            {'username': 'reader', 'is_active': True, 'is_staff': False}
+        )
+
+    def test_password_change_with_cached_user(self):
+        self.client.post(self.url, self.data)
+        data = {'old_password': 'password', 'new_password': 'new', 'new_pass_confirm': 'new'}
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new'))
+        self.assertEqual(self.user.email, 'reader@mail.com')
+
+    def test_save_invalidates_cache(self):
+        self.client.post(self.url, self.data)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        response = self.client.post(self.url, self.data)
+        self.assertEqual(response.status_code, 401)
+
+    def test_delete_invalidates_cache(self):
+        self.client.post(self.url, self.data)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        response = self.client.post(self.url, self.data)
+        self.assertEqual(response.status_code, 401)
+
+    def test_invalidation_waits_for_commit(self):
+        # до коммита параллельный запрос закэшировал бы старую запись заново
+        self.client.post(self.url, self.data)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.is_active = False
+            self.user.save()
+            self.assertIsNotNone(cache.get(user_cache_key('reader')))
+        self.assertEqual(len(callbacks), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OneTimeCodeTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader', 'reader@mail.com', 'password')
+
+    def test_issue_stores_only_hash(self):
+        code = OneTimeCode.objects.issue(self.user, OneTimeCode.ACTIVATION)
+        stored = OneTimeCode.objects.get()
+        self.assertNotEqual(stored.code_hash, code)
+        self.assertTrue(OneTimeCode.objects.verify(code, OneTimeCode.ACTIVATION))
+        self.assertFalse(OneTimeCode.objects.verify(code, OneTimeCode.RESTORE))
+
+    def test_reissue_replaces_previous_code(self):
+        old = OneTimeCode.objects.issue(self.user, OneTimeCode.RESTORE)
+        new = OneTimeCode.objects.issue(self.user, OneTimeCode.RESTORE)
+        self.assertFalse(OneTimeCode.objects.verify(old, OneTimeCode.RESTORE))
+        self.assertTrue(OneTimeCode.objects.verify(new, OneTimeCode.RESTORE))
+
+    def test_consume_is_single_use(self):
+        code = OneTimeCode.objects.issue(self.user, OneTimeCode.ACTIVATION)
+        self.assertEqual(OneTimeCode.objects.consume(code, OneTimeCode.ACTIVATION), self.user)
+        self.assertIsNone(OneTimeCode.objects.consume(code, OneTimeCode.ACTIVATION))
+
+    def test_expired_code_is_rejected_and_purged(self):
+        code = OneTimeCode.objects.issue(self.user, OneTimeCode.ACTIVATION)
+        OneTimeCode.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(OneTimeCode.objects.consume(code, OneTimeCode.ACTIVATION))
+        self.assertEqual(OneTimeCode.objects.purge_expired(), 1)
+
+    def test_activation_view(self):
+        code = OneTimeCode.objects.issue(self.user, OneTimeCode.ACTIVATION)
+        response = APIClient().get(f'/account/activate/{code}/')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+        response = APIClient().get(f'/account/activate/{code}/')
+        self.assertEqual(response.status_code, 404)
+
+
+class FailingBackend(locmem.EmailBackend):
+    def send_messages(self, messages):
+        if len(outbox.outbox) >= 1:
+            raise ConnectionError('SMTP is down')
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class MailDeliveryTestCase(TestCase):
+    def test_batch_uses_one_connection(self):
+        messages = [mail.restore_message(f'user{i}@mail.com', 'code') for i in range(3)]
+        connection = outbox.get_connection()
+        with mock.patch.object(connection, 'open', wraps=connection.open) as opened:
+            self.assertEqual(mail.deliver(messages, connection), 3)
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual([email.to for email in outbox.outbox], [[f'user{i}@mail.com'] for i in range(3)])
+
+    def test_activation_message_is_html(self):
+        mail.deliver([mail.activation_message('reader@mail.com', 'abc')])
+        html, mimetype = outbox.outbox[0].alternatives[0]
+        self.assertEqual(mimetype, 'text/html')
+        self.assertIn('/account/activate/abc/', html)
+
+    def test_failed_delivery_returns_pending(self):
+        messages = [mail.restore_message(f'user{i}@mail.com', 'code') for i in range(3)]
+        with self.assertRaises(mail.DeliveryError) as caught:
+            mail.deliver(messages, FailingBackend())
+        self.assertEqual(caught.exception.pending, messages[1:])
+
+    def test_task_retries_pending_messages(self):
+        messages = [mail.restore_message(f'user{i}@mail.com', 'code') for i in range(2)]
+        with mock.patch.object(mail, 'get_connection', return_value=FailingBackend()), \
+                mock.patch.object(send_messages, 'retry', side_effect=RuntimeError) as retry:
+            with self.assertRaises(RuntimeError):
+                send_messages.run(messages)
+        self.assertEqual(retry.call_args.kwargs['args'], (messages[1:], ))
+
+
+class PoisonBackend(locmem.EmailBackend):
+    def send_messages(self, messages):
+        if any('poison@mail.com' in message.to for message in messages):
+            raise ValueError('Rejected recipient')
+        return super().send_messages(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    ACCOUNT_MAIL_MAX_ATTEMPTS=2
+)
+class OutboxTestCase(FakeRedisMixin, TestCase):
+    redis_modules = (mail, tasks)
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(deliver_outbox, 'retry', side_effect=RuntimeError)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def recipients(self):
+        return [email.to[0] for email in outbox.outbox]
+
+    def test_batch_is_acked_after_delivery(self):
+        mail.push([mail.restore_message(f'user{i}@mail.com', 'code') for i in range(3)])
+        self.assertEqual(deliver_outbox.run(), 3)
+        self.assertEqual(self.recipients(), [f'user{i}@mail.com' for i in range(3)])
+        self.assertEqual(self.redis.llen(mail.OUTBOX_KEY), 0)
+        self.assertEqual(self.redis.llen(mail.PROCESSING_KEY), 0)
+
+    def test_batch_of_crashed_worker_is_recovered(self):
+        mail.push([mail.restore_message(f'user{i}@mail.com', 'code') for i in range(3)])
+        # воркер забрал пачку и упал, не отправив её
+        mail.pop_batch(2)
+        self.assertEqual(deliver_outbox.run(), 3)
+        self.assertEqual(self.recipients(), [f'user{i}@mail.com' for i in range(3)])
+
+    def test_failing_message_goes_to_dead_letters(self):
+        mail.push([
+            mail.restore_message('poison@mail.com', 'code'),
+            mail.restore_message('reader@mail.com', 'code'),
+        ])
+        with mock.patch.object(mail, 'get_connection', side_effect=lambda **kwargs: PoisonBackend()):
+            for _ in range(2):
+                with self.assertRaises(RuntimeError):
+                    deliver_outbox.run()
+            self.assertEqual(deliver_outbox.run(), 1)
+        self.assertEqual(self.recipients(), ['reader@mail.com'])
+        dead = [json.loads(data) for data in self.redis.lrange(mail.DEAD_KEY, 0, -1)]
+        self.assertEqual([(data['to'], data['attempts']) for data in dead], [('poison@mail.com', 2)])
+
+    def test_concurrent_delivery_is_skipped(self):
+        mail.push([mail.restore_message('reader@mail.com', 'code')])
+        self.redis.set(mail.LOCK_KEY, 'other')
+        self.assertEqual(deliver_outbox.run(), 0)
+        self.assertEqual(self.redis.llen(mail.OUTBOX_KEY), 1)
@@ -6,6 +6,7 @@ from rest_framework import status
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework.permissions import IsAuthenticated
 
+from .models import OneTimeCode
 from .serializers import (
     UserRegistrationSerializer, 
     PasswordChangeSerializer,
@@ -13,10 +14,6 @@ from .serializers import (
     SetRestoredPasswordSerializer
     )
 
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
-from django.views.decorators.vary import vary_on_cookie, vary_on_headers
-
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import viewsets
@@ -28,7 +25,6 @@ User = get_user_model()
 
 class RegistrationView(APIView):
     @swagger_auto_schema(request_body=UserRegistrationSerializer)
-    @method_decorator(cache_page(60*60*2))
     def post(self, request: Request):
         serializer = UserRegistrationSerializer(data=request.data)
         if serializer.is_valid(raise_exception=True):
@@ -39,17 +35,15 @@ class RegistrationView(APIView):
             )
 
 class AccountActivationView(APIView):
-    @method_decorator(cache_page(60*60*2))
     def get(self, request, activation_code):
-        user = User.objects.filter(activation_code=activation_code).first()
+        user = OneTimeCode.objects.consume(activation_code, OneTimeCode.ACTIVATION)
         if not user:
             return Response(
                 'Page not found', 
                 status=status.HTTP_404_NOT_FOUND
                 )
         user.is_active = True
-        user.activation_code = ''
-        user.save()
+        user.save(update_fields=['is_active'])
         return Response(
             'Account activated! You can login now', 
             status=status.HTTP_200_OK
@@ -59,7 +53,6 @@ class AccountActivationView(APIView):
 class ChangePasswordView(APIView):
     permission_classes = [IsAuthenticated]
 
-    @method_decorator(cache_page(60*60*2))
     def post(self, request: Request):
         serializer = PasswordChangeSerializer(data=request.data, context={'request': request})
         if serializer.is_valid(raise_exception=True):
@@ -72,7 +65,6 @@ class ChangePasswordView(APIView):
 
 class RestorePasswordView(APIView):
 
-    @method_decorator(cache_page(60*60*2))
     def post(self, request: Request):
         serializer = RestorePasswordSerializer(data=request.data)
         if serializer.is_valid(raise_exception=True):
@@ -85,7 +77,6 @@ class RestorePasswordView(APIView):
 
 class SetRestoredPasswordView(APIView):
 
-    @method_decorator(cache_page(60*60*2))
     def post(self, request: Request):
         serializer = SetRestoredPasswordSerializer(data=request.data)
         if serializer.is_valid(raise_exception=True):
@@ -99,7 +90,6 @@ class SetRestoredPasswordView(APIView):
 class DeleteAccountView(APIView):
     permission_classes = [IsAuthenticated]
 
-    @method_decorator(cache_page(60*60*2))
     def delete(self, request: Request):
         username = request.user.username
         User.objects.get(username=username).delete()
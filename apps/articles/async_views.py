@@ -0,0 +1,237 @@
+"""
+Async-варианты горячих эндпоинтов чтения (/wikipedia/async/...). Под ASGI
+они работают в event loop без sync-адаптера DRF: async ORM, async API кэша,
+независимые запросы (статья, теги, карусель, комментарии; count и страница)
+идут через asyncio.gather. Ответ совпадает с синхронными вьюсетами, в кэше
+хранится уже отрендеренный JSON, ETag/Last-Modified - как в CachedResponseMixin.
+"""
+import asyncio
+import hashlib
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.forms import ModelMultipleChoiceField
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from config.db import replica_reads
+from config.renderers import FastJSONRenderer
+from . import search
+from .cache import aget_versions, article_group
+from .counters import record_view
+from .models import Article, ArticleImage, Category, Comment, Tag
+from .pagination import ArticleCursorPagination
+from .serializers import (
+    ArticleListSerializer,
+    ArticleSerializer,
+    CategorySerializer,
+    HomepageListSerializer,
+    TagSerializer,
+    first_comments
+)
+from .views import ARTICLE_SUMMARY_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+def set_prefetched(instance, name, objects):
+    # то же, что делает prefetch_related: сериализатор не пойдёт в базу
+    queryset = getattr(instance, name).all()
+    queryset._result_cache = objects
+    queryset._prefetch_done = True
+    instance.__dict__.setdefault('_prefetched_objects_cache', {})[name] = queryset
+
+
+class AsyncReadView(View):
+    """
+    Базовая async-вьюха только для чтения. Подклассы задают basename/action
+    (ключ кэша), cache_groups и get_data(request, **kwargs) -> данные ответа.
+    """
+    http_method_names = ['get', 'head', 'options']
+    basename = None
+    action = None
+    cache_groups = ()
+    renderer = FastJSONRenderer()
+
+    async def get(self, request, *args, **kwargs):
+        if self.use_replica(request):
+            with replica_reads():
+                return await self.dispatch_cached(request, **kwargs)
+        return await self.dispatch_cached(request, **kwargs)
+
+    def use_replica(self, request):
+        # JWT здесь не разбирается, поэтому закреплённого за primary автора не узнать:
+        # запросы с Authorization читают primary
+        return bool(settings.DATABASE_REPLICAS) and 'HTTP_AUTHORIZATION' not in request.META
+
+    def get_cache_groups(self):
+        return self.cache_groups
+
+    def get_cache_key(self, request, versions):
+        # как в CachedResponseMixin: ссылки в ответе абсолютные, ключ зависит от Host и схемы
+        path = hashlib.md5(request.build_absolute_uri().encode('utf-8')).hexdigest()
+        version = '.'.join(str(v) for v in versions)
+        return f'api:{self.basename}:{self.action}:{version}:{path}'
+
+    async def dispatch_cached(self, request, **kwargs):
+        try:
+            versions, last_modified = await aget_versions(self.get_cache_groups())
+            key = self.get_cache_key(request, versions)
+            etag = quote_etag(hashlib.md5(key.encode('utf-8')).hexdigest())
+            not_modified = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if not_modified is not None:
+                return not_modified
+            content = await cache.aget(key)
+        except Exception:
+            logger.warning('Response cache is unavailable', exc_info=True)
+            return await self.render(request, **kwargs)
+        if content is not None:
+            response = self.json_response(content)
+        else:
+            response = await self.render(request, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            try:
+                await cache.aset(key, response.content, settings.API_CACHE_TIMEOUT)
+            except Exception:
+                logger.warning('Response cache is unavailable', exc_info=True)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    async def render(self, request, **kwargs):
+        try:
+            data = await self.get_data(Request(request), **kwargs)
+        except APIException as exc:
+            # тело ошибки как у exception_handler DRF
+            detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return self.json_response(self.renderer.render(detail), exc.status_code)
+        return self.json_response(self.renderer.render(data))
+
+    def json_response(self, content, status_code=status.HTTP_200_OK):
+        return HttpResponse(content, content_type=self.renderer.media_type, status=status_code)
+
+    async def get_data(self, request, **kwargs):
+        raise NotImplementedError
+
+
+class ArticleListView(AsyncReadView):
+    basename = 'async-article'
+    action = 'list'
+    cache_groups = ('articles', )
+    serializer_class = ArticleListSerializer
+
+    def get_queryset(self, request):
+        queryset = Article.objects.only(*ARTICLE_SUMMARY_FIELDS)
+        tag = request.query_params.get('tag')
+        if tag:
+            queryset = queryset.filter(tag=tag)
+        return queryset
+
+    async def get_data(self, request):
+        paginator = ArticleCursorPagination()
+        queryset = self.get_queryset(request)
+        query = request.query_params.get(api_settings.SEARCH_PARAM, '').strip()
+        if query:
+            # как FullTextSearchFilter; без PostgreSQL фильтр сам читает индекс из базы
+            queryset = await sync_to_async(search.filter_queryset)(queryset, query)
+        tag = request.query_params.get('tag')
+        # существование тега (как в filterset_fields) проверяется параллельно со страницей
+        page, tag_exists = await asyncio.gather(
+            paginator.apaginate_queryset(queryset, request),
+            Tag.objects.filter(pk=tag).aexists() if tag else asyncio.sleep(0, True),
+        )
+        if not tag_exists:
+            message = ModelMultipleChoiceField.default_error_messages['invalid_choice']
+            raise ValidationError({'tag': [message % {'value': tag}]})
+        serializer = self.serializer_class(page, many=True, context={'request': request})
+        return paginator.get_paginated_data(serializer.data)
+
+
+class HomepageListView(ArticleListView):
+    basename = 'async-homepage'
+    serializer_class = HomepageListSerializer
+
+
+class ArticleDetailView(AsyncReadView):
+    basename = 'async-article'
+    action = 'retrieve'
+
+    def get_cache_groups(self):
+        return [article_group(self.kwargs['pk'])]
+
+    async def get(self, request, *args, **kwargs):
+        response = await super().get(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            await sync_to_async(record_view)(kwargs['pk'])
+        return response
+
+    async def get_data(self, request, pk):
+        page_size = settings.ARTICLE_COMMENTS_FIRST_PAGE
+        comments = first_comments(Comment.objects.filter(post_id=pk).select_related('user'))
+        # все части статьи зависят только от pk, поэтому не ждут саму статью
+        article, tags, images, comments = await asyncio.gather(
+            Article.objects.select_related('user').aget(pk=pk),
+            alist(Tag.objects.filter(articles=pk)),
+            alist(ArticleImage.objects.filter(article_id=pk)),
+            alist(comments[:page_size + 1]),
+            return_exceptions=True
+        )
+        if isinstance(article, Article.DoesNotExist):
+            raise NotFound()
+        for result in (article, tags, images, comments):
+            if isinstance(result, BaseException):
+                raise result
+        set_prefetched(article, 'tag', tags)
+        set_prefetched(article, 'article_images', images)
+        article.first_comments = comments
+        return ArticleSerializer(article, context={'request': request}).data
+
+
+class LimitOffsetListView(AsyncReadView):
+    """Список с пагинацией по умолчанию (LimitOffsetPagination): count и страница параллельно."""
+    action = 'list'
+    queryset = None
+    serializer_class = None
+
+    async def get_data(self, request):
+        paginator = api_settings.DEFAULT_PAGINATION_CLASS()
+        queryset = self.queryset.all()
+        paginator.request = request
+        paginator.limit = paginator.get_limit(request)
+        if paginator.limit is None:
+            return self.serializer_class(await alist(queryset), many=True).data
+        paginator.offset = paginator.get_offset(request)
+        paginator.count, page = await asyncio.gather(
+            queryset.acount(),
+            alist(queryset[paginator.offset:paginator.offset + paginator.limit]),
+        )
+        return paginator.get_paginated_response(self.serializer_class(page, many=True).data).data
+
+
+class TagListView(LimitOffsetListView):
+    basename = 'async-tags'
+    cache_groups = ('tags', )
+    queryset = Tag.objects.all()
+    serializer_class = TagSerializer
+
+
+class CategoryListView(LimitOffsetListView):
+    basename = 'async-category'
+    cache_groups = ('categories', )
+    queryset = Category.objects.all()
+    serializer_class = CategorySerializer
@@ -0,0 +1,159 @@
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'api:version:{group}'
+MODIFIED_KEY = 'api:modified:{group}'
+
+
+def _initial_version():
+    # после вытеснения ключа версия не должна повторить уже выданную
+    return time.time_ns()
+
+
+def get_versions(groups):
+    """Версии групп и время последнего изменения любой из них - одним get_many."""
+    version_keys, modified_keys = _version_keys(groups)
+    values = cache.get_many(version_keys + modified_keys)
+    missing = _missing_versions(values, version_keys, modified_keys)
+    if missing:
+        cache.set_many(missing, timeout=None)
+        values.update(missing)
+    return _resolve_versions(values, version_keys, modified_keys)
+
+
+async def aget_versions(groups):
+    """get_versions для async-вьюх, через async API кэша."""
+    version_keys, modified_keys = _version_keys(groups)
+    values = await cache.aget_many(version_keys + modified_keys)
+    missing = _missing_versions(values, version_keys, modified_keys)
+    if missing:
+        await cache.aset_many(missing, timeout=None)
+        values.update(missing)
+    return _resolve_versions(values, version_keys, modified_keys)
+
+
+def _version_keys(groups):
+    version_keys = [VERSION_KEY.format(group=group) for group in groups]
+    modified_keys = [MODIFIED_KEY.format(group=group) for group in groups]
+    return version_keys, modified_keys
+
+
+def _missing_versions(values, version_keys, modified_keys):
+    missing = {key: _initial_version() for key in version_keys if key not in values}
+    now = int(time.time())
+    missing.update({key: now for key in modified_keys if key not in values})
+    return missing
+
+
+def _resolve_versions(values, version_keys, modified_keys):
+    versions = [values[key] for key in version_keys]
+    return versions, max((values[key] for key in modified_keys), default=int(time.time()))
+
+
+def bump(*groups):
+    """
+    Увеличивает версии групп после коммита текущей транзакции (вне транзакции -
+    сразу): иначе параллельный читатель успел бы закэшировать ещё старые данные
+    под новой версией.
+    """
+    transaction.on_commit(lambda: _bump(groups))
+
+
+def _bump(groups):
+    now = int(time.time())
+    for group in groups:
+        key = VERSION_KEY.format(group=group)
+        try:
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, _initial_version(), timeout=None)
+            cache.set(MODIFIED_KEY.format(group=group), now, timeout=None)
+        except Exception:
+            logger.warning('Could not invalidate cache group %s', group, exc_info=True)
+
+
+def article_group(slug):
+    return f'article:{slug}'
+
+
+class CachedResponseMixin:
+    """
+    Кэширует response.data для list/retrieve. Ключ включает версии групп,
+    которые сигналы увеличивают при save/delete, поэтому старые страницы
+    просто перестают читаться. Из того же ключа получается ETag, а из времени
+    последнего bump - Last-Modified: условный GET отвечает 304 без запросов
+    к базе и без сериализации.
+    """
+    cache_groups = ()
+    cache_actions = ('list', 'retrieve')
+    # детальные страницы статьи (retrieve и detail-экшены) зависят только от её версии
+    cache_per_article = False
+
+    def get_cache_groups(self):
+        if self.detail and self.cache_per_article:
+            return [article_group(self.kwargs[self.lookup_url_kwarg or self.lookup_field])]
+        return self.cache_groups
+
+    def get_cache_key(self, request, versions):
+        # в данных абсолютные ссылки (картинки, курсоры): у каждого Host и схемы свой ключ
+        path = hashlib.md5(request.build_absolute_uri().encode('utf-8')).hexdigest()
+        version = '.'.join(str(v) for v in versions)
+        return f'api:{self.basename}:{self.action}:{version}:{path}'
+
+    def get_etag(self, request, key):
+        # тело зависит от ключа кэша и формата ответа, сериализатор для этого не нужен
+        renderer = getattr(request, 'accepted_renderer', None)
+        fmt = renderer.format if renderer is not None else ''
+        return quote_etag(hashlib.md5(f'{key}:{fmt}'.encode('utf-8')).hexdigest())
+
+    def dispatch_cached(self, handler, request, *args, **kwargs):
+        # bump() нужен и воркерам, поэтому модуль не тянет DRF целиком при импорте
+        from rest_framework.response import Response
+
+        try:
+            versions, last_modified = get_versions(self.get_cache_groups())
+            key = self.get_cache_key(request, versions)
+            etag = self.get_etag(request, key)
+            not_modified = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if not_modified is not None:
+                return not_modified
+            data = cache.get(key)
+        except Exception:
+            logger.warning('Response cache is unavailable', exc_info=True)
+            return handler(request, *args, **kwargs)
+        if data is not None:
+            response = Response(data)
+        else:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            try:
+                cache.set(key, response.data, settings.API_CACHE_TIMEOUT)
+            except Exception:
+                logger.warning('Response cache is unavailable', exc_info=True)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if 'list' not in self.cache_actions:
+            return super().list(request, *args, **kwargs)
+        return self.dispatch_cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if 'retrieve' not in self.cache_actions:
+            return super().retrieve(request, *args, **kwargs)
+        return self.dispatch_cached(super().retrieve, request, *args, **kwargs)
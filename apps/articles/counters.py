@@ -0,0 +1,150 @@
+import atexit
+import threading
+import time
+import uuid
+from collections import Counter
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from . import cache, leaderboard, trending
+from .models import Article, ArticleViewFlush
+from config.redis import get_redis
+
+VIEWS_KEY = 'articles:views'
+VIEWS_FLUSHING_KEY = 'articles:views:flushing'
+VIEWS_FLUSH_ID_KEY = 'articles:views:flushing:id'
+VIEWS_FLUSH_LOCK_KEY = 'articles:views:flush-lock'
+# больше самого долгого сброса, иначе два сброса могут пересечься
+VIEWS_FLUSH_LOCK_TIMEOUT = 5 * 60
+FLUSH_CHUNK_SIZE = 500
+
+_lock = threading.Lock()
+_pending = Counter()
+_last_flush = time.monotonic()
+
+
+def record_view(slug):
+    if settings.ARTICLE_VIEWS_BUFFER == 'redis':
+        try:
+            get_redis().hincrby(VIEWS_KEY, slug, 1)
+            return
+        except redis.RedisError:
+            pass
+    with _lock:
+        _pending[slug] += 1
+        due = time.monotonic() - _last_flush >= settings.ARTICLE_VIEWS_FLUSH_INTERVAL
+    if due:
+        flush_memory_views()
+
+
+def apply_view_deltas(deltas):
+    # один UPDATE на чанк (просмотры и trending score), updated_at не трогает
+    slugs = list(deltas)
+    now = time.time()
+    applied = []
+    for start in range(0, len(slugs), FLUSH_CHUNK_SIZE):
+        chunk = {slug: deltas[slug] for slug in slugs[start:start + FLUSH_CHUNK_SIZE]}
+        # просмотры уже удалённых статей не должны попасть в корзины (FK)
+        existing = set(Article.objects.filter(pk__in=list(chunk)).values_list('pk', flat=True))
+        chunk = {slug: views for slug, views in chunk.items() if slug in existing}
+        if not chunk:
+            continue
+        increment = Case(
+            *[When(pk=slug, then=Value(views)) for slug, views in chunk.items()],
+            default=Value(0),
+            output_field=IntegerField()
+        )
+        Article.objects.filter(pk__in=list(chunk)).update(
+            views_count=F('views_count') + increment,
+            trending_score=trending.score_update(chunk, now)
+        )
+        trending.record_buckets(chunk, now)
+        applied += chunk
+    if applied:
+        # views_count есть в кэшированных ответах и их ETag, а сохранений статьи не было
+        cache.bump('articles', *[cache.article_group(slug) for slug in applied])
+    # Redis не откатывается вместе с транзакцией: неудачный сброс не должен посчитаться дважды
+    transaction.on_commit(lambda: increment_leaderboard(deltas))
+
+
+def increment_leaderboard(deltas):
+    try:
+        leaderboard.increment(deltas)
+    except redis.RedisError:
+        pass
+
+
+def flush_memory_views():
+    global _last_flush
+    with _lock:
+        deltas = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    if not deltas:
+        return {}
+    try:
+        with transaction.atomic():
+            apply_view_deltas(deltas)
+    except Exception:
+        with _lock:
+            _pending.update(deltas)
+        raise
+    return deltas
+
+
+def flush_redis_views():
+    client = get_redis()
+    token = uuid.uuid4().hex
+    if not client.set(VIEWS_FLUSH_LOCK_KEY, token, nx=True, ex=VIEWS_FLUSH_LOCK_TIMEOUT):
+        # сейчас сбрасывает другой воркер
+        return {}
+    try:
+        return _flush_redis_views(client)
+    finally:
+        if client.get(VIEWS_FLUSH_LOCK_KEY) == token:
+            client.delete(VIEWS_FLUSH_LOCK_KEY)
+
+
+def _flush_redis_views(client):
+    # RENAME атомарен: новые просмотры идут в свежий хэш, пока этот сбрасывается;
+    # остаток от упавшего сброса обрабатывается первым
+    if not client.exists(VIEWS_FLUSHING_KEY):
+        try:
+            client.renamenx(VIEWS_KEY, VIEWS_FLUSHING_KEY)
+        except redis.ResponseError:
+            return {}
+    # id закреплён за хэшем до его удаления, поэтому повтор распознаётся
+    client.set(VIEWS_FLUSH_ID_KEY, uuid.uuid4().hex, nx=True)
+    flush_id = client.get(VIEWS_FLUSH_ID_KEY)
+    deltas = {
+        slug: int(count)
+        for slug, count in client.hgetall(VIEWS_FLUSHING_KEY).items()
+    }
+    with transaction.atomic():
+        # сбросы идут по одному, поэтому повториться может только последний id
+        _, created = ArticleViewFlush.objects.get_or_create(flush_id=flush_id)
+        if created:
+            ArticleViewFlush.objects.exclude(flush_id=flush_id).delete()
+            apply_view_deltas(deltas)
+    client.delete(VIEWS_FLUSHING_KEY, VIEWS_FLUSH_ID_KEY)
+    return deltas if created else {}
+
+
+def flush_views():
+    deltas = Counter(flush_memory_views())
+    if settings.ARTICLE_VIEWS_BUFFER == 'redis':
+        deltas.update(flush_redis_views())
+    return dict(deltas)
+
+
+def _flush_at_exit():
+    try:
+        flush_memory_views()
+    except Exception:
+        pass
+
+
+atexit.register(_flush_at_exit)
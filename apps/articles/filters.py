@@ -0,0 +1,23 @@
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+
+from .search import filter_queryset
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    search_param = api_settings.SEARCH_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return filter_queryset(queryset, query)
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Full-text search over title, text, tags and category',
+            'schema': {'type': 'string'},
+        }]
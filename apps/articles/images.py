@@ -0,0 +1,70 @@
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'variants'
+
+
+def needs_processing(field_file, variants):
+    return bool(field_file) and variants.get('source') != field_file.name
+
+
+def render_variant(image, width):
+    variant = image.copy()
+    variant.thumbnail((width, width * 10), Image.LANCZOS)
+    buffer = BytesIO()
+    variant.save(buffer, 'WEBP', quality=settings.IMAGE_VARIANT_QUALITY, method=4)
+    return ContentFile(buffer.getvalue())
+
+
+def build_variants(field_file):
+    """
+    Режет оригинал на WebP-варианты из IMAGE_VARIANT_WIDTHS в хранилище
+    оригинала. Возвращает имя превью (самый узкий вариант) и словарь для
+    image_variants.
+    """
+    field_file.open('rb')
+    try:
+        image = ImageOps.exif_transpose(Image.open(field_file))
+        image.load()
+    finally:
+        field_file.close()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    stem = os.path.splitext(os.path.basename(field_file.name))[0]
+    widths = sorted(settings.IMAGE_VARIANT_WIDTHS)
+    # вариант шире оригинала не нужен, но хотя бы превью есть всегда
+    widths = [w for w in widths if w < image.width] or widths[:1]
+    names = {}
+    for width in widths:
+        name = field_file.storage.save(
+            f'{VARIANTS_DIR}/{stem}_{width}w.webp', render_variant(image, width)
+        )
+        names[str(width)] = name
+    return names[str(widths[0])], {'source': field_file.name, 'widths': names}
+
+
+def delete_variants(variants, storage):
+    """Удаляет файлы вариантов, например после замены или удаления оригинала."""
+    for name in variants.get('widths', {}).values():
+        try:
+            storage.delete(name)
+        except OSError:
+            logger.warning('Could not delete image variant %s', name, exc_info=True)
+
+
+def build_srcset(variants, storage, request=None):
+    parts = []
+    for width, name in sorted(variants.get('widths', {}).items(), key=lambda item: int(item[0])):
+        url = storage.url(name)
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        parts.append(f'{url} {width}w')
+    return ', '.join(parts)
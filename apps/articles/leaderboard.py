@@ -0,0 +1,160 @@
+import uuid
+
+import redis
+from django.conf import settings
+
+from .models import Article
+from config.redis import get_redis
+
+TOP_KEY = 'articles:top'
+MEMBERSHIP_KEY = 'articles:top:boards:{slug}'
+# rebuild() собирает лидерборды под временными ключами и переименовывает их поверх живых
+REBUILD_KEY = 'articles:rebuild'
+STAGING_KEY = 'articles:rebuild:{token}:{key}'
+REBUILD_TIMEOUT = 60 * 60
+REBUILD_CHUNK = 1000
+# поля ArticleSerializerTop: карточкам топа не нужен text
+TOP_FIELDS = ('slug', 'title', 'image', 'user_id', 'views_count')
+
+
+def board_keys(category_id, tag_slugs):
+    keys = [TOP_KEY, f'{TOP_KEY}:category:{category_id}']
+    keys += [f'{TOP_KEY}:tag:{slug}' for slug in tag_slugs]
+    return keys
+
+
+def _sync(pipe, slug, views_count, keys, old_keys=()):
+    membership = MEMBERSHIP_KEY.format(slug=slug)
+    for key in set(old_keys) - set(keys):
+        pipe.zrem(key, slug)
+    for key in keys:
+        # nx: счёт уже существующих записей ведёт increment()
+        pipe.zadd(key, {slug: views_count}, nx=True)
+    pipe.delete(membership)
+    pipe.sadd(membership, *keys)
+
+
+def sync_article(article):
+    client = get_redis()
+    tag_slugs = [tag.slug for tag in article.tag.all()]
+    old_keys = client.smembers(MEMBERSHIP_KEY.format(slug=article.pk))
+    pipe = client.pipeline()
+    _sync(
+        pipe, article.pk, article.views_count,
+        board_keys(article.category_id, tag_slugs), old_keys
+    )
+    pipe.execute()
+
+
+def remove_article(slug):
+    client = get_redis()
+    membership = MEMBERSHIP_KEY.format(slug=slug)
+    pipe = client.pipeline()
+    for key in client.smembers(membership):
+        pipe.zrem(key, slug)
+    pipe.delete(membership)
+    pipe.execute()
+
+
+def increment(deltas):
+    # Статья уже знает свои лидерборды, поэтому сброс просмотров не ходит в БД
+    client = get_redis()
+    pipe = client.pipeline()
+    pipe.get(REBUILD_KEY)
+    for slug in deltas:
+        pipe.smembers(MEMBERSHIP_KEY.format(slug=slug))
+    token, *memberships = pipe.execute()
+    missing = []
+    for slug, keys in zip(deltas, memberships):
+        if not keys:
+            missing.append(slug)
+        for key in keys:
+            pipe.zincrby(key, deltas[slug], slug)
+            if token:
+                # статья уже прочитана из БД идущим rebuild(): без этого её
+                # просмотры потерялись бы при переименовании
+                staged = STAGING_KEY.format(token=token, key=key)
+                pipe.zadd(staged, {slug: deltas[slug]}, xx=True, incr=True)
+    pipe.execute()
+    for article in Article.objects.filter(pk__in=missing).prefetch_related('tag'):
+        sync_article(article)
+
+
+def rebuild():
+    """
+    Строит лидерборды заново из БД. Пока идёт сборка, читатели видят старые
+    наборы, затем новые подменяют их одним MULTI с RENAME.
+    """
+    client = get_redis()
+    token = uuid.uuid4().hex
+    client.set(REBUILD_KEY, token, ex=REBUILD_TIMEOUT)
+    boards, memberships = set(), []
+    pipe = client.pipeline(transaction=False)
+    articles = Article.objects.only('slug', 'views_count', 'category_id').prefetch_related('tag')
+    for number, article in enumerate(articles.order_by('slug').iterator(chunk_size=REBUILD_CHUNK), 1):
+        keys = board_keys(article.category_id, [tag.slug for tag in article.tag.all()])
+        boards.update(keys)
+        membership = MEMBERSHIP_KEY.format(slug=article.pk)
+        memberships.append(membership)
+        for key in keys:
+            pipe.zadd(STAGING_KEY.format(token=token, key=key), {article.pk: article.views_count})
+        staged = STAGING_KEY.format(token=token, key=membership)
+        pipe.sadd(staged, *keys)
+        # сборку, прерванную падением воркера, Redis удалит сам
+        pipe.expire(staged, REBUILD_TIMEOUT)
+        # прочитанная пачка сразу попадает в Redis: дальше её просмотры считает increment()
+        if number % REBUILD_CHUNK == 0:
+            pipe.execute()
+    for key in boards:
+        pipe.expire(STAGING_KEY.format(token=token, key=key), REBUILD_TIMEOUT)
+    pipe.execute()
+
+    swap = client.pipeline()
+    for key in boards:
+        swap.rename(STAGING_KEY.format(token=token, key=key), key)
+        swap.persist(key)
+    swap.delete(REBUILD_KEY)
+    swap.execute()
+    for start in range(0, len(memberships), 1000):
+        for key in memberships[start:start + 1000]:
+            swap.rename(STAGING_KEY.format(token=token, key=key), key)
+            swap.persist(key)
+        swap.execute()
+
+    # лидерборды удалённых тегов и категорий, членства удалённых статей
+    live = boards.union(memberships)
+    stale = [key for key in client.scan_iter(f'{TOP_KEY}*') if key not in live]
+    for start in range(0, len(stale), 1000):
+        client.delete(*stale[start:start + 1000])
+
+
+def top_articles(limit, category=None, tag=None):
+    if category:
+        key = f'{TOP_KEY}:category:{category}'
+    elif tag:
+        key = f'{TOP_KEY}:tag:{tag}'
+    else:
+        key = TOP_KEY
+    try:
+        client = get_redis()
+        slugs = client.zrevrange(key, 0, limit - 1)
+        if slugs or client.exists(TOP_KEY):
+            articles = Article.objects.only(*TOP_FIELDS).in_bulk(slugs)
+            return [articles[slug] for slug in slugs if slug in articles]
+    except redis.RedisError:
+        pass
+    # Лидерборд ещё не построен: LIMIT по индексу (-views_count, slug)
+    queryset = Article.objects.only(*TOP_FIELDS).order_by('-views_count', 'slug')
+    if category:
+        queryset = queryset.filter(category_id=category)
+    if tag:
+        queryset = queryset.filter(tag=tag)
+    return list(queryset[:limit])
+
+
+def get_limit(value):
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return settings.TOP_ARTICLES_DEFAULT
+    return max(1, min(limit, settings.TOP_ARTICLES_MAX))
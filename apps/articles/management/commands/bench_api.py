@@ -0,0 +1,369 @@
+import json
+import platform
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import django
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.account.models import OneTimeCode
+from apps.articles.models import Article, Category, Tag
+from config.celery import app as celery_app
+
+User = get_user_model()
+
+
+class Scenario:
+    """
+    Один эндпоинт. prepare(i) вызывается вне замера и может вернуть
+    path/data для i-й итерации (например, свежего пользователя).
+    """
+
+    def __init__(self, name, method, path, data=None, auth=False, prepare=None, status=200):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.auth = auth
+        self.prepare = prepare
+        self.status = status
+
+    def request_kwargs(self, i):
+        kwargs = {'path': self.path, 'data': self.data}
+        if self.prepare:
+            kwargs.update(self.prepare(i))
+        return kwargs
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = (len(values) - 1) * percent / 100
+    lower = int(index)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (index - lower)
+
+
+def summarize(latencies, elapsed, queries=None, errors=0):
+    result = {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+    if queries is not None:
+        result['queries'] = max(queries) if queries else 0
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the wikipedia/ and account/ endpoints with the Django test client '
+        '(WSGI, or ASGI with --asgi) or a live server via --url, and writes p50/p95/p99, throughput and query counts '
+        'to a JSON baseline. Seed data first with seed_data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--only', nargs='*', help='Run only scenarios with these names')
+        parser.add_argument('--output', help='Write results to this JSON file')
+        parser.add_argument('--compare', help='Baseline JSON to compare against')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Allowed relative p95 growth before a scenario is reported as a regression'
+        )
+        parser.add_argument('--url', help='Base URL of a running server for the concurrent HTTP driver')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--no-cache', action='store_true', help='Measure with the response cache disabled')
+        parser.add_argument(
+            '--asgi', action='store_true',
+            help='Send requests through the ASGI handler (AsyncClient) instead of WSGI'
+        )
+
+    def handle(self, *args, **options):
+        if options['url']:
+            results = self.run_http(options)
+        else:
+            results = self.run_client(options)
+
+        report = {
+            'meta': {
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'driver': 'http' if options['url'] else ('asgi-client' if options['asgi'] else 'client'),
+                'iterations': options['iterations'],
+                'concurrency': options['concurrency'] if options['url'] else 1,
+                'cache': not options['no_cache'],
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'articles': Article.objects.count(),
+            },
+            'endpoints': results,
+        }
+        self.print_table(results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, indent=2, ensure_ascii=False)
+            self.stdout.write(f'Saved results to {options["output"]}')
+        if options['compare']:
+            self.compare(results, options['compare'], options['tolerance'])
+
+    def get_fixtures(self):
+        article = Article.objects.order_by('-views_count', 'slug').first()
+        category = Category.objects.order_by('-depth', 'slug').first()
+        tag = Tag.objects.first()
+        if not (article and category and tag):
+            raise CommandError('The database is empty, run "manage.py seed_data" first')
+        return article, category, tag
+
+    def scenarios(self, article, category, tag):
+        def new_user(i, **extra):
+            return User.objects.create_user(
+                f'bench-tmp-{i}-{time.monotonic_ns()}',
+                f'bench-tmp-{i}-{time.monotonic_ns()}@example.com',
+                'benchmark-password', **extra
+            )
+
+        def registration(i):
+            name = f'bench-reg-{i}-{time.monotonic_ns()}'
+            return {'data': {
+                'username': name, 'email': f'{name}@example.com',
+                'password': 'benchmark-password', 'password_confirm': 'benchmark-password'
+            }}
+
+        def activation(i):
+            code = OneTimeCode.objects.issue(new_user(i), OneTimeCode.ACTIVATION)
+            return {'path': f'/account/activate/{code}/'}
+
+        def restored_password(i):
+            user = new_user(i, is_active=True)
+            code = OneTimeCode.objects.issue(user, OneTimeCode.RESTORE)
+            return {'data': {
+                'email': user.email, 'code': code,
+                'new_password': 'new-benchmark-password',
+                'new_pass_confirm': 'new-benchmark-password'
+            }}
+
+        def delete_account(i):
+            return {'user': new_user(i, is_active=True)}
+
+        def refresh(i):
+            return {'data': {'refresh': str(RefreshToken.for_user(self.user))}}
+
+        detail = f'/wikipedia/article/{article.pk}/'
+        return [
+            Scenario('article-list', 'get', '/wikipedia/article/'),
+            Scenario('article-list-by-views', 'get', '/wikipedia/article/?ordering=-views_count&page_size=20'),
+            Scenario('article-detail', 'get', detail),
+            Scenario('async-article-list', 'get', '/wikipedia/async/article/'),
+            Scenario('async-article-detail', 'get', f'/wikipedia/async/article/{article.pk}/'),
+            Scenario('article-search', 'get', '/wikipedia/article/search/', {'q': article.title.split()[0]}),
+            Scenario('article-comments', 'get', f'{detail}comments/'),
+            Scenario('article-related', 'get', f'{detail}related/'),
+            Scenario('article-comment', 'post', f'{detail}comment/', {'text': 'benchmark'}, auth=True, status=201),
+            Scenario('article-filter-list', 'get', '/wikipedia/article_filter/'),
+            Scenario('homepage-list', 'get', '/wikipedia/homepage/?page_size=20'),
+            Scenario('async-homepage-list', 'get', '/wikipedia/async/homepage/?page_size=20'),
+            Scenario('homepage-top', 'get', '/wikipedia/homepage/test/'),
+            Scenario('homepage-top-category', 'get', '/wikipedia/homepage/test/', {'category': article.category_id}),
+            Scenario('homepage-trending', 'get', '/wikipedia/homepage/trending/'),
+            Scenario('homepage-trending-category', 'get', '/wikipedia/homepage/trending/', {'category': article.category_id}),
+            Scenario('comment-list', 'get', '/wikipedia/comment/', {'post': article.pk}),
+            Scenario('tags-list', 'get', '/wikipedia/tags/'),
+            Scenario('async-tags-list', 'get', '/wikipedia/async/tags/'),
+            Scenario('tags-detail', 'get', f'/wikipedia/tags/{tag.pk}/'),
+            Scenario('categories-list', 'get', '/wikipedia/categories/'),
+            Scenario('async-categories-list', 'get', '/wikipedia/async/categories/'),
+            Scenario('categories-tree', 'get', '/wikipedia/categories/tree/'),
+            Scenario('categories-breadcrumbs', 'get', f'/wikipedia/categories/{category.pk}/breadcrumbs/'),
+            Scenario('categories-articles', 'get', f'/wikipedia/categories/{category.pk}/articles/'),
+            Scenario('account-register', 'post', '/account/register/', prepare=registration, status=201),
+            Scenario('account-activate', 'get', None, prepare=activation),
+            Scenario('account-login', 'post', '/account/login/', {
+                'username': self.user.username, 'password': 'benchmark-password'
+            }),
+            Scenario('account-token-refresh', 'post', '/account/api/token/refresh/', prepare=refresh),
+            Scenario('account-change-password', 'post', '/account/change-password/', {
+                'old_password': 'benchmark-password',
+                'new_password': 'benchmark-password',
+                'new_pass_confirm': 'benchmark-password'
+            }, auth=True),
+            Scenario('account-restore-password', 'post', '/account/restore-password/', {
+                'email': self.user.email
+            }),
+            Scenario('account-set-restored-password', 'post', '/account/set-restored-password/', prepare=restored_password),
+            Scenario('account-delete', 'delete', '/account/delete-account/', prepare=delete_account, auth=True, status=204),
+        ]
+
+    def run_client(self, options):
+        results = {}
+        article, category, tag = self.get_fixtures()
+        overrides = {'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend'}
+        if options['no_cache']:
+            overrides['CACHES'] = {
+                'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+            }
+        # все записи откатываются, письма и задачи Celery не уходят наружу
+        always_eager = celery_app.conf.task_always_eager
+        try:
+            with override_settings(**overrides), transaction.atomic():
+                celery_app.conf.task_always_eager = True
+                self.user = User.objects.create_user(
+                    'bench-runner', 'bench-runner@example.com', 'benchmark-password', is_active=True
+                )
+                # под ASGI sync-вьюсеты идут через sync_to_async, async-вьюхи - напрямую
+                client = AsyncClient() if options['asgi'] else Client()
+                for scenario in self.scenarios(article, category, tag):
+                    if options['only'] and scenario.name not in options['only']:
+                        continue
+                    results[scenario.name] = self.run_scenario(client, scenario, options)
+                    self.stdout.write(f'{scenario.name}: done')
+                transaction.set_rollback(True)
+        finally:
+            celery_app.conf.task_always_eager = always_eager
+        return results
+
+    def request_args(self, scenario, i):
+        kwargs = scenario.request_kwargs(i)
+        user = kwargs.pop('user', self.user)
+        extra = {'headers': {}}
+        if scenario.auth:
+            extra['headers']['Authorization'] = f'Bearer {RefreshToken.for_user(user).access_token}'
+        if scenario.method != 'get':
+            extra['content_type'] = 'application/json'
+        return kwargs['path'], kwargs['data'], extra
+
+    def run_scenario(self, client, scenario, options):
+        if isinstance(client, AsyncClient):
+            return async_to_sync(self.arun_scenario)(client, scenario, options)
+        latencies, queries, errors = [], [], 0
+        total = options['warmup'] + options['iterations']
+        elapsed = 0.0
+        for i in range(total):
+            path, data, extra = self.request_args(scenario, i)
+            request = getattr(client, scenario.method)
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = request(path, data, **extra)
+                duration = time.perf_counter() - started
+            if i < options['warmup']:
+                continue
+            elapsed += duration
+            latencies.append(duration)
+            queries.append(len(context.captured_queries))
+            if response.status_code != scenario.status:
+                errors += 1
+        return summarize(latencies, elapsed, queries, errors)
+
+    async def arun_scenario(self, client, scenario, options):
+        # все итерации в одном event loop, как в ASGI-сервере; база и подсчёт
+        # запросов - в потоке sync_to_async, где живёт соединение транзакции
+        latencies, queries, errors = [], [], 0
+        total = options['warmup'] + options['iterations']
+        elapsed = 0.0
+        request = getattr(client, scenario.method)
+        for i in range(total):
+            path, data, extra = await sync_to_async(self.request_args)(scenario, i)
+            context = CaptureQueriesContext(connection)
+            await sync_to_async(context.__enter__)()
+            started = time.perf_counter()
+            response = await request(path, data, **extra)
+            duration = time.perf_counter() - started
+            await sync_to_async(context.__exit__)(None, None, None)
+            if i < options['warmup']:
+                continue
+            elapsed += duration
+            latencies.append(duration)
+            queries.append(await sync_to_async(lambda: len(context.captured_queries))())
+            if response.status_code != scenario.status:
+                errors += 1
+        return summarize(latencies, elapsed, queries, errors)
+
+    def run_http(self, options):
+        article, category, tag = self.get_fixtures()
+        base = options['url'].rstrip('/')
+        paths = {
+            'article-list': '/wikipedia/article/',
+            'article-detail': f'/wikipedia/article/{article.pk}/',
+            'async-article-list': '/wikipedia/async/article/',
+            'async-article-detail': f'/wikipedia/async/article/{article.pk}/',
+            'article-related': f'/wikipedia/article/{article.pk}/related/',
+            'article-filter-list': '/wikipedia/article_filter/',
+            'homepage-list': '/wikipedia/homepage/?page_size=20',
+            'async-homepage-list': '/wikipedia/async/homepage/?page_size=20',
+            'homepage-top': '/wikipedia/homepage/test/',
+            'homepage-trending': '/wikipedia/homepage/trending/',
+            'tags-list': '/wikipedia/tags/',
+            'async-tags-list': '/wikipedia/async/tags/',
+            'categories-list': '/wikipedia/categories/',
+            'async-categories-list': '/wikipedia/async/categories/',
+            'categories-tree': '/wikipedia/categories/tree/',
+            'categories-articles': f'/wikipedia/categories/{category.pk}/articles/',
+        }
+
+        def fetch(url):
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=30) as response:
+                    response.read()
+                    ok = response.status == 200
+            except OSError:
+                ok = False
+            return time.perf_counter() - started, ok
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            for name, path in paths.items():
+                if options['only'] and name not in options['only']:
+                    continue
+                url = base + path
+                list(pool.map(fetch, [url] * options['warmup']))
+                started = time.perf_counter()
+                samples = list(pool.map(fetch, [url] * options['iterations']))
+                elapsed = time.perf_counter() - started
+                results[name] = summarize(
+                    [duration for duration, _ in samples], elapsed,
+                    errors=sum(1 for _, ok in samples if not ok)
+                )
+                self.stdout.write(f'{name}: done')
+        return results
+
+    def print_table(self, results):
+        self.stdout.write(
+            f'{"endpoint":32} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"rps":>8} {"queries":>8} {"errors":>7}'
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:32} {result["p50_ms"]:9.2f} {result["p95_ms"]:9.2f} {result["p99_ms"]:9.2f} '
+                f'{result["rps"]:8.1f} {str(result.get("queries", "-")):>8} {result["errors"]:7}'
+            )
+
+    def compare(self, results, path, tolerance):
+        with open(path, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)['endpoints']
+        regressions = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if not before:
+                continue
+            if before['p95_ms'] and result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(f'{name}: p95 {before["p95_ms"]} -> {result["p95_ms"]} ms')
+            if 'queries' in before and result.get('queries', 0) > before['queries']:
+                regressions.append(f'{name}: queries {before["queries"]} -> {result["queries"]}')
+        if regressions:
+            raise CommandError('Regressions against baseline:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS(f'No regressions against {path}'))
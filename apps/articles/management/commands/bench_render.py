@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from apps.articles.models import Article
+from apps.articles.serializers import ArticleListSerializer, ArticleSerializer
+from apps.articles.views import ARTICLE_DETAIL_PLAN, ARTICLE_SUMMARY_FIELDS, prefetch_lookups
+from config import compression
+from config.renderers import FastJSONRenderer, orjson
+
+
+class Command(BaseCommand):
+    help = 'Measures JSON encode time and compressed size of article payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--article', help='Slug for the detail payload (default: most commented)')
+
+    def payloads(self, options):
+        request = Request(RequestFactory().get('/'))
+        context = {'request': request}
+        detail = Article.objects.select_related(*ARTICLE_DETAIL_PLAN['select_related'])
+        detail = detail.prefetch_related(*prefetch_lookups(ARTICLE_DETAIL_PLAN))
+        if options['article']:
+            article = detail.filter(pk=options['article']).first()
+        else:
+            article = detail.order_by('-comments_count').first()
+        if article is None:
+            raise CommandError('No articles, run seed_data first')
+        articles = Article.objects.only(*ARTICLE_SUMMARY_FIELDS)[:options['page_size']]
+        return {
+            'article-detail': ArticleSerializer(article, context=context).data,
+            'article-list': {
+                'next': None, 'previous': None,
+                'results': ArticleListSerializer(articles, many=True, context=context).data,
+            },
+        }
+
+    def measure(self, renderer, data, iterations):
+        renderer.render(data)
+        started = time.perf_counter()
+        for _ in range(iterations):
+            content = renderer.render(data)
+        return (time.perf_counter() - started) / iterations * 1000, content
+
+    def handle(self, *args, **options):
+        renderers = {'stdlib': JSONRenderer()}
+        if orjson is not None:
+            renderers['orjson'] = FastJSONRenderer()
+        else:
+            self.stderr.write('orjson is not installed, FastJSONRenderer falls back to stdlib')
+        encodings = ['gzip'] + (['br'] if compression.brotli is not None else [])
+
+        header = f'{"payload":16} {"renderer":9} {"encode ms":>10} {"bytes":>9}'
+        header += ''.join(f' {encoding + " bytes":>11} {encoding + " ms":>8}' for encoding in encodings)
+        self.stdout.write(header)
+        for name, data in self.payloads(options).items():
+            for renderer_name, renderer in renderers.items():
+                duration, content = self.measure(renderer, data, options['iterations'])
+                line = f'{name:16} {renderer_name:9} {duration:10.3f} {len(content):9}'
+                for encoding in encodings:
+                    started = time.perf_counter()
+                    compressed = compression.compress(content, encoding)
+                    elapsed = (time.perf_counter() - started) * 1000
+                    line += f' {len(compressed):11} {elapsed:8.3f}'
+                self.stdout.write(line)
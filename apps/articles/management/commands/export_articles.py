@@ -0,0 +1,75 @@
+import csv
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.articles.models import Article
+
+FIELDS = (
+    'slug', 'title', 'text', 'image', 'status', 'user', 'category', 'category_path',
+    'views_count', 'created_at', 'tags', 'carousel'
+)
+LIST_SEPARATOR = '|'
+
+
+def article_record(article):
+    return {
+        'slug': article.slug,
+        'title': article.title,
+        'text': article.text,
+        'image': article.image.name,
+        'status': article.status,
+        'user': article.user_id,
+        'category': article.category_id,
+        # материализованный путь: импорт восстанавливает родительские категории
+        'category_path': article.category.path,
+        'views_count': article.views_count,
+        'created_at': article.created_at.isoformat(),
+        'tags': [tag.slug for tag in article.tag.all()],
+        'carousel': [image.image.name for image in article.article_images.all()],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Streams articles with tags and carousel images to JSONL or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Output file, "-" for stdout')
+        parser.add_argument('--format', choices=['jsonl', 'csv'])
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        output = sys.stdout if path == '-' else open(path, 'w', encoding='utf-8', newline='')
+        queryset = (
+            Article.objects.order_by('pk')
+            .defer('search_vector', 'image_variants', 'thumbnail')
+            .select_related('category')
+            .prefetch_related('tag', 'article_images')
+        )
+        writer = None
+        if fmt == 'csv':
+            writer = csv.DictWriter(output, fieldnames=FIELDS)
+            writer.writeheader()
+        started = time.monotonic()
+        count = 0
+        try:
+            for article in queryset.iterator(chunk_size=options['batch_size']):
+                record = article_record(article)
+                if writer:
+                    record['tags'] = LIST_SEPARATOR.join(record['tags'])
+                    record['carousel'] = LIST_SEPARATOR.join(record['carousel'])
+                    writer.writerow(record)
+                else:
+                    output.write(json.dumps(record, ensure_ascii=False) + '\n')
+                count += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        elapsed = time.monotonic() - started
+        self.stderr.write(
+            f'Exported {count} articles in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} rows/s)'
+        )
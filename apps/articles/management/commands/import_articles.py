@@ -0,0 +1,268 @@
+import csv
+import json
+import sys
+import time
+import uuid
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils.dateparse import parse_datetime
+from slugify import slugify
+
+from apps.articles import cache, leaderboard, search, tags
+from apps.articles.images import needs_processing
+from apps.articles.models import Article, ArticleImage, Category, Tag
+from apps.articles.tasks import process_article_images
+
+from .export_articles import LIST_SEPARATOR
+
+User = get_user_model()
+
+
+class LookupCache:
+    """Слаги, которые уже есть в БД; недостающие создаются одной пачкой на чанк."""
+
+    def __init__(self, model, build):
+        self.model = model
+        # build(slugs) -> объекты для bulk_create
+        self.build = build
+        self.known = set()
+
+    def resolve(self, slugs):
+        missing = set(slugs) - self.known - {''}
+        if not missing:
+            return 0
+        existing = set(
+            self.model.objects.filter(pk__in=missing).values_list('pk', flat=True)
+        )
+        new = missing - existing
+        self.model.objects.bulk_create(self.build(sorted(new)), ignore_conflicts=True)
+        self.known |= missing
+        return len(new)
+
+
+def unique_titles(model, slugs):
+    """
+    Заголовки для созданных по слагу объектов: title короче слага (у Tag 30
+    символов против 35) и уникален, поэтому слаг обрезается, а занятый
+    заголовок получает суффикс -2, -3, ...
+    """
+    max_length = model._meta.get_field('title').max_length
+    candidates = {slug: slug[:max_length] for slug in slugs}
+    taken = set(
+        model.objects.filter(title__in=candidates.values()).values_list('title', flat=True)
+    )
+    titles = {}
+    for slug in slugs:
+        title, number = candidates[slug], 1
+        while title in taken or (number > 1 and model.objects.filter(title=title).exists()):
+            number += 1
+            suffix = f'-{number}'
+            title = slug[:max_length - len(suffix)] + suffix
+        taken.add(title)
+        titles[slug] = title
+    return titles
+
+
+def read_records(stream, fmt):
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            row['tags'] = [t for t in row.get('tags', '').split(LIST_SEPARATOR) if t]
+            row['carousel'] = [c for c in row.get('carousel', '').split(LIST_SEPARATOR) if c]
+            yield row
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = 'Streams articles from JSONL or CSV (see export_articles) with bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Input file, "-" for stdin')
+        parser.add_argument('--format', choices=['jsonl', 'csv'])
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--default-user', help='Author for records whose user does not exist')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        default_user = options['default_user']
+        if default_user and not User.objects.filter(pk=default_user).exists():
+            raise CommandError(f'User "{default_user}" does not exist')
+
+        self.categories = LookupCache(Category, self.build_categories)
+        self.tags = LookupCache(Tag, lambda slugs: [
+            Tag(slug=slug, title=title) for slug, title in unique_titles(Tag, slugs).items()
+        ])
+        # слаг категории -> слаг родителя из category_path записей
+        self.category_parents = {}
+        self.users = set()
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+
+        started = time.monotonic()
+        imported = skipped = 0
+        try:
+            for chunk in chunked(read_records(stream, fmt), options['batch_size']):
+                created, rejected = self.import_chunk(chunk, default_user)
+                imported += created
+                skipped += rejected
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'{imported} imported, {skipped} skipped, '
+                    f'{imported / max(elapsed, 1e-9):.0f} rows/s'
+                )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        tags.recount()
+        try:
+            leaderboard.rebuild()
+        except Exception as exc:
+            self.stderr.write(f'Leaderboards were not rebuilt: {exc}')
+        cache.bump('articles', 'tags', 'categories')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} articles in {elapsed:.1f}s '
+            f'({imported / max(elapsed, 1e-9):.0f} rows/s), skipped {skipped}'
+        ))
+
+    def resolve_users(self, usernames):
+        missing = set(usernames) - self.users
+        if missing:
+            self.users |= set(User.objects.filter(pk__in=missing).values_list('pk', flat=True))
+
+    def build_categories(self, slugs):
+        # родители создаются раньше детей: path и depth считаются от пути родителя
+        titles = unique_titles(Category, slugs)
+        pending = {slug: self.category_parents.get(slug) for slug in slugs}
+        paths = {
+            slug: (path, depth) for slug, path, depth in Category.objects.filter(
+                pk__in={parent for parent in pending.values() if parent}
+            ).values_list('slug', 'path', 'depth')
+        }
+        categories = []
+        while pending:
+            ready = [
+                slug for slug, parent in pending.items() if not parent or parent in paths
+            ] or list(pending)
+            for slug in ready:
+                parent = pending.pop(slug)
+                if parent in paths:
+                    parent_path, parent_depth = paths[parent]
+                    path, depth = f'{parent_path}{slug}/', parent_depth + 1
+                else:
+                    parent, path, depth = None, f'{slug}/', 0
+                paths[slug] = (path, depth)
+                categories.append(Category(
+                    slug=slug, title=titles[slug], parent_category_id=parent, path=path, depth=depth
+                ))
+        return categories
+
+    def category_slugs(self, records):
+        # категория статьи и её предки из category_path вида "science/physics/"
+        for record in records:
+            ancestors = (record.get('category_path') or '').strip('/').split('/')
+            if ancestors[-1] != record['category']:
+                ancestors = [record['category']]
+            for parent, slug in zip([None] + ancestors, ancestors):
+                self.category_parents.setdefault(slug, parent)
+                yield slug
+
+    def restore_created_at(self, articles, created_at):
+        # auto_now_add перетирает created_at при bulk_create, возвращаем его отдельным UPDATE
+        dates = [(article.slug, created_at[article.slug]) for article in articles if article.slug in created_at]
+        if dates:
+            Article.objects.filter(pk__in=[slug for slug, _ in dates]).update(created_at=Case(
+                *[When(pk=slug, then=Value(date)) for slug, date in dates],
+                output_field=DateTimeField()
+            ))
+
+    def import_chunk(self, records, default_user):
+        self.resolve_users(record.get('user') for record in records)
+        articles, tag_links, images, created_at, rejected = [], [], [], {}, 0
+        accepted = []
+        for record in records:
+            user = record.get('user')
+            if user not in self.users:
+                if not default_user:
+                    rejected += 1
+                    continue
+                user = default_user
+            slug = record.get('slug') or f'{slugify(record["title"])}-{uuid.uuid4().hex[:8]}'
+            if record.get('created_at'):
+                try:
+                    date = parse_datetime(record['created_at'])
+                except ValueError:
+                    date = None
+                if date is None:
+                    # иначе restore_created_at запишет NULL и уронит весь чанк
+                    self.stderr.write(f'Skipped "{slug}": invalid created_at {record["created_at"]!r}')
+                    rejected += 1
+                    continue
+                created_at[slug] = date
+            accepted.append(record)
+            articles.append(Article(
+                slug=slug,
+                title=record['title'],
+                text=record.get('text', ''),
+                image=record.get('image', ''),
+                status=record.get('status') or 'draft',
+                user_id=user,
+                category_id=record['category'],
+                views_count=int(record.get('views_count') or 0),
+            ))
+            tag_links += [(slug, tag) for tag in record.get('tags', [])]
+            images += [(slug, image) for image in record.get('carousel', [])]
+
+        with transaction.atomic():
+            self.categories.resolve(self.category_slugs(accepted))
+            self.tags.resolve(tag for _, tag in tag_links)
+            existing = set(
+                Article.objects.filter(pk__in=[a.slug for a in articles]).values_list('pk', flat=True)
+            )
+            new = [article for article in articles if article.slug not in existing]
+            new_slugs = {article.slug for article in new}
+            Article.objects.bulk_create(new)
+            self.restore_created_at(new, created_at)
+            Article.tag.through.objects.bulk_create(
+                [
+                    Article.tag.through(article_id=slug, tag_id=tag)
+                    for slug, tag in tag_links if slug in new_slugs
+                ],
+                ignore_conflicts=True
+            )
+            ArticleImage.objects.bulk_create(
+                ArticleImage(article_id=slug, image=image)
+                for slug, image in images if slug in new_slugs
+            )
+            search.reindex_articles(new_slugs)
+            self.schedule_image_processing(new, {slug for slug, _ in images if slug in new_slugs})
+        return len(new), rejected + len(articles) - len(new)
+
+    def schedule_image_processing(self, articles, with_carousel):
+        # bulk_create не шлёт post_save, превью ставятся в очередь здесь
+        slugs = with_carousel | {
+            article.slug for article in articles
+            if needs_processing(article.image, article.image_variants)
+        }
+
+        def enqueue():
+            for slug in sorted(slugs):
+                process_article_images.delay(slug)
+
+        transaction.on_commit(enqueue)
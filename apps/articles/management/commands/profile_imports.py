@@ -0,0 +1,98 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+# что выполняет процесс при старте
+TARGETS = {
+    'setup': 'import django; django.setup()',
+    'wsgi': 'import config.wsgi',
+    'asgi': 'import config.asgi',
+    'urls': (
+        'import django; django.setup(); '
+        'from django.urls import get_resolver; get_resolver().url_patterns'
+    ),
+    'celery': (
+        'from config.celery import app; import django; django.setup(); '
+        'app.loader.import_default_modules()'
+    ),
+}
+
+LINE_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def parse_importtime(output):
+    modules = []
+    for line in output.splitlines():
+        match = LINE_RE.match(line)
+        if match:
+            modules.append({
+                'module': match[4],
+                'self_ms': int(match[1]) / 1000,
+                'cumulative_ms': int(match[2]) / 1000,
+                'depth': len(match[3]) // 2,
+            })
+    return modules
+
+
+class Command(BaseCommand):
+    help = 'Reports per-module import time of a cold process start (python -X importtime)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=sorted(TARGETS), default='setup')
+        parser.add_argument('--sort', choices=['cumulative', 'self'], default='cumulative')
+        parser.add_argument('--limit', type=int, default=25)
+        parser.add_argument('--prefix', help='Only modules starting with this prefix, e.g. apps.')
+        parser.add_argument('--top-level', action='store_true', help='Only modules imported directly by the target')
+        parser.add_argument('--light', action='store_true', help='Start with DJANGO_LIGHT_STARTUP=1')
+        parser.add_argument('--output', help='Save the full report as JSON')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+        if options['light'] or options['target'] == 'celery':
+            env['DJANGO_LIGHT_STARTUP'] = '1'
+
+        started = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', TARGETS[options['target']]],
+            env=env, capture_output=True, text=True
+        )
+        elapsed = (time.perf_counter() - started) * 1000
+        modules = parse_importtime(process.stderr)
+        if process.returncode != 0:
+            errors = [line for line in process.stderr.splitlines() if not LINE_RE.match(line)]
+            raise CommandError('\n'.join(errors[-20:]))
+
+        total = sum(module['self_ms'] for module in modules)
+        selected = modules
+        if options['prefix']:
+            selected = [m for m in selected if m['module'].startswith(options['prefix'])]
+        if options['top_level']:
+            selected = [m for m in selected if m['depth'] == 0]
+        key = f'{options["sort"]}_ms'
+        selected = sorted(selected, key=lambda module: module[key], reverse=True)
+
+        self.stdout.write(
+            f'{options["target"]}: {elapsed:.0f} ms wall, {total:.0f} ms in imports, '
+            f'{len(modules)} modules'
+        )
+        self.stdout.write(f'{"module":60} {"self ms":>9} {"cumul. ms":>10}')
+        for module in selected[:options['limit']]:
+            self.stdout.write(
+                f'{module["module"]:60} {module["self_ms"]:9.1f} {module["cumulative_ms"]:10.1f}'
+            )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump({
+                    'target': options['target'],
+                    'wall_ms': round(elapsed, 1),
+                    'imports_ms': round(total, 1),
+                    'modules': modules,
+                }, output, indent=2)
+            self.stdout.write(f'Saved report to {options["output"]}')
@@ -0,0 +1,131 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.articles import cache, leaderboard, search
+from apps.articles import tags as tag_index
+from apps.articles.models import Article, ArticleImage, Category, Comment, Tag
+
+User = get_user_model()
+
+WORDS = (
+    'история наука город река война искусство музыка планета язык культура '
+    'science history river music planet language culture energy empire theory'
+).split()
+
+
+class Command(BaseCommand):
+    help = 'Seeds a reproducible synthetic dataset for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--categories', type=int, default=30)
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--articles', type=int, default=5000)
+        parser.add_argument('--comments', type=int, default=5, help='Comments per article')
+        parser.add_argument('--images', type=int, default=3, help='Carousel images per article')
+        parser.add_argument('--tags-per-article', type=int, default=3)
+        parser.add_argument('--words', type=int, default=300, help='Words in article text')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='bench')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def text(self, words):
+        return ' '.join(self.random.choice(WORDS) for _ in range(words))
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        prefix = options['prefix']
+        batch_size = options['batch_size']
+        started = time.monotonic()
+
+        with transaction.atomic():
+            password = make_password('benchmark-password')
+            users = [
+                User(
+                    username=f'{prefix}-user-{i}', email=f'{prefix}-user-{i}@example.com',
+                    password=password, is_active=True
+                )
+                for i in range(options['users'])
+            ]
+            User.objects.bulk_create(users, batch_size=batch_size, ignore_conflicts=True)
+
+            categories = []
+            for i in range(options['categories']):
+                slug = f'{prefix}-category-{i}'
+                parent = self.random.choice(categories) if categories and self.random.random() < 0.6 else None
+                categories.append(Category(
+                    slug=slug, title=slug,
+                    parent_category=parent,
+                    path=f'{parent.path if parent else ""}{slug}/',
+                    depth=parent.depth + 1 if parent else 0
+                ))
+            Category.objects.bulk_create(categories, batch_size=batch_size, ignore_conflicts=True)
+
+            tags = [
+                Tag(slug=f'{prefix}-tag-{i}', title=f'{prefix}-tag-{i}')
+                for i in range(options['tags'])
+            ]
+            Tag.objects.bulk_create(tags, batch_size=batch_size, ignore_conflicts=True)
+
+            for start in range(0, options['articles'], batch_size):
+                self.seed_articles(
+                    range(start, min(start + batch_size, options['articles'])),
+                    users, categories, tags, options
+                )
+                self.stdout.write(f'{min(start + batch_size, options["articles"])} articles')
+
+        tag_index.recount()
+        try:
+            leaderboard.rebuild()
+        except Exception as exc:
+            self.stderr.write(f'Leaderboards were not rebuilt: {exc}')
+        cache.bump('articles', 'tags', 'categories')
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {options["articles"]} articles in {time.monotonic() - started:.1f}s'
+        ))
+
+    def seed_articles(self, numbers, users, categories, tags, options):
+        prefix = options['prefix']
+        articles = [
+            Article(
+                slug=f'{prefix}-article-{i}',
+                title=f'{self.text(3)} {i}',
+                text=self.text(options['words']),
+                image=f'article_images/{prefix}-{i}.jpg',
+                status=self.random.choice(Article.STATUS_CHOICES)[0],
+                user=self.random.choice(users),
+                category=self.random.choice(categories),
+                views_count=int(self.random.paretovariate(1.2)),
+                comments_count=options['comments'],
+            )
+            for i in numbers
+        ]
+        # повторный запуск с тем же префиксом не дублирует комментарии и картинки
+        # уже существующих статей: дочерние строки создаются только для новых
+        existing = set(
+            Article.objects.filter(pk__in=[article.slug for article in articles]).values_list('pk', flat=True)
+        )
+        articles = [article for article in articles if article.slug not in existing]
+        Article.objects.bulk_create(articles, ignore_conflicts=True)
+        slugs = [article.slug for article in articles]
+        links, images, comments = [], [], []
+        for article in articles:
+            for tag in self.random.sample(tags, min(options['tags_per_article'], len(tags))):
+                links.append(Article.tag.through(article_id=article.slug, tag_id=tag.slug))
+            images += [
+                ArticleImage(article_id=article.slug, image=f'article_images/carousel/{article.slug}-{j}.jpg')
+                for j in range(options['images'])
+            ]
+            comments += [
+                Comment(user=self.random.choice(users), post_id=article.slug, text=self.text(20))
+                for _ in range(options['comments'])
+            ]
+        Article.tag.through.objects.bulk_create(links, ignore_conflicts=True)
+        ArticleImage.objects.bulk_create(images)
+        Comment.objects.bulk_create(comments)
+        search.reindex_articles(slugs)
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:32
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+BACKFILL_SQL = """
+UPDATE articles_article a SET search_vector =
+    setweight(to_tsvector(%(config)s::regconfig, a.title), 'A')
+    || setweight(to_tsvector(%(config)s::regconfig, coalesce((
+        SELECT string_agg(t.title, ' ')
+        FROM articles_tag t
+        JOIN articles_article_tag at ON at.tag_id = t.slug
+        WHERE at.article_id = a.slug
+    ), '')), 'B')
+    || setweight(to_tsvector(%(config)s::regconfig, coalesce((
+        SELECT c.title FROM articles_category c WHERE c.slug = a.category_id
+    ), '')), 'B')
+    || setweight(to_tsvector(%(config)s::regconfig, a.text), 'C')
+    || setweight(to_tsvector(%(config)s::regconfig, a.user_id), 'D')
+"""
+
+
+def create_search_index(apps, schema_editor):
+    # GIN-индекс и заполнение вектора есть только в PostgreSQL,
+    # на SQLite поиск работает через индекс в памяти (apps.articles.search)
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX article_search_vector_idx ON articles_article USING gin (search_vector)'
+    )
+    schema_editor.execute(BACKFILL_SQL, {'config': settings.SEARCH_CONFIG})
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS article_search_vector_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0003_article_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:34
+
+from django.db import migrations, models
+
+
+def build_paths(apps, schema_editor):
+    Category = apps.get_model('articles', 'Category')
+    categories = {c.pk: c for c in Category.objects.all()}
+    children = {}
+    for category in categories.values():
+        children.setdefault(category.parent_category_id, []).append(category)
+    stack = [(category, '', -1) for category in children.get(None, [])]
+    while stack:
+        category, parent_path, parent_depth = stack.pop()
+        category.path = f'{parent_path}{category.pk}/'
+        category.depth = parent_depth + 1
+        stack += [(child, category.path, category.depth) for child in children.get(category.pk, [])]
+    Category.objects.bulk_update(categories.values(), ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0004_article_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=1000),
+        ),
+        migrations.RunPython(build_paths, migrations.RunPython.noop),
+    ]
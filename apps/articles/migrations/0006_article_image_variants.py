@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0005_category_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to='variants'),
+        ),
+        migrations.AddField(
+            model_name='articleimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to='variants'),
+        ),
+        migrations.AddField(
+            model_name='articleimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:53
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_articles(apps, schema_editor):
+    Article = apps.get_model('articles', 'Article')
+    Tag = apps.get_model('articles', 'Tag')
+    counts = (
+        Article.tag.through.objects.filter(tag_id=OuterRef('pk'))
+        .order_by().values('tag_id').annotate(total=Count('pk')).values('total')
+    )
+    Tag.objects.update(articles_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0007_article_comments_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='articles_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_articles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:06
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('articles', '0008_tag_articles_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=250)),
+                ('kind', models.CharField(choices=[('pending', 'Pending'), ('snapshot', 'Snapshot'), ('delta', 'Delta')], default='pending', max_length=8)),
+                ('base', models.PositiveIntegerField(blank=True, null=True)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='articles.article')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='article_revisions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('kind', 'pending')), fields=['article', 'number'], name='revision_pending_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='articlerevision',
+            constraint=models.UniqueConstraint(fields=('article', 'number'), name='revision_article_number_uniq'),
+        ),
+    ]
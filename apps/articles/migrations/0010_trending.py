@@ -0,0 +1,52 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articles', '0009_article_revisions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleViewBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('hour', models.PositiveIntegerField()),
+                ('views', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['-trending_score', 'slug'], name='article_trending_slug_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['category', '-trending_score', 'slug'], name='article_cat_trending_idx'),
+        ),
+        migrations.AddField(
+            model_name='articleviewbucket',
+            name='article',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='view_buckets', to='articles.article'),
+        ),
+        migrations.AddConstraint(
+            model_name='articleviewbucket',
+            constraint=models.UniqueConstraint(fields=('article', 'slot'), name='view_bucket_article_slot_uniq'),
+        ),
+        migrations.CreateModel(
+            name='ArticleViewFlush',
+            fields=[
+                ('flush_id', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('applied_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -1,13 +1,11 @@
-from distutils.command.upload import upload
-from numbers import Real
-from warnings import filters
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from slugify import slugify
 from .utils import get_time
-import django_filters
-from rest_framework import filters
 
 User = get_user_model()
 
@@ -22,14 +20,45 @@ class Category(models.Model):
         blank=True,
         null=True
          )
+    # материализованный путь вида "science/physics/", поддерево - path__startswith
+    path = models.CharField(max_length=1000, db_index=True, editable=False, blank=True)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
     
     def __str__(self) -> str:
         return self.title
 
+    def build_path(self):
+        if not self.parent_category_id:
+            return f'{self.slug}/', 0
+        parent_path, parent_depth = Category.objects.values_list(
+            'path', 'depth'
+        ).get(pk=self.parent_category_id)
+        if self.path and parent_path.startswith(self.path):
+            raise ValueError('Category cannot be moved under its own descendant')
+        return f'{parent_path}{self.slug}/', parent_depth + 1
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
-        super().save(*args, **kwargs)
+        old_path, old_depth = self.path, self.depth
+        self.path, self.depth = self.build_path()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if old_path and old_path != self.path:
+                Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                    path=Concat(Value(self.path), Substr('path', len(old_path) + 1)),
+                    depth=F('depth') + (self.depth - old_depth)
+                )
+
+    def get_descendants(self, include_self=False):
+        queryset = Category.objects.filter(path__startswith=self.path)
+        if not include_self:
+            queryset = queryset.exclude(pk=self.pk)
+        return queryset
+
+    def get_ancestors(self):
+        slugs = self.path.rstrip('/').split('/')[:-1]
+        return Category.objects.filter(pk__in=slugs).order_by('depth')
 
     class Meta:
         verbose_name = 'Категория'
@@ -53,6 +82,8 @@ class Article(models.Model):
     slug = models.SlugField(max_length=300, primary_key=True, blank=True)
     text = models.TextField()
     image = models.ImageField(upload_to='article_images')
+    thumbnail = models.ImageField(upload_to='variants', blank=True, editable=False)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     status = models.CharField(
         max_length=12, 
         choices=STATUS_CHOICES, 
@@ -69,6 +100,14 @@ class Article(models.Model):
         on_delete=models.CASCADE, 
         related_name='articles')
     views_count = models.IntegerField(default=0)
+    # поддерживается сигналами Comment одним UPDATE ... SET comments_count = comments_count ± 1
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    # log суммы просмотров с весом exp(λ(t - TRENDING_EPOCH)), 0 - просмотров не было (см. trending)
+    trending_score = models.FloatField(default=0, editable=False)
+    # когда related.refresh последний раз считал похожие статьи; статья с updated_at
+    # позже (или без отметки) будет пересчитана
+    related_built_at = models.DateTimeField(null=True, blank=True, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self) -> str:
         return self.title
@@ -80,13 +119,156 @@ class Article(models.Model):
 
     class Meta:
         ordering = ('created_at', )
+        indexes = [
+            models.Index(fields=['created_at', 'slug'], name='article_created_slug_idx'),
+            models.Index(fields=['-views_count', 'slug'], name='article_views_slug_idx'),
+            models.Index(fields=['-trending_score', 'slug'], name='article_trending_slug_idx'),
+            models.Index(
+                fields=['category', '-trending_score', 'slug'], name='article_cat_trending_idx'
+            ),
+        ]
 
     def get_absolute_url(self):
         return reverse("article-detail", kwargs={"pk":self.pk})
 
 
+class ArticleViewBucket(models.Model):
+    """
+    Просмотры статьи за час. Кольцевой буфер: у статьи не больше
+    TRENDING_RING_HOURS строк, slot = hour % TRENDING_RING_HOURS, и час,
+    пришедший на занятый слот, затирает старый.
+    """
+    article = models.ForeignKey(
+        to=Article,
+        on_delete=models.CASCADE,
+        related_name='view_buckets'
+    )
+    slot = models.PositiveSmallIntegerField()
+    # часы от начала эпохи Unix
+    hour = models.PositiveIntegerField()
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['article', 'slot'], name='view_bucket_article_slot_uniq'),
+        ]
+
+
+class ArticleViewFlush(models.Model):
+    """
+    Последний сброс просмотров из Redis, применённый к базе. Пишется в той же
+    транзакции, что и счётчики, поэтому повтор сброса после падения воркера
+    (хэш в Redis не успели удалить) ничего не прибавит второй раз.
+    """
+    flush_id = models.CharField(max_length=32, primary_key=True)
+    applied_at = models.DateTimeField(auto_now_add=True)
+
+
+class RelatedArticle(models.Model):
+    """Похожая статья: top-K соседей каждой статьи по score (см. related)."""
+    article = models.ForeignKey(
+        to=Article,
+        on_delete=models.CASCADE,
+        related_name='related_links'
+    )
+    related = models.ForeignKey(
+        to=Article,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['article', 'related'], name='related_article_pair_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['article', '-score'], name='related_article_score_idx'),
+        ]
+
+
+class ArticleTerms(models.Model):
+    """
+    Частоты термов статьи для похожих статей (см. related): refresh()
+    токенизирует только изменённые статьи, остальные берёт отсюда.
+    """
+    article = models.OneToOneField(
+        to=Article,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='terms'
+    )
+    # zlib: номера термов (int32), затем частоты (float64)
+    data = models.BinaryField()
+
+
+class RelatedVocabulary(models.Model):
+    """
+    Словарь термов похожих статей, одна строка: номер терма - позиция токена
+    в списке. rebuild() пишет его заново, refresh() дописывает новые токены.
+    """
+    # zlib(json список токенов)
+    tokens = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class ArticleRevision(models.Model):
+    """
+    Ревизия текста статьи. pending хранит полный текст, пока compact() не
+    заменит его дельтой; snapshot - полный текст, delta - разница с ревизией
+    base (см. revisions.base_number). data сжата zlib.
+    """
+    PENDING = 'pending'
+    SNAPSHOT = 'snapshot'
+    DELTA = 'delta'
+    KIND_CHOICES = (
+        (PENDING, 'Pending'),
+        (SNAPSHOT, 'Snapshot'),
+        (DELTA, 'Delta')
+    )
+
+    article = models.ForeignKey(
+        to=Article,
+        on_delete=models.CASCADE,
+        related_name='revisions'
+    )
+    number = models.PositiveIntegerField()
+    user = models.ForeignKey(
+        to=User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='article_revisions'
+    )
+    title = models.CharField(max_length=250)
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES, default=PENDING)
+    # номер ревизии, от которой посчитана дельта; хранится, потому что интервал
+    # снимков может поменяться после compact()
+    base = models.PositiveIntegerField(null=True, blank=True)
+    data = models.BinaryField()
+    # длина текста ревизии в символах
+    size = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.article_id} r{self.number}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['article', 'number'], name='revision_article_number_uniq'),
+        ]
+        indexes = [
+            models.Index(
+                fields=['article', 'number'], name='revision_pending_idx',
+                condition=models.Q(kind='pending')
+            ),
+        ]
+
+
 class ArticleImage(models.Model):
     image = models.ImageField(upload_to='article_images/carousel')
+    thumbnail = models.ImageField(upload_to='variants', blank=True, editable=False)
+    variants = models.JSONField(default=dict, blank=True, editable=False)
     article = models.ForeignKey(
         to=Article,
         on_delete=models.CASCADE,
@@ -96,6 +278,8 @@ class ArticleImage(models.Model):
 class Tag(models.Model):
     title = models.CharField(max_length=30, unique=True)
     slug = models.SlugField(primary_key=True, blank=True, max_length=35)
+    # пересчитывается сигналами при изменении Article.tag (см. tags.recount)
+    articles_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.title
@@ -123,3 +307,8 @@ class Comment(models.Model):
     def __str__(self):
         return f'Comment from {self.user.username} to {self.article.title}'
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_idx'),
+        ]
+
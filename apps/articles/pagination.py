@@ -0,0 +1,259 @@
+import asyncio
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная пагинация по составному ключу: страница выбирается условием
+    WHERE (a, b) > (x, y) по индексу, а не OFFSET, поэтому глубина не важна.
+    Последнее поле каждого ключа должно быть уникальным.
+    """
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    orderings = {}
+    default_ordering = None
+    invalid_cursor_message = 'Invalid cursor'
+    # ?limit=/?offset= без курсора - прежний ответ LimitOffsetPagination (count, next,
+    # previous) для клиентов, написанных до перехода списков на курсоры
+    legacy_limit_offset = False
+    legacy = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.legacy = self.get_legacy_paginator(request)
+        if self.legacy is not None:
+            return self.legacy.paginate_queryset(
+                self.get_legacy_queryset(queryset, request), request, view
+            )
+        return self.set_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # то же для async-вьюх: страница читается через async ORM
+        self.legacy = self.get_legacy_paginator(request)
+        if self.legacy is not None:
+            return await self.apaginate_legacy(queryset, request)
+        return self.set_page([obj async for obj in self.get_page_queryset(queryset, request)])
+
+    def get_legacy_paginator(self, request):
+        params = request.query_params
+        if not self.legacy_limit_offset or self.cursor_query_param in params:
+            return None
+        legacy = LimitOffsetPagination()
+        if legacy.limit_query_param in params or legacy.offset_query_param in params:
+            return legacy
+        return None
+
+    def get_legacy_queryset(self, queryset, request):
+        # порядок тот же, что у курсоров: OFFSET идёт по тому же индексу
+        return queryset.order_by(*self.get_ordering(request))
+
+    async def apaginate_legacy(self, queryset, request):
+        legacy = self.legacy
+        queryset = self.get_legacy_queryset(queryset, request)
+        legacy.request = request
+        legacy.limit = legacy.get_limit(request)
+        legacy.offset = legacy.get_offset(request)
+        legacy.count, page = await asyncio.gather(
+            queryset.acount(),
+            self.alist(queryset[legacy.offset:legacy.offset + legacy.limit])
+        )
+        return page
+
+    @staticmethod
+    async def alist(queryset):
+        return [obj async for obj in queryset]
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request)
+        values, self.reverse = self.decode_cursor(request, queryset.model)
+        self.has_cursor = values is not None
+
+        fields = self.ordering
+        if self.reverse:
+            fields = [self.invert(field) for field in fields]
+        queryset = queryset.order_by(*fields)
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(fields, values))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        self.has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(self.ordering_query_param)
+        if ordering not in self.orderings:
+            ordering = self.default_ordering
+        self.ordering_key = ordering
+        return self.orderings[ordering]
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    def keyset_filter(self, fields, values):
+        # (a > x) OR (a = x AND b > y) OR ... с учётом направления каждого поля
+        condition = Q()
+        equal = {}
+        for field, value in zip(fields, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            values, reverse = cursor['v'], bool(cursor['r'])
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return [self.convert(model, field, value) for field, value in zip(self.ordering, values)], reverse
+
+    def convert(self, model, field, value):
+        # курсор приходит от клиента: значение должно быть скаляром, который
+        # поле примет, иначе ошибка всплывёт 500 при построении запроса
+        if value is None or isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise NotFound(self.invalid_cursor_message)
+        model_field = model._meta.get_field(field.lstrip('-'))
+        try:
+            value = model_field.to_python(value)
+            if isinstance(value, int):
+                # границы целого для базы
+                model_field.run_validators(value)
+        except (ValidationError, TypeError, ValueError, OverflowError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return value
+
+    def encode_cursor(self, instance, reverse):
+        values = []
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip('-'))
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        cursor = json.dumps({'v': values, 'r': int(reverse)}, separators=(',', ':'))
+        encoded = urlsafe_b64encode(cursor.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_link_after(self, url, instance):
+        # ссылка на страницу после instance в порядке по умолчанию, без запроса к базе
+        self.base_url = url
+        self.ordering = self.orderings[self.default_ordering]
+        return self.encode_cursor(instance, reverse=False)
+
+    def get_next_link(self):
+        if not self.page:
+            return None
+        if self.has_more or self.reverse:
+            return self.encode_cursor(self.page[-1], reverse=False)
+        return None
+
+    def get_previous_link(self):
+        if not self.page:
+            if self.has_cursor:
+                return remove_query_param(self.base_url, self.cursor_query_param)
+            return None
+        if (self.reverse and self.has_more) or (not self.reverse and self.has_cursor):
+            return self.encode_cursor(self.page[0], reverse=True)
+        return None
+
+    def get_paginated_data(self, data):
+        if self.legacy is not None:
+            return self.legacy.get_paginated_response(data).data
+        return OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ])
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class ArticleCursorPagination(KeysetPagination):
+    orderings = {
+        'created_at': ('created_at', 'slug'),
+        '-created_at': ('-created_at', '-slug'),
+        # обратный проход по индексу (-views_count, slug)
+        'views_count': ('views_count', '-slug'),
+        '-views_count': ('-views_count', 'slug'),
+    }
+    default_ordering = 'created_at'
+    legacy_limit_offset = True
+
+
+class CommentCursorPagination(KeysetPagination):
+    orderings = {
+        'created_at': ('created_at', 'id'),
+        '-created_at': ('-created_at', '-id'),
+    }
+    default_ordering = 'created_at'
+    legacy_limit_offset = True
+
+
+class RevisionCursorPagination(KeysetPagination):
+    orderings = {
+        '-number': ('-number', ),
+        'number': ('number', ),
+    }
+    default_ordering = '-number'
@@ -0,0 +1,313 @@
+"""
+Похожие статьи. score = RELATED_TEXT_WEIGHT * косинус TF-IDF по title/text
++ остальное * Жаккар по тегам. Векторы статей хранятся разреженно (CSR по
+статьям и CSC по термам); произведения пачки статей со всеми считаются
+через постинги термов одним np.bincount, пачка ограничена числом ячеек
+B x N и числом пар из постингов. В RelatedArticle лежат top-K соседей.
+
+refresh() пересчитывает изменённые статьи (updated_at позже
+related_built_at) и тех, чей top-K они меняют; rebuild() - все статьи.
+Частоты термов каждой статьи хранятся в ArticleTerms, словарь - в
+RelatedVocabulary: refresh() токенизирует только изменённые статьи, а DF,
+IDF и веса всех строк пересчитывает по сохранённым частотам в numpy, так что
+результат совпадает с полным пересчётом.
+"""
+import json
+import zlib
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from . import cache
+from .models import Article, ArticleTerms, RelatedArticle, RelatedVocabulary
+from .search import tokenize
+
+MIN_TOKEN_LENGTH = 3
+
+
+def ranges(starts, lengths):
+    # конкатенация arange(start, start + length) для всех пар
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return offsets + np.arange(total)
+
+
+def encode_counts(terms, counts):
+    return zlib.compress(np.asarray(terms, dtype=np.int32).tobytes() + np.asarray(counts, dtype=np.float64).tobytes())
+
+
+def decode_counts(data):
+    raw = zlib.decompress(data)
+    size = len(raw) // 12
+    return (
+        np.frombuffer(raw, dtype=np.int32, count=size).astype(np.int64),
+        np.frombuffer(raw, dtype=np.float64, offset=size * 4)
+    )
+
+
+def count_terms(title, text, vocabulary):
+    """Частоты термов документа; новые токены дописываются в vocabulary."""
+    counts = Counter(tokenize(text))
+    for token in tokenize(title):
+        counts[token] += settings.RELATED_TITLE_WEIGHT
+    kept = [
+        (vocabulary.setdefault(token, len(vocabulary)), count)
+        for token, count in counts.items() if len(token) >= MIN_TOKEN_LENGTH
+    ]
+    return (
+        np.array([term for term, _ in kept], dtype=np.int64),
+        np.array([count for _, count in kept], dtype=np.float64)
+    )
+
+
+def load_vocabulary():
+    tokens = RelatedVocabulary.objects.values_list('tokens', flat=True).first()
+    if tokens is None:
+        return None
+    return {token: term for term, token in enumerate(json.loads(zlib.decompress(tokens)))}
+
+
+class SparseRows:
+    """Разреженная матрица статьи x термы с транспонированной копией для постингов."""
+
+    def __init__(self, lengths, indices, data, columns):
+        self.shape = (len(lengths), columns)
+        self.indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.data = np.asarray(data, dtype=np.float64)
+        owners = np.repeat(np.arange(len(lengths)), np.diff(self.indptr))
+        order = np.argsort(self.indices, kind='stable')
+        self.column_rows = owners[order]
+        self.column_data = self.data[order]
+        self.colptr = np.concatenate(
+            [[0], np.cumsum(np.bincount(self.indices, minlength=columns))]
+        ).astype(np.int64)
+
+    def row_sizes(self):
+        return np.diff(self.indptr)
+
+    def postings_cost(self):
+        # сколько пар (строка, статья) даст каждая строка в products()
+        df = np.diff(self.colptr)
+        costs = np.zeros(self.shape[0], dtype=np.int64)
+        sizes = self.row_sizes()
+        nonempty = sizes > 0
+        if self.indices.size:
+            costs[nonempty] = np.add.reduceat(df[self.indices], self.indptr[:-1][nonempty])
+        return costs
+
+    def products(self, rows):
+        """Скалярные произведения строк rows со всеми строками: массив len(rows) x N."""
+        n = self.shape[0]
+        entries = ranges(self.indptr[rows], self.indptr[rows + 1] - self.indptr[rows])
+        owners = np.repeat(np.arange(len(rows)), self.indptr[rows + 1] - self.indptr[rows])
+        terms = self.indices[entries]
+        starts, lengths = self.colptr[terms], self.colptr[terms + 1] - self.colptr[terms]
+        postings = ranges(starts, lengths)
+        cells = np.repeat(owners, lengths) * n + self.column_rows[postings]
+        weights = np.repeat(self.data[entries], lengths) * self.column_data[postings]
+        return np.bincount(cells, weights=weights, minlength=len(rows) * n).reshape(len(rows), n)
+
+
+class Corpus:
+    def __init__(self, slugs, counts, tags, columns):
+        self.slugs = slugs
+        self.positions = {slug: i for i, slug in enumerate(slugs)}
+        self.texts = self.weigh([counts[slug] for slug in slugs], columns)
+        tag_ids = {}
+        rows = [sorted({tag_ids.setdefault(tag, len(tag_ids)) for tag in tags.get(slug, ())}) for slug in slugs]
+        self.tags = SparseRows(
+            [len(row) for row in rows], [i for row in rows for i in row],
+            [1.0] * sum(map(len, rows)), len(tag_ids)
+        )
+        self.tag_counts = self.tags.row_sizes()
+
+    @classmethod
+    def load(cls, dirty=None):
+        """
+        dirty=None - токенизирует все статьи со свежим словарём; иначе берёт
+        частоты из ArticleTerms и токенизирует только dirty и статьи без частот.
+        Пересчитанные частоты сохраняет save_terms().
+        """
+        vocabulary = {} if dirty is None else load_vocabulary()
+        counts, recounted = {}, {}
+        if dirty is None:
+            slugs = []
+            documents = Article.objects.values_list('slug', 'title', 'text').order_by('slug')
+            for slug, title, text in documents.iterator(chunk_size=2000):
+                slugs.append(slug)
+                recounted[slug] = count_terms(title, text, vocabulary)
+        else:
+            slugs = list(Article.objects.order_by('slug').values_list('slug', flat=True))
+            stored = ArticleTerms.objects.exclude(article_id__in=dirty).values_list('article_id', 'data')
+            for slug, data in stored.iterator(chunk_size=2000):
+                counts[slug] = decode_counts(data)
+            missing = [slug for slug in slugs if slug not in counts]
+            for start in range(0, len(missing), 2000):
+                documents = Article.objects.filter(pk__in=missing[start:start + 2000])
+                for slug, title, text in documents.values_list('slug', 'title', 'text'):
+                    recounted[slug] = count_terms(title, text, vocabulary)
+            # статья удалена между запросами
+            slugs = [slug for slug in slugs if slug in counts or slug in recounted]
+        counts.update(recounted)
+        tags = {}
+        for slug, tag in Article.tag.through.objects.values_list('article_id', 'tag_id').iterator(chunk_size=5000):
+            tags.setdefault(slug, []).append(tag)
+        corpus = cls(slugs, counts, tags, len(vocabulary))
+        corpus.full = dirty is None
+        corpus.vocabulary = vocabulary
+        corpus.recounted = recounted
+        return corpus
+
+    def save_terms(self):
+        with transaction.atomic():
+            terms = ArticleTerms.objects.all()
+            if not self.full:
+                terms = terms.filter(article_id__in=list(self.recounted))
+            terms.delete()
+            ArticleTerms.objects.bulk_create([
+                ArticleTerms(article_id=slug, data=encode_counts(*counts))
+                for slug, counts in self.recounted.items()
+            ], batch_size=1000)
+            tokens = zlib.compress(json.dumps(list(self.vocabulary), ensure_ascii=False).encode('utf-8'))
+            RelatedVocabulary.objects.update_or_create(pk=1, defaults={'tokens': tokens})
+
+    @staticmethod
+    def weigh(rows, columns):
+        # tf = 1 + log(частота), строки нормированы по L2; DF и IDF - по всем строкам
+        n = len(rows)
+        lengths = np.array([len(terms) for terms, _ in rows], dtype=np.int64)
+        indices = np.concatenate([terms for terms, _ in rows] + [np.empty(0, dtype=np.int64)])
+        counts = np.concatenate([counts for _, counts in rows] + [np.empty(0)])
+        df = np.bincount(indices, minlength=columns)
+        # термы из одной статьи ни с чем не связывают, слишком частые почти ничего не весят
+        max_df = max(2, int(settings.RELATED_MAX_DF * n))
+        useful = (df >= 2) & (df <= max_df)
+        idf = np.zeros(columns)
+        idf[useful] = np.log(n / df[useful])
+        weights = (1 + np.log(counts)) * idf[indices]
+        owners = np.repeat(np.arange(n), lengths)
+        kept = weights != 0
+        indices, weights, owners = indices[kept], weights[kept], owners[kept]
+        norms = np.sqrt(np.bincount(owners, weights=weights * weights, minlength=n))
+        norms[norms == 0] = 1.0
+        return SparseRows(np.bincount(owners, minlength=n), indices, weights / norms[owners], columns)
+
+    def batches(self, rows):
+        n = len(self.slugs)
+        by_rows = max(1, settings.RELATED_BATCH_CELLS // max(n, 1))
+        costs = self.texts.postings_cost()[rows] + self.tags.postings_cost()[rows]
+        batch, budget = [], 0
+        for row, cost in zip(rows, costs):
+            if batch and (len(batch) >= by_rows or budget + cost > settings.RELATED_BATCH_POSTINGS):
+                yield np.array(batch, dtype=np.int64)
+                batch, budget = [], 0
+            batch.append(row)
+            budget += cost
+        if batch:
+            yield np.array(batch, dtype=np.int64)
+
+    def scores(self, rows):
+        cosine = self.texts.products(rows)
+        shared = self.tags.products(rows)
+        union = self.tag_counts[rows][:, None] + self.tag_counts[None, :] - shared
+        jaccard = np.divide(shared, union, out=np.zeros_like(shared), where=union > 0)
+        weight = settings.RELATED_TEXT_WEIGHT
+        scores = weight * cosine + (1 - weight) * jaccard
+        scores[np.arange(len(rows)), rows] = 0
+        return scores
+
+    def top(self, scores):
+        k = min(settings.RELATED_ARTICLES_COUNT, scores.shape[1] - 1)
+        if k <= 0:
+            return [[] for _ in range(scores.shape[0])]
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        result = []
+        for row, candidates in zip(scores, best):
+            candidates = candidates[np.argsort(-row[candidates], kind='stable')]
+            result.append([(self.slugs[i], float(row[i])) for i in candidates if row[i] > 0])
+        return result
+
+
+def dirty_slugs():
+    return list(
+        Article.objects.filter(
+            Q(related_built_at__isnull=True) | Q(updated_at__gt=F('related_built_at'))
+        ).values_list('slug', flat=True)
+    )
+
+
+def store(slugs, neighbours):
+    with transaction.atomic():
+        RelatedArticle.objects.filter(article_id__in=slugs).delete()
+        RelatedArticle.objects.bulk_create([
+            RelatedArticle(article_id=slug, related_id=related, score=score)
+            for slug, links in zip(slugs, neighbours) for related, score in links
+        ])
+
+
+def thresholds():
+    # статья с полным top-K примет соседа только с score выше худшего
+    limits = RelatedArticle.objects.values('article_id').annotate(
+        worst=Min('score'), total=Count('pk')
+    ).order_by()
+    return {
+        row['article_id']: row['worst']
+        for row in limits if row['total'] >= settings.RELATED_ARTICLES_COUNT
+    }
+
+
+def refresh(full=False):
+    """Пересчитывает похожие статьи; возвращает число статей с новым top-K."""
+    started = timezone.now()
+    if not full and not RelatedVocabulary.objects.exists():
+        # частоты термов ещё не сохранены - первый пересчёт полный
+        full = True
+    slugs = None if full else dirty_slugs()
+    if slugs == []:
+        return 0
+    corpus = Corpus.load(slugs)
+    corpus.save_terms()
+    if not corpus.slugs:
+        return 0
+    if full:
+        rows = np.arange(len(corpus.slugs))
+    else:
+        rows = np.array(
+            sorted(corpus.positions[slug] for slug in slugs if slug in corpus.positions), dtype=np.int64
+        )
+        limits = thresholds()
+        worst = np.array([limits.get(slug, 0.0) for slug in corpus.slugs])
+        affected = set(RelatedArticle.objects.filter(related_id__in=slugs).values_list('article_id', flat=True))
+    done = set()
+    for batch in corpus.batches(rows):
+        scores = corpus.scores(batch)
+        batch_slugs = [corpus.slugs[i] for i in batch]
+        store(batch_slugs, corpus.top(scores))
+        done.update(batch_slugs)
+        if not full:
+            # у соседей score симметричен: изменённая статья может войти в их top-K
+            columns = np.nonzero((scores > worst[None, :]).any(axis=0))[0]
+            affected.update(corpus.slugs[i] for i in columns)
+    if not full:
+        rest = np.array(
+            sorted(corpus.positions[slug] for slug in affected - done if slug in corpus.positions), dtype=np.int64
+        )
+        for batch in corpus.batches(rest):
+            batch_slugs = [corpus.slugs[i] for i in batch]
+            store(batch_slugs, corpus.top(corpus.scores(batch)))
+        Article.objects.filter(pk__in=slugs).update(related_built_at=started)
+    else:
+        Article.objects.update(related_built_at=started)
+    cache.bump('related')
+    return len(done | (set() if full else affected))
+
+
+def rebuild():
+    return refresh(full=True)
@@ -0,0 +1,179 @@
+"""
+История правок статей. На запись ревизия сохраняется целиком (zlib, kind
+pending) - одним INSERT, без чтения прошлых версий. Задача compact заменяет
+pending дельтами по схеме skip-delta: каждые ARTICLE_REVISION_SNAPSHOT_INTERVAL
+ревизий - полный снимок, остальные - разница с ревизией, у номера которой
+(от снимка) сброшен младший единичный бит. Цепочка до снимка не длиннее
+log2(интервала) + 1, и читается одним запросом. Номер базы хранится в
+ArticleRevision.base: после смены интервала старые дельты читаются по
+сохранённой цепочке (недостающие звенья - дополнительным запросом).
+"""
+import json
+import zlib
+from difflib import SequenceMatcher, unified_diff
+
+from django.conf import settings
+from django.db import transaction
+
+from . import cache
+from .models import Article, ArticleRevision
+
+
+def compress(text):
+    return zlib.compress(text.encode('utf-8'))
+
+
+def decompress(data):
+    return zlib.decompress(data).decode('utf-8')
+
+
+def encode_delta(base, text):
+    # построчно: [start, end] - строки базы, строка - вставленный текст
+    base_lines = base.splitlines(keepends=True)
+    lines = text.splitlines(keepends=True)
+    operations = []
+    matcher = SequenceMatcher(None, base_lines, lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            operations.append([i1, i2])
+        elif j1 != j2:
+            operations.append(''.join(lines[j1:j2]))
+    return compress(json.dumps(operations, ensure_ascii=False, separators=(',', ':')))
+
+
+def apply_delta(base, data):
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    for operation in json.loads(decompress(data)):
+        if isinstance(operation, list):
+            parts.extend(base_lines[operation[0]:operation[1]])
+        else:
+            parts.append(operation)
+    return ''.join(parts)
+
+
+def base_number(number):
+    """Номер ревизии, от которой считается дельта number; None - снимок."""
+    interval = settings.ARTICLE_REVISION_SNAPSHOT_INTERVAL
+    offset = (number - 1) % interval
+    if offset == 0:
+        return None
+    return number - offset + (offset & (offset - 1))
+
+
+def chain(number):
+    numbers = [number]
+    while (base := base_number(numbers[-1])) is not None:
+        numbers.append(base)
+    return numbers
+
+
+def record(article, user=None, previous=None):
+    """
+    Добавляет текущие title/text статьи новой ревизией. previous - (title, text)
+    до правки: без изменений ревизия не создаётся, а у статьи без истории
+    прежний текст становится первой ревизией.
+    """
+    if previous is not None and previous == (article.title, article.text):
+        return None
+    with transaction.atomic():
+        # номера ревизий одной статьи выдаются по очереди
+        list(Article.objects.select_for_update().filter(pk=article.pk).values_list('pk'))
+        last = article.revisions.order_by('-number').values_list('number', flat=True).first() or 0
+        revisions = []
+        if not last and previous is not None:
+            revisions.append(build(article, 1, article.user_id, *previous))
+        revisions.append(build(
+            article, last + len(revisions) + 1,
+            user.pk if user is not None and user.is_authenticated else None,
+            article.title, article.text
+        ))
+        ArticleRevision.objects.bulk_create(revisions)
+    cache.bump(cache.article_group(article.pk))
+    return revisions[-1]
+
+
+def build(article, number, user_id, title, text):
+    return ArticleRevision(
+        article=article, number=number, user_id=user_id, title=title,
+        kind=ArticleRevision.PENDING, data=compress(text), size=len(text)
+    )
+
+
+def reconstruct_many(article_id, numbers):
+    """{number: (ревизия, текст)} для существующих numbers - обычно одним запросом."""
+    # цепочка по текущему интервалу совпадает с сохранённой, пока интервал не менялся
+    needed = set()
+    for number in numbers:
+        needed.update(chain(number))
+    rows, requested = {}, set()
+    while needed:
+        requested |= needed
+        rows.update(
+            (revision.number, revision)
+            for revision in ArticleRevision.objects.filter(
+                article_id=article_id, number__in=needed
+            ).select_related('user')
+        )
+        needed = {
+            revision.base for revision in rows.values()
+            if revision.kind == ArticleRevision.DELTA and revision.base not in rows
+        } - requested
+    texts = {}
+
+    def text_of(number):
+        if number not in texts:
+            revision = rows[number]
+            if revision.kind == ArticleRevision.DELTA:
+                texts[number] = apply_delta(text_of(revision.base), revision.data)
+            else:
+                texts[number] = decompress(revision.data)
+        return texts[number]
+
+    return {number: (rows[number], text_of(number)) for number in numbers if number in rows}
+
+
+def reconstruct(article_id, number):
+    result = reconstruct_many(article_id, [number]).get(number)
+    if result is None:
+        raise ArticleRevision.DoesNotExist(f'Revision {number} of {article_id} does not exist')
+    return result
+
+
+def diff(article_id, old, new):
+    texts = reconstruct_many(article_id, [old, new])
+    if old not in texts or new not in texts:
+        raise ArticleRevision.DoesNotExist(f'Revision {old} or {new} of {article_id} does not exist')
+    return ''.join(unified_diff(
+        texts[old][1].splitlines(keepends=True), texts[new][1].splitlines(keepends=True),
+        fromfile=f'r{old}', tofile=f'r{new}'
+    ))
+
+
+def compact(limit=None):
+    """Заменяет pending-ревизии снимками или дельтами; возвращает число обработанных."""
+    limit = limit or settings.ARTICLE_REVISION_COMPACT_BATCH
+    pending = list(
+        ArticleRevision.objects.filter(kind=ArticleRevision.PENDING)
+        .order_by('article_id', 'number')[:limit]
+    )
+    texts = {}
+    for revision in pending:
+        text = decompress(revision.data)
+        texts[revision.article_id, revision.number] = text
+        base = base_number(revision.number)
+        if base is None:
+            revision.kind = ArticleRevision.SNAPSHOT
+            continue
+        base_text = texts.get((revision.article_id, base))
+        if base_text is None:
+            base_text = reconstruct(revision.article_id, base)[1]
+            texts[revision.article_id, base] = base_text
+        delta = encode_delta(base_text, text)
+        # дельта больше полного текста (правка переписала всё) - хранится снимком
+        if len(delta) < len(revision.data):
+            revision.kind, revision.data, revision.base = ArticleRevision.DELTA, delta, base
+        else:
+            revision.kind = ArticleRevision.SNAPSHOT
+    ArticleRevision.objects.bulk_update(pending, ['kind', 'data', 'base'])
+    return len(pending)
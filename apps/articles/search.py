@@ -0,0 +1,242 @@
+import html
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchHeadline,
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connection
+from django.db.models import F, TextField, Value
+from django.db.models.functions import Replace
+
+from .models import Article
+
+FIELD_WEIGHTS = {'title': 1.0, 'tags': 0.4, 'category': 0.4, 'text': 0.2, 'author': 0.1}
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+SNIPPET_WORDS = 30
+# ts_headline не экранирует текст: совпадения помечаются управляющими символами,
+# а <mark> появляется только после html.escape (см. escape_headline)
+HEADLINE_START = '\x02'
+HEADLINE_STOP = '\x03'
+
+
+def use_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def article_fields(article):
+    return {
+        'title': article.title,
+        'text': article.text,
+        'tags': ' '.join(tag.title for tag in article.tag.all()),
+        'category': article.category.title,
+        'author': article.user_id,
+    }
+
+
+class InvertedIndex:
+    """
+    Индекс в памяти процесса для SQLite (тесты, локальная разработка):
+    токен -> {slug: взвешенная частота}, ранжирование tf-idf.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.built = False
+
+    def build(self):
+        with self.lock:
+            if self.built:
+                return
+            articles = Article.objects.select_related('category').prefetch_related('tag')
+            for article in articles.iterator(chunk_size=500):
+                self._add(article.pk, article_fields(article))
+            self.built = True
+
+    def _add(self, slug, fields):
+        self._remove(slug)
+        weights = Counter()
+        for field, value in fields.items():
+            for token in tokenize(value):
+                weights[token] += FIELD_WEIGHTS[field]
+        for token, weight in weights.items():
+            self.postings[token][slug] = weight
+        self.documents[slug] = list(weights)
+
+    def _remove(self, slug):
+        for token in self.documents.pop(slug, ()):
+            self.postings[token].pop(slug, None)
+            if not self.postings[token]:
+                del self.postings[token]
+
+    def reset(self):
+        with self.lock:
+            self.postings = defaultdict(dict)
+            self.documents = {}
+            self.built = False
+
+    def add(self, article):
+        if self.built:
+            with self.lock:
+                self._add(article.pk, article_fields(article))
+
+    def remove(self, slug):
+        if self.built:
+            with self.lock:
+                self._remove(slug)
+
+    def search(self, query):
+        self.build()
+        tokens = set(tokenize(query))
+        if not tokens:
+            return {}
+        with self.lock:
+            matches = [self.postings.get(token, {}) for token in tokens]
+            total = len(self.documents) or 1
+        # все слова запроса должны встретиться, как в websearch-запросе
+        slugs = set.intersection(*(set(posting) for posting in matches))
+        ranks = {}
+        for slug in slugs:
+            ranks[slug] = sum(
+                posting[slug] * math.log(1 + total / len(posting))
+                for posting in matches
+            )
+        return ranks
+
+
+index = InvertedIndex()
+
+
+def search_vector(fields):
+    config = settings.SEARCH_CONFIG
+    return (
+        SearchVector(fields['title'], weight='A', config=config)
+        + SearchVector(fields['tags'], weight='B', config=config)
+        + SearchVector(fields['category'], weight='B', config=config)
+        + SearchVector(fields['text'], weight='C', config=config)
+        + SearchVector(fields['author'], weight='D', config=config)
+    )
+
+
+def index_article(article):
+    if not use_postgres():
+        index.add(article)
+        return
+    fields = {
+        name: Value(value, output_field=TextField())
+        for name, value in article_fields(article).items()
+    }
+    Article.objects.filter(pk=article.pk).update(search_vector=search_vector(fields))
+
+
+REINDEX_SQL = """
+UPDATE articles_article a SET search_vector =
+    setweight(to_tsvector(%(config)s::regconfig, a.title), 'A')
+    || setweight(to_tsvector(%(config)s::regconfig, coalesce((
+        SELECT string_agg(t.title, ' ')
+        FROM articles_tag t
+        JOIN articles_article_tag at ON at.tag_id = t.slug
+        WHERE at.article_id = a.slug
+    ), '')), 'B')
+    || setweight(to_tsvector(%(config)s::regconfig, coalesce((
+        SELECT c.title FROM articles_category c WHERE c.slug = a.category_id
+    ), '')), 'B')
+    || setweight(to_tsvector(%(config)s::regconfig, a.text), 'C')
+    || setweight(to_tsvector(%(config)s::regconfig, a.user_id), 'D')
+WHERE a.slug = ANY(%(slugs)s)
+"""
+
+
+def reindex_articles(slugs):
+    # для bulk-операций, которые не посылают сигналов
+    if not use_postgres():
+        index.reset()
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(REINDEX_SQL, {'config': settings.SEARCH_CONFIG, 'slugs': list(slugs)})
+
+
+def unindex_article(slug):
+    if not use_postgres():
+        index.remove(slug)
+
+
+def filter_queryset(queryset, query):
+    if use_postgres():
+        search_query = SearchQuery(query, search_type='websearch', config=settings.SEARCH_CONFIG)
+        return queryset.filter(search_vector=search_query)
+    return queryset.filter(pk__in=list(index.search(query)))
+
+
+def highlight(text, query):
+    tokens = set(tokenize(query))
+    words = text.split()
+    start = next(
+        (i for i, word in enumerate(words) if set(tokenize(word)) & tokens), 0
+    )
+    start = max(0, start - SNIPPET_WORDS // 3)
+    snippet = []
+    for word in words[start:start + SNIPPET_WORDS]:
+        escaped = html.escape(word)
+        if set(tokenize(word)) & tokens:
+            escaped = f'<mark>{escaped}</mark>'
+        snippet.append(escaped)
+    return ' '.join(snippet)
+
+
+def escape_headline(headline):
+    escaped = html.escape(headline)
+    return escaped.replace(HEADLINE_START, '<mark>').replace(HEADLINE_STOP, '</mark>')
+
+
+def headline_text():
+    # маркеры в самом тексте статьи не должны превратиться в разметку
+    text = Replace(F('text'), Value(HEADLINE_START), Value(''))
+    return Replace(text, Value(HEADLINE_STOP), Value(''))
+
+
+def search_articles(query, limit):
+    """Возвращает статьи по убыванию релевантности с атрибутами rank и headline."""
+    queryset = Article.objects.only('slug', 'title', 'text', 'user_id', 'image')
+    if use_postgres():
+        search_query = SearchQuery(query, search_type='websearch', config=settings.SEARCH_CONFIG)
+        articles = list(
+            queryset.filter(search_vector=search_query)
+            .annotate(
+                rank=SearchRank(F('search_vector'), search_query),
+                headline=SearchHeadline(
+                    headline_text(), search_query,
+                    config=settings.SEARCH_CONFIG,
+                    start_sel=HEADLINE_START, stop_sel=HEADLINE_STOP,
+                    max_words=SNIPPET_WORDS, min_words=SNIPPET_WORDS // 2
+                )
+            )
+            .order_by('-rank', 'slug')[:limit]
+        )
+        # та же безопасная разметка, что у highlight() для SQLite
+        for article in articles:
+            article.headline = escape_headline(article.headline)
+        return articles
+    ranks = index.search(query)
+    best = sorted(ranks, key=lambda slug: (-ranks[slug], slug))[:limit]
+    articles = queryset.in_bulk(best)
+    results = []
+    for slug in best:
+        if slug in articles:
+            article = articles[slug]
+            article.rank = ranks[slug]
+            article.headline = highlight(article.text, query)
+            results.append(article)
+    return results
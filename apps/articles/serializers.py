@@ -1,43 +1,121 @@
 from rest_framework import serializers
+from rest_framework.utils.urls import replace_query_param
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
 from django.db.models import Avg
 
 from apps.articles.permissions import IsStaff
 
+from .images import build_srcset
+from .pagination import CommentCursorPagination
 from .models import (
     Article,
     Tag,
     Comment,
     ArticleImage,
+    ArticleRevision,
     Category
 )
 
 
-class ArticleListSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Article
-        fields = ('user', 'title', 'image', 'slug')
+class ThumbnailImageField(serializers.ImageField):
+    # превью, пока оно не готово - оригинал
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return super().to_representation(instance.thumbnail or instance.image)
+
+
+class SrcsetField(serializers.ReadOnlyField):
+    # варианты лежат в хранилище поля image той же модели
+    def to_representation(self, variants):
+        storage = self.parent.Meta.model._meta.get_field('image').storage
+        return build_srcset(variants, storage, self.context.get('request'))
+
+
+class ArticleSummarySerializer(serializers.BaseSerializer):
+    """
+    Карточка статьи для списков. Форма ответа фиксирована, поэтому вместо
+    полей ModelSerializer - словарь из атрибутов .only()-проекции
+    (см. ARTICLE_SUMMARY_FIELDS).
+    """
+    fields = ()
+
+    def image_url(self, instance):
+        image = instance.thumbnail or instance.image
+        if not image:
+            return None
+        request = self.context.get('request')
+        return request.build_absolute_uri(image.url) if request is not None else image.url
+
+    def to_representation(self, instance):
+        data = {
+            'user': instance.user_id,
+            'title': instance.title,
+            'image': self.image_url(instance),
+            'slug': instance.slug,
+            'views_count': instance.views_count,
+        }
+        return {field: data[field] for field in self.fields}
+
+
+class ArticleListSerializer(ArticleSummarySerializer):
+    fields = ('user', 'title', 'image', 'slug')
 
 
 class ArticleSerializer(serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.username')
+    srcset = SrcsetField(source='image_variants')
 
     class Meta:
         model = Article
-        fields = '__all__'
+        exclude = ('search_vector', 'image_variants', 'trending_score', 'related_built_at')
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['comments'] = CommentSerializer(
-            instance.comments.all(), many=True
-        ).data
+        # только первая страница, остальное - через /article/<pk>/comments/
+        page_size = settings.ARTICLE_COMMENTS_FIRST_PAGE
+        comments = getattr(instance, 'first_comments', None)
+        if comments is None:
+            comments = list(first_comments(instance.comments.select_related('user'))[:page_size + 1])
+        representation['comments'] = CommentSerializer(comments[:page_size], many=True).data
+        representation['comments_next'] = None
+        if len(comments) > page_size:
+            url = reverse('article-comments', kwargs={'pk': instance.pk})
+            request = self.context.get('request')
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            url = replace_query_param(url, CommentCursorPagination.page_size_query_param, page_size)
+            representation['comments_next'] = CommentCursorPagination().get_link_after(
+                url, comments[page_size - 1]
+            )
         representation['carousel'] = ArticleImageSerializer(
             instance.article_images.all(), many=True).data
         return representation
 
+def first_comments(queryset):
+    ordering = CommentCursorPagination.orderings[CommentCursorPagination.default_ordering]
+    return queryset.order_by(*ordering)
+
+
+class ArticleRevisionSerializer(serializers.ModelSerializer):
+    user = serializers.ReadOnlyField(source='user.username')
+
+    class Meta:
+        model = ArticleRevision
+        fields = ('number', 'title', 'user', 'size', 'created_at')
+
+
 class ArticleImageSerializer(serializers.ModelSerializer):
+    srcset = SrcsetField(source='variants')
+
     class Meta:
         model = ArticleImage
-        fields = 'image', 
+        fields = ('image', 'thumbnail', 'srcset')
 
 class ArticleCreateSerializer(serializers.ModelSerializer):
     user = serializers.ReadOnlyField(
@@ -52,18 +130,19 @@ class ArticleCreateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Article
-        fields = '__all__'
-        # exclude = ('tag', )
+        exclude = ('search_vector', 'image_variants', 'trending_score', 'related_built_at')
 
     def create(self, validated_data):
         carousel_images = validated_data.pop('carousel_img')
         tag = validated_data.pop('tag')
-        article = Article.objects.create(**validated_data)
-        article.tag.set(tag)
-        images = []
-        for image in carousel_images:
-            images.append(ArticleImage(article=article, image=image))
-        ArticleImage.objects.bulk_create(images)
+        # картинки режутся задачей после коммита, когда карусель уже сохранена
+        with transaction.atomic():
+            article = Article.objects.create(**validated_data)
+            article.tag.set(tag)
+            images = []
+            for image in carousel_images:
+                images.append(ArticleImage(article=article, image=image))
+            ArticleImage.objects.bulk_create(images)
         return article
     
 
@@ -75,7 +154,7 @@ class CommentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Comment
-        exclude = ['article']
+        exclude = ['post']
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -83,12 +162,6 @@ class TagSerializer(serializers.ModelSerializer):
         model = Tag
         fields = '__all__'
 
-    def validate(self, attrs):
-        tag = attrs.get('title')
-        if Tag.objects.filter(title=tag).exists():
-            raise serializers.ValidationError('Tag with this name already exists')
-        return attrs
-
 class CurrentArticleDefault:
     requires_context = True
 
@@ -101,11 +174,52 @@ class CategorySerializer(serializers.ModelSerializer):
         model = Category
         fields = '__all__'
 
+    def validate_parent_category(self, parent):
+        if parent and self.instance and parent.path.startswith(self.instance.path):
+            raise serializers.ValidationError(
+                'Category cannot be moved under its own descendant'
+            )
+        return parent
+
+
+class CategoryTreeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ('slug', 'title', 'depth')
+
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        representation['subcategories'] = [
+            self.to_representation(child) for child in instance.tree_children
+        ]
+        return representation
+
 class ArticleFilterSerializer(serializers.ModelSerializer):
     class Meta:
         model = Article
         fields = ('title')
 
+class HomepageListSerializer(ArticleSummarySerializer):
+    fields = ('user', 'title', 'image', 'slug', 'views_count')
+
+
+class TrendingArticleSerializer(HomepageListSerializer):
+    # score и recent_views проставляет trending.trending_articles
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['score'] = round(instance.score, 3)
+        data['recent_views'] = instance.recent_views
+        return data
+
+
+class RelatedArticleSerializer(ArticleListSerializer):
+    # score проставляет ArticleViewSet.list_related из RelatedArticle
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['score'] = round(instance.score, 3)
+        return data
+
+
 class HomepageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Article
@@ -118,6 +232,20 @@ class HomepageSerializer(serializers.ModelSerializer):
     #     return instance
 
 
+class HomepageDetailSerializer(HomepageSerializer):
+    # только для чтения: PUT/PATCH меняют image через HomepageSerializer
+    image = ThumbnailImageField()
+
+
+class ArticleSearchSerializer(serializers.ModelSerializer):
+    rank = serializers.FloatField(read_only=True)
+    headline = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Article
+        fields = ('user', 'title', 'image', 'slug', 'rank', 'headline')
+
+
 class ArticleSerializerTop(serializers.ModelSerializer):
 
     class Meta:
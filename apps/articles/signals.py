@@ -0,0 +1,205 @@
+import redis
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Substr
+from django.utils import timezone
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import cache, images, leaderboard, search, tags
+from .models import Article, ArticleImage, Category, Comment, RelatedArticle, Tag
+
+
+@receiver(post_save, sender=Article)
+def sync_leaderboard(sender, instance, **kwargs):
+    try:
+        leaderboard.sync_article(instance)
+    except redis.RedisError:
+        pass
+
+
+@receiver(post_delete, sender=Article)
+def remove_from_leaderboard(sender, instance, **kwargs):
+    try:
+        leaderboard.remove_article(instance.pk)
+    except redis.RedisError:
+        pass
+
+
+@receiver(m2m_changed, sender=Article.tag.through)
+def sync_tag_leaderboards(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        articles = Article.objects.filter(pk__in=pk_set or ()).prefetch_related('tag')
+    else:
+        articles = [instance]
+    try:
+        for article in articles:
+            leaderboard.sync_article(article)
+    except redis.RedisError:
+        pass
+
+
+@receiver(post_delete, sender=Tag)
+def drop_tag_leaderboard(sender, instance, **kwargs):
+    try:
+        leaderboard.get_redis().delete(f'{leaderboard.TOP_KEY}:tag:{instance.pk}')
+    except redis.RedisError:
+        pass
+
+
+@receiver(m2m_changed, sender=Article.tag.through)
+def count_tag_articles(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # tag.articles.add/remove/clear - меняется только этот тег
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            tags.recount_on_commit([instance.pk])
+        return
+    if action == 'pre_clear':
+        # post_clear уже не знает, какие теги были у статьи
+        instance._cleared_tags = list(instance.tag.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        tags.recount_on_commit(pk_set)
+    elif action == 'post_clear':
+        tags.recount_on_commit(getattr(instance, '_cleared_tags', []))
+
+
+@receiver(pre_delete, sender=Article)
+def remember_article_tags(sender, instance, **kwargs):
+    instance._deleted_tags = list(instance.tag.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Article)
+def count_deleted_article_tags(sender, instance, **kwargs):
+    tags.recount_on_commit(getattr(instance, '_deleted_tags', []))
+
+
+@receiver(post_save, sender=Article)
+def index_article(sender, instance, **kwargs):
+    search.index_article(instance)
+
+
+@receiver(post_delete, sender=Article)
+def unindex_article(sender, instance, **kwargs):
+    search.unindex_article(instance.pk)
+
+
+@receiver(m2m_changed, sender=Article.tag.through)
+def reindex_tagged_articles(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        articles = Article.objects.filter(pk__in=pk_set or ()).select_related('category').prefetch_related('tag')
+    else:
+        articles = [instance]
+    for article in articles:
+        search.index_article(article)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_articles(sender, instance, created, **kwargs):
+    if created:
+        return
+    articles = instance.articles.select_related('category').prefetch_related('tag')
+    for article in articles.iterator(chunk_size=500):
+        search.index_article(article)
+
+
+@receiver(m2m_changed, sender=Article.tag.through)
+def mark_related_dirty(sender, instance, action, reverse, pk_set, **kwargs):
+    # теги входят в score похожих статей: related.refresh пересчитает статью
+    if reverse and action == 'pre_clear':
+        # post_clear уже не знает, какие статьи были у тега
+        instance._cleared_articles = list(instance.articles.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        slugs = getattr(instance, '_cleared_articles', []) if action == 'post_clear' else pk_set or ()
+    else:
+        slugs = [instance.pk]
+    Article.objects.filter(pk__in=slugs).update(updated_at=timezone.now())
+
+
+@receiver(pre_delete, sender=Article)
+def mark_related_of_deleted(sender, instance, **kwargs):
+    # ссылки на удаляемую статью исчезнут каскадом, их top-K нужно добрать заново
+    linked = RelatedArticle.objects.filter(related_id=instance.pk).values('article_id')
+    Article.objects.filter(pk__in=linked).update(related_built_at=None)
+
+
+@receiver(post_save, sender=Comment)
+def increment_comments_count(sender, instance, created, **kwargs):
+    if created:
+        Article.objects.filter(pk=instance.post_id).update(
+            comments_count=F('comments_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comments_count(sender, instance, **kwargs):
+    Article.objects.filter(pk=instance.post_id, comments_count__gt=0).update(
+        comments_count=F('comments_count') - 1
+    )
+
+
+@receiver([post_save, post_delete], sender=Article)
+def invalidate_article(sender, instance, **kwargs):
+    cache.bump('articles', cache.article_group(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Comment)
+@receiver([post_save, post_delete], sender=ArticleImage)
+def invalidate_article_children(sender, instance, **kwargs):
+    article_id = instance.post_id if sender is Comment else instance.article_id
+    cache.bump('articles', cache.article_group(article_id))
+
+
+@receiver(m2m_changed, sender=Article.tag.through)
+def invalidate_article_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    slugs = (pk_set or ()) if reverse else [instance.pk]
+    cache.bump('articles', *[cache.article_group(slug) for slug in slugs])
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tags(sender, instance, **kwargs):
+    cache.bump('tags', 'articles')
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_categories(sender, instance, **kwargs):
+    cache.bump('categories')
+
+
+@receiver(post_delete, sender=Category)
+def reroot_subcategories(sender, instance, **kwargs):
+    # SET_NULL делает дочерние категории корнями, пути поддерева укорачиваются
+    Category.objects.filter(path__startswith=instance.path).update(
+        path=Substr('path', len(instance.path) + 1),
+        depth=F('depth') - (instance.depth + 1)
+    )
+
+
+@receiver(post_save, sender=Article)
+def schedule_image_processing(sender, instance, **kwargs):
+    if images.needs_processing(instance.image, instance.image_variants):
+        from .tasks import process_article_images
+        transaction.on_commit(lambda: process_article_images.delay(instance.pk))
+
+
+@receiver(post_save, sender=ArticleImage)
+def schedule_carousel_processing(sender, instance, **kwargs):
+    if images.needs_processing(instance.image, instance.variants):
+        from .tasks import process_article_images
+        transaction.on_commit(lambda: process_article_images.delay(instance.article_id))
+
+
+@receiver(post_delete, sender=Article)
+@receiver(post_delete, sender=ArticleImage)
+def delete_image_variants(sender, instance, **kwargs):
+    variants = instance.image_variants if sender is Article else instance.variants
+    storage = instance.image.storage
+    transaction.on_commit(lambda: images.delete_variants(variants, storage))
@@ -0,0 +1,110 @@
+"""
+Индекс тегов для автодополнения и облака тегов. Tag.articles_count
+пересчитывается после коммита только для затронутых тегов; в памяти процесса
+хранится отсортированный по названию список, который перестраивается, когда
+меняется версия группы кэша 'tags' (её увеличивает любое изменение тегов).
+"""
+import math
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from . import cache
+from .models import Article, Tag
+
+
+def recount(slugs=None):
+    """Пересчитывает articles_count одним UPDATE; без slugs - для всех тегов."""
+    counts = (
+        Article.tag.through.objects.filter(tag_id=OuterRef('pk'))
+        .order_by().values('tag_id').annotate(total=Count('pk')).values('total')
+    )
+    queryset = Tag.objects.all()
+    if slugs is not None:
+        slugs = list(slugs)
+        if not slugs:
+            return
+        queryset = queryset.filter(pk__in=slugs)
+    queryset.update(articles_count=Coalesce(Subquery(counts), 0))
+    cache.bump('tags')
+
+
+def recount_on_commit(slugs):
+    """
+    recount() после коммита: подзапрос видит связи, закоммиченные другими
+    транзакциями, а строки тегов не остаются заблокированными до конца записи.
+    """
+    slugs = list(slugs)
+    if slugs:
+        transaction.on_commit(lambda: recount(slugs))
+
+
+def fold(title):
+    return title.casefold()
+
+
+class TagIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.keys = []
+        self.tags = []
+
+    def current(self):
+        [version], _ = cache.get_versions(['tags'])
+        if version != self.version:
+            tags = sorted(
+                Tag.objects.values_list('slug', 'title', 'articles_count'),
+                key=lambda tag: fold(tag[1])
+            )
+            with self.lock:
+                self.keys = [fold(title) for _, title, _ in tags]
+                self.tags = tags
+                self.version = version
+        return self.keys, self.tags
+
+    def autocomplete(self, prefix, limit):
+        prefix = fold(prefix)
+        keys, tags = self.current()
+        matches = []
+        for position in range(bisect_left(keys, prefix), len(keys)):
+            if not keys[position].startswith(prefix):
+                break
+            matches.append(tags[position])
+        matches.sort(key=lambda tag: -tag[2])
+        return [self.as_dict(tag) for tag in matches[:limit]]
+
+    def cloud(self, limit):
+        _, tags = self.current()
+        top = sorted((tag for tag in tags if tag[2]), key=lambda tag: -tag[2])[:limit]
+        if not top:
+            return []
+        # вес 1..TAG_CLOUD_WEIGHTS по логарифму числа статей
+        low, high = math.log(top[-1][2]), math.log(top[0][2])
+        spread = (high - low) or 1
+        weights = settings.TAG_CLOUD_WEIGHTS
+        cloud = []
+        for tag in sorted(top, key=lambda tag: fold(tag[1])):
+            data = self.as_dict(tag)
+            data['weight'] = 1 + round((math.log(tag[2]) - low) / spread * (weights - 1))
+            cloud.append(data)
+        return cloud
+
+    @staticmethod
+    def as_dict(tag):
+        slug, title, count = tag
+        return {'slug': slug, 'title': title, 'articles_count': count}
+
+
+index = TagIndex()
+
+
+def get_limit(value, default, maximum):
+    try:
+        return max(1, min(int(value), maximum))
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,85 @@
+import logging
+
+from django.conf import settings
+from PIL import UnidentifiedImageError
+
+from config.celery import app
+
+from . import cache, images, leaderboard, revisions
+from .counters import flush_views
+from .models import Article, ArticleImage
+
+logger = logging.getLogger(__name__)
+
+
+@app.task
+def flush_article_views():
+    return len(flush_views())
+
+
+@app.task
+def rebuild_leaderboards():
+    leaderboard.rebuild()
+
+
+@app.task
+def compact_article_revisions():
+    # пачками, пока не останется pending-ревизий
+    total = 0
+    while True:
+        compacted = revisions.compact()
+        total += compacted
+        if compacted < settings.ARTICLE_REVISION_COMPACT_BATCH:
+            return total
+
+
+@app.task
+def refresh_related_articles():
+    # numpy грузится только воркером, который выполняет эти задачи
+    from . import related
+    return related.refresh()
+
+
+@app.task
+def rebuild_related_articles():
+    from . import related
+    return related.rebuild()
+
+
+@app.task
+def process_article_images(slug):
+    article = Article.objects.filter(pk=slug).prefetch_related('article_images').first()
+    if article is None:
+        return
+    # каждая картинка обрабатывается отдельно: битый оригинал не мешает остальным
+    if images.needs_processing(article.image, article.image_variants):
+        processed = build_variants(article.image, slug)
+        if processed is not None:
+            thumbnail, variants = processed
+            storage = article.image.storage
+            # оригинал могли заменить, пока шла обработка: тогда эти варианты уже не нужны
+            updated = Article.objects.filter(pk=slug, image=article.image.name).update(
+                thumbnail=thumbnail, image_variants=variants
+            )
+            images.delete_variants(article.image_variants if updated else variants, storage)
+    carousel, superseded = [], []
+    for image in article.article_images.all():
+        if not images.needs_processing(image.image, image.variants):
+            continue
+        processed = build_variants(image.image, slug)
+        if processed is not None:
+            superseded.append(image.variants)
+            image.thumbnail, image.variants = processed
+            carousel.append(image)
+    ArticleImage.objects.bulk_update(carousel, ['thumbnail', 'variants'])
+    for image, variants in zip(carousel, superseded):
+        images.delete_variants(variants, image.image.storage)
+    cache.bump('articles', cache.article_group(slug))
+
+
+def build_variants(field_file, slug):
+    try:
+        return images.build_variants(field_file)
+    except (OSError, UnidentifiedImageError):
+        logger.warning('Could not process image %s of article %s', field_file.name, slug, exc_info=True)
+        return None
@@ -1,3 +1,1551 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from base64 import urlsafe_b64encode
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from config import db, metrics, swagger
+from config.renderers import FastJSONRenderer
+from PIL import Image
+
+from . import counters, leaderboard, related, revisions, search, trending
+from .cache import bump, get_versions
+from .models import (
+    Article, ArticleImage, ArticleRevision, ArticleViewFlush, Category, Comment, RelatedArticle, Tag
+)
+from .tasks import compact_article_revisions, process_article_images
+from .views import ARTICLE_DETAIL_PLAN, prefetch_lookups
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+User = get_user_model()
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+class FakeRedisMixin:
+    # модули, в которых get_redis() подменяется на Redis в памяти
+    redis_modules = ()
+
+    def setUp(self):
+        super().setUp()
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        for module in self.redis_modules:
+            patcher = mock.patch.object(module, 'get_redis', return_value=self.redis)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    ARTICLE_VIEWS_BUFFER='memory',
+    ARTICLE_VIEWS_FLUSH_INTERVAL=3600
+)
+class QueryCountTestCase(TestCase):
+    # Количество запросов на эндпоинт не должно зависеть от числа связей
+    article_count = 5
+    comment_count = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', 'author@mail.com', 'password')
+        category = Category.objects.create(title='Science')
+        tags = [Tag.objects.create(title=f'tag {i}') for i in range(3)]
+        for i in range(cls.article_count):
+            article = Article.objects.create(
+                user=cls.user,
+                title=f'Article {i}',
+                text='text',
+                image='article_images/image.jpg',
+                category=category
+            )
+            article.tag.set(tags)
+            ArticleImage.objects.bulk_create(
+                ArticleImage(article=article, image='article_images/carousel/image.jpg')
+                for _ in range(3)
+            )
+            for j in range(cls.comment_count):
+                commenter = User.objects.create_user(
+                    f'reader{i}{j}', f'reader{i}{j}@mail.com', 'password'
+                )
+                Comment.objects.create(user=commenter, post=article, text='comment')
+        cls.article = Article.objects.first()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def assertEndpointQueries(self, num, url):
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_article_list(self):
+        self.assertEndpointQueries(1, '/wikipedia/article/?page_size=10')
+
+    def test_article_detail(self):
+        response = self.assertEndpointQueries(
+            4, f'/wikipedia/article/{self.article.pk}/'
+        )
+        self.assertEqual(len(response.data['comments']), self.comment_count)
+        self.assertEqual(len(response.data['carousel']), 3)
+
+    def test_list_projection_skips_text(self):
+        for url in ['/wikipedia/article/?page_size=10', '/wikipedia/homepage/?page_size=10']:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(len(response.data['results']), self.article_count)
+            self.assertNotIn('"text"', queries[0]['sql'])
+        self.assertEqual(
+            set(response.data['results'][0]), {'user', 'title', 'image', 'slug', 'views_count'}
+        )
+
+    def test_article_filter_list(self):
+        self.assertEndpointQueries(4, '/wikipedia/article_filter/?page_size=10')
+
+    def test_homepage_list(self):
+        self.assertEndpointQueries(1, '/wikipedia/homepage/?page_size=10')
+
+    def test_tags_list(self):
+        self.assertEndpointQueries(2, '/wikipedia/tags/?limit=10')
+
+    def test_categories_list(self):
+        self.assertEndpointQueries(2, '/wikipedia/categories/?limit=10')
+
+    def test_comment_list(self):
+        self.assertEndpointQueries(
+            2, f'/wikipedia/comment/?post={self.article.pk}&page_size=10'
+        )
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    ARTICLE_VIEWS_BUFFER='memory',
+    ARTICLE_VIEWS_FLUSH_INTERVAL=3600
+)
+class ResponseCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', 'author@mail.com', 'password')
+        category = Category.objects.create(title='Science')
+        cls.article = Article.objects.create(
+            user=cls.user, title='Article', text='text',
+            image='article_images/image.jpg', category=category
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = f'/wikipedia/article/{self.article.pk}/'
+        # на коммите вместе со сбросом кэша ставится и обработка картинок
+        patcher = mock.patch('apps.articles.tasks.process_article_images.delay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_detail_is_cached(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_comment_invalidates_detail(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(user=self.user, post=self.article, text='new comment')
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data['comments']), 1)
+
+    def test_image_invalidates_detail(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            ArticleImage.objects.create(article=self.article, image='carousel.jpg')
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data['carousel']), 1)
+
+    def test_cache_is_per_host(self):
+        # ответ с подставленным Host не достаётся другим клиентам
+        self.client.get(self.url, HTTP_HOST='evil.example')
+        response = self.client.get(self.url)
+        self.assertTrue(response.data['image'].startswith('http://testserver/'))
+        self.assertNotEqual(
+            self.client.get(self.url, HTTP_HOST='evil.example')['ETag'], response['ETag']
+        )
+
+    def test_bump_waits_for_commit(self):
+        versions, _ = get_versions(['articles'])
+        with self.captureOnCommitCallbacks(execute=True):
+            bump('articles')
+            self.assertEqual(get_versions(['articles'])[0], versions)
+        self.assertNotEqual(get_versions(['articles'])[0], versions)
+
+    def test_save_invalidates_list(self):
+        self.client.get('/wikipedia/homepage/')
+        self.article.title = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.article.save()
+        response = self.client.get('/wikipedia/homepage/')
+        self.assertEqual(response.data['results'][0]['title'], 'Renamed')
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    ARTICLE_VIEWS_BUFFER='memory',
+    ARTICLE_VIEWS_FLUSH_INTERVAL=3600
+)
+class ConditionalGetTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', 'author@mail.com', 'password')
+        category = Category.objects.create(title='Science')
+        cls.article = Article.objects.create(
+            user=cls.user, title='Article', text='text',
+            image='article_images/image.jpg', category=category
+        )
+        Tag.objects.create(title='planets')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = f'/wikipedia/article/{self.article.pk}/'
+
+    def test_unchanged_detail_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_change_breaks_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(user=self.user, post=self.article, text='new comment')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_if_modified_since(self):
+        for url in ['/wikipedia/homepage/', '/wikipedia/tags/', '/wikipedia/categories/']:
+            last_modified = self.client.get(url)['Last-Modified']
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 304, url)
+
+    def test_etag_depends_on_query(self):
+        first = self.client.get('/wikipedia/article/?page_size=1')['ETag']
+        second = self.client.get('/wikipedia/article/?page_size=2')['ETag']
+        self.assertNotEqual(first, second)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class KeysetPaginationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('author', 'author@mail.com', 'password')
+        category = Category.objects.create(title='Science')
+        for i in range(7):
+            Article.objects.create(
+                user=user,
+                title=f'Article {i}',
+                slug=f'article-{i}',
+                text='text',
+                image='article_images/image.jpg',
+                category=category,
+                views_count=i % 3
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def walk(self, url):
+        slugs = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            slugs += [article['slug'] for article in response.data['results']]
+            last_page = response.data
+            url = response.data['next']
+        return slugs, last_page
+
+    def test_pages_follow_ordering(self):
+        for ordering in ['created_at', '-created_at', 'views_count', '-views_count']:
+            expected = list(
+                Article.objects.order_by(
+                    ordering, '-slug' if ordering in ('-created_at', 'views_count') else 'slug'
+                ).values_list('slug', flat=True)
+            )
+            slugs, _ = self.walk(f'/wikipedia/homepage/?ordering={ordering}&page_size=3')
+            self.assertEqual(slugs, expected)
+
+    def test_previous_link(self):
+        slugs, last_page = self.walk('/wikipedia/article/?page_size=3')
+        response = self.client.get(last_page['previous'])
+        self.assertEqual(
+            [article['slug'] for article in response.data['results']], slugs[3:6]
+        )
+
+    def test_page_size_is_capped(self):
+        response = self.client.get('/wikipedia/article/?page_size=100000')
+        self.assertEqual(len(response.data['results']), 7)
+        self.assertIsNone(response.data['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/wikipedia/article/?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_with_invalid_values(self):
+        def cursor(values):
+            return urlsafe_b64encode(json.dumps({'v': values, 'r': 0}).encode()).decode()
+
+        for ordering, values in [
+            ('created_at', ['garbage', 'x']),
+            ('views_count', ['x', 'y']),
+            ('views_count', [True, 'y']),
+            ('created_at', [{'a': 1}, 'y']),
+            ('created_at', [None, 'y']),
+            ('created_at', ['2024-01-01T00:00:00', ['y']]),
+        ]:
+            with self.subTest(ordering=ordering, values=values):
+                response = self.client.get(
+                    '/wikipedia/article/', {'ordering': ordering, 'cursor': cursor(values)}
+                )
+                self.assertEqual(response.status_code, 404)
+
+    def test_legacy_limit_offset(self):
+        # клиенты до перехода на курсоры получают прежний формат ответа
+        for url in ['/wikipedia/homepage/', '/wikipedia/async/homepage/']:
+            response = self.client.get(url, {'ordering': '-views_count', 'limit': 2, 'offset': 2})
+            data = json.loads(response.content)
+            self.assertEqual(set(data), {'count', 'next', 'previous', 'results'})
+            self.assertEqual(data['count'], 7)
+            self.assertEqual(
+                [article['slug'] for article in data['results']], ['article-1', 'article-4']
+            )
+
+    def test_comment_list_requires_article(self):
+        response = self.client.get('/wikipedia/comment/')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    ARTICLE_VIEWS_BUFFER='memory',
+    ARTICLE_VIEWS_FLUSH_INTERVAL=3600,
+    ARTICLE_COMMENTS_FIRST_PAGE=2
+)
+class CommentThreadTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', 'author@mail.com', 'password')
+        category = Category.objects.create(title='Science')
+        cls.article = Article.objects.create(
+            user=cls.user, title='Article', text='text',
+            image='article_images/image.jpg', category=category
+        )
+        cls.comments = [
+            Comment.objects.create(user=cls.user, post=cls.article, text=f'comment {i}')
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = f'/wikipedia/article/{self.article.pk}/'
+
+    def test_comments_count_is_maintained(self):
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.comments_count, 5)
+        self.comments[0].delete()
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.comments_count, 4)
+
+    def test_detail_embeds_first_page(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['comments_count'], 5)
+        self.assertEqual(
+            [comment['text'] for comment in response.data['comments']],
+            ['comment 0', 'comment 1']
+        )
+        texts = []
+        url = response.data['comments_next']
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            texts += [comment['text'] for comment in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(texts, ['comment 2', 'comment 3', 'comment 4'])
+
+    def test_since_returns_new_comments(self):
+        since = self.comments[-1].created_at.isoformat()
+        response = self.client.get(f'{self.url}comments/', {'since': since})
+        self.assertEqual(response.data['results'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(user=self.user, post=self.article, text='new comment')
+        response = self.client.get(f'{self.url}comments/', {'since': since})
+        self.assertEqual(
+            [comment['text'] for comment in response.data['results']], ['new comment']
+        )
+
+    def test_invalid_since(self):
+        response = self.client.get(f'{self.url}comments/', {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_first_page_size_is_read_per_queryset(self):
+        # страница + 1 комментарий, чтобы узнать, есть ли следующая
+        lookups = prefetch_lookups(ARTICLE_DETAIL_PLAN)
+        article = Article.objects.prefetch_related(*lookups).get(pk=self.article.pk)
+        self.assertEqual(len(article.first_comments), 3)
+        with self.settings(ARTICLE_COMMENTS_FIRST_PAGE=3):
+            lookups = prefetch_lookups(ARTICLE_DETAIL_PLAN)
+        article = Article.objects.prefetch_related(*lookups).get(pk=self.article.pk)
+        self.assertEqual(len(article.first_comments), 4)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SearchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('author', 'author@mail.com', 'password')
+        category = Category.objects.create(title='Astronomy')
+        cls.tag = Tag.objects.create(title='planets')
+        cls.mars = Article.objects.create(
+            user=user, title='Mars', slug='mars', category=category,
+            text='Mars is the fourth planet from the Sun', image='mars.jpg'
+        )
+        cls.venus = Article.objects.create(
+            user=user, title='Venus', slug='venus', category=category,
+            text='Venus is sometimes called the sister of Mars', image='venus.jpg'
+        )
+        cls.venus.tag.add(cls.tag)
+
+    def setUp(self):
+        search.index = search.InvertedIndex()
+        cache.clear()
+        self.client = APIClient()
+
+    def test_ranking_and_headline(self):
+        response = self.client.get('/wikipedia/article/search/?q=mars')
+        self.assertEqual([a['slug'] for a in response.data], ['mars', 'venus'])
+        self.assertIn('<mark>Mars</mark>', response.data[1]['headline'])
+
+    def test_tags_and_category_are_indexed(self):
+        response = self.client.get('/wikipedia/article/search/?q=planets')
+        self.assertEqual([a['slug'] for a in response.data], ['venus'])
+        response = self.client.get('/wikipedia/article/search/?q=astronomy sun')
+        self.assertEqual([a['slug'] for a in response.data], ['mars'])
+
+    def test_index_follows_updates(self):
+        self.client.get('/wikipedia/article/search/?q=mars')
+        self.mars.text = 'Red planet with two moons'
+        self.mars.title = 'Red planet'
+        self.mars.save()
+        response = self.client.get('/wikipedia/article/search/?q=moons')
+        self.assertEqual([a['slug'] for a in response.data], ['mars'])
+        self.venus.delete()
+        response = self.client.get('/wikipedia/article/search/?q=mars')
+        self.assertEqual(response.data, [])
+
+    def test_list_filter(self):
+        response = self.client.get('/wikipedia/homepage/?q=sister')
+        self.assertEqual([a['slug'] for a in response.data['results']], ['venus'])
+
+    def test_headlines_are_escaped(self):
+        self.mars.text = 'Mars <script>alert(1)</script> & moons'
+        self.mars.save()
+        response = self.client.get('/wikipedia/article/search/?q=mars')
+        self.assertEqual(
+            response.data[0]['headline'],
+            '<mark>Mars</mark> &lt;script&gt;alert(1)&lt;/script&gt; &amp; moons'
+        )
+        # разметка ts_headline (PostgreSQL) приводится к тому же виду
+        headline = f'{search.HEADLINE_START}Mars{search.HEADLINE_STOP} <script>alert(1)</script> & moons'
+        self.assertEqual(search.escape_headline(headline), response.data[0]['headline'])
+
+    def test_reverse_tag_change_reindexes_in_constant_queries(self):
+        search.index.build()
+        counts = []
+        for title, articles in [('rocks', [self.mars]), ('worlds', [self.mars, self.venus])]:
+            tag = Tag.objects.create(title=title)
+            with CaptureQueriesContext(connection) as queries:
+                tag.articles.add(*articles)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CategoryTreeTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', 'author@mail.com', 'password')
+        cls.science = Category.objects.create(title='Science')
+        cls.physics = Category.objects.create(title='Physics', parent_category=cls.science)
+        cls.optics = Category.objects.create(title='Optics', parent_category=cls.physics)
+        cls.art = Category.objects.create(title='Art')
+        for category in (cls.science, cls.physics, cls.optics, cls.art):
+            Article.objects.create(
+                user=cls.user, title=category.title, slug=category.slug,
+                text='text', image='image.jpg', category=category
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_paths(self):
+        self.assertEqual(self.optics.path, 'science/physics/optics/')
+        self.assertEqual(self.optics.depth, 2)
+
+    def test_tree(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/wikipedia/categories/tree/')
+        science = next(node for node in response.data if node['slug'] == 'science')
+        self.assertEqual(science['subcategories'][0]['subcategories'][0]['slug'], 'optics')
+
+    def test_breadcrumbs(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/wikipedia/categories/optics/breadcrumbs/')
+        self.assertEqual([c['slug'] for c in response.data], ['science', 'physics', 'optics'])
+
+    def test_subtree_articles(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/wikipedia/categories/physics/articles/')
+        self.assertEqual([a['slug'] for a in response.data['results']], ['physics', 'optics'])
+
+    def test_move_rewrites_subtree(self):
+        self.physics.parent_category = self.art
+        self.physics.save()
+        self.optics.refresh_from_db()
+        self.assertEqual(self.optics.path, 'art/physics/optics/')
+        self.assertEqual(self.optics.depth, 2)
+
+    def test_move_under_descendant_is_rejected(self):
+        self.science.parent_category = self.optics
+        with self.assertRaises(ValueError):
+            self.science.save()
+
+    def test_delete_reroots_children(self):
+        self.physics.delete()
+        self.optics.refresh_from_db()
+        self.assertIsNone(self.optics.parent_category)
+        self.assertEqual(self.optics.path, 'optics/')
+        self.assertEqual(self.optics.depth, 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TagIndexTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', 'author@mail.com', 'password')
+        cls.category = Category.objects.create(title='Science')
+        cls.tags = [
+            Tag.objects.create(title=title, slug=slug)
+            for title, slug in [('Python', 'python'), ('Pyramids', 'pyramids'), ('Физика', 'fizika')]
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        patcher = mock.patch('apps.articles.tasks.process_article_images.delay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_article(self, *tags):
+        # счётчики пересчитываются после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            article = Article.objects.create(
+                user=self.user, title=f'Article {Article.objects.count()}', text='text',
+                image='article_images/image.jpg', category=self.category
+            )
+            article.tag.set(tags)
+        return article
+
+    def counts(self):
+        return dict(Tag.objects.values_list('slug', 'articles_count'))
+
+    def test_counts_follow_tag_changes(self):
+        python, pyramids, physics = self.tags
+        first = self.create_article(python, physics)
+        self.create_article(python)
+        self.assertEqual(self.counts(), {'python': 2, 'pyramids': 0, 'fizika': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            first.tag.remove(physics)
+            pyramids.articles.add(first)
+            # до коммита счётчики не трогаются
+            self.assertEqual(self.counts(), {'python': 2, 'pyramids': 0, 'fizika': 1})
+        self.assertEqual(self.counts(), {'python': 2, 'pyramids': 1, 'fizika': 0})
+        with self.captureOnCommitCallbacks(execute=True):
+            first.tag.clear()
+        self.assertEqual(self.counts(), {'python': 1, 'pyramids': 0, 'fizika': 0})
+        with self.captureOnCommitCallbacks(execute=True):
+            python.articles.first().delete()
+        self.assertEqual(self.counts(), {'python': 0, 'pyramids': 0, 'fizika': 0})
+
+    def test_autocomplete(self):
+        python, pyramids, _ = self.tags
+        self.create_article(pyramids)
+        response = self.client.get('/wikipedia/tags/autocomplete/', {'q': 'py'})
+        self.assertEqual([tag['slug'] for tag in response.data], ['pyramids', 'python'])
+        response = self.client.get('/wikipedia/tags/autocomplete/', {'q': 'фИз'})
+        self.assertEqual([tag['slug'] for tag in response.data], ['fizika'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(title='Pygame', slug='pygame')
+        response = self.client.get('/wikipedia/tags/autocomplete/', {'q': 'pyg'})
+        self.assertEqual([tag['slug'] for tag in response.data], ['pygame'])
+
+    def test_cloud(self):
+        python, pyramids, _ = self.tags
+        for _ in range(4):
+            self.create_article(python)
+        self.create_article(pyramids)
+        response = self.client.get('/wikipedia/tags/cloud/')
+        self.assertEqual(
+            [(tag['slug'], tag['articles_count'], tag['weight']) for tag in response.data],
+            [('pyramids', 1, 1), ('python', 4, 5)]
+        )
+
+    def test_duplicate_title_is_rejected(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/wikipedia/tags/', {'title': 'Python'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(DATABASE_REPLICAS=['replica0'])
+class ReplicaRouterTestCase(SimpleTestCase):
+    router = db.ReplicaRouter()
+
+    def test_reads_use_primary_by_default(self):
+        self.assertEqual(self.router.db_for_read(Article), 'default')
+
+    def test_replica_reads(self):
+        token = db._replica_reads.set(True)
+        try:
+            self.assertEqual(self.router.db_for_read(Article), 'replica0')
+            self.assertEqual(self.router.db_for_write(Article), 'default')
+        finally:
+            db._replica_reads.reset(token)
+
+    def test_migrations_skip_replicas(self):
+        self.assertFalse(self.router.allow_migrate('replica0', 'articles'))
+        self.assertTrue(self.router.allow_migrate('default', 'articles'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, DATABASE_REPLICAS=['replica0'])
+class ReadAfterWriteTestCase(TransactionTestCase):
+    # в TestCase запрос идёт внутри atomic, и роутер всегда читает с default
+    def setUp(self):
+        patcher = mock.patch('apps.articles.tasks.process_article_images.delay')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('author', 'author@mail.com', 'password')
+        category = Category.objects.create(title='Science')
+        self.article = Article.objects.create(
+            user=self.user, title='Article', text='text',
+            image='article_images/image.jpg', category=category
+        )
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_write_pins_user_to_primary(self):
+        self.assertFalse(db.is_pinned(self.user))
+        response = self.client.post(
+            f'/wikipedia/article/{self.article.pk}/comment/', {'text': 'comment'}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(db.is_pinned(self.user))
+        # закреплённый пользователь читает с default, реплика не нужна
+        response = self.client.get(f'/wikipedia/article/{self.article.pk}/comments/')
+        self.assertEqual(len(response.data['results']), 1)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    ARTICLE_VIEWS_BUFFER='memory',
+    ARTICLE_VIEWS_FLUSH_INTERVAL=3600,
+    COMPRESSION_MIN_SIZE=500
+)
+class ResponseEncodingTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('author', 'author@mail.com', 'password')
+        category = Category.objects.create(title='Science')
+        cls.article = Article.objects.create(
+            user=user, title='Статья', text='текст ' * 500,
+            image='article_images/image.jpg', category=category
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = f'/wikipedia/article/{self.article.pk}/'
+
+    def test_renderer_matches_stdlib(self):
+        data = self.client.get(self.url).data
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_gzip_is_negotiated(self):
+        plain = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(response['ETag'].startswith('W/'))
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.client.get('/wikipedia/tags/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    ARTICLE_VIEWS_BUFFER='memory',
+    ARTICLE_VIEWS_FLUSH_INTERVAL=3600
+)
+class AsyncReadTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('author', 'author@mail.com', 'password')
+        category = Category.objects.create(title='Science')
+        Category.objects.create(title='Physics', parent_category=category)
+        tags = [Tag.objects.create(title=f'tag {i}') for i in range(3)]
+        cls.articles = []
+        for i in range(3):
+            article = Article.objects.create(
+                user=user, title=f'Article {i}', text='text',
+                image='article_images/image.jpg', category=category, views_count=i
+            )
+            article.tag.set(tags[:i + 1])
+            cls.articles.append(article)
+        cls.article = cls.articles[-1]
+        ArticleImage.objects.create(article=cls.article, image='article_images/carousel/1.jpg')
+        for i in range(3):
+            Comment.objects.create(user=user, post=cls.article, text=f'comment {i}')
+        cls.tag = tags[0]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_responses_match_sync_views(self):
+        pairs = [
+            ('article/', {}),
+            ('article/', {'ordering': '-views_count', 'page_size': 1}),
+            ('article/', {'tag': self.tag.pk}),
+            ('article/', {'q': 'tag 2'}),
+            ('article/', {'q': 'missing'}),
+            (f'article/{self.article.pk}/', {}),
+            ('homepage/', {'page_size': 2}),
+            ('tags/', {}),
+            ('tags/', {'limit': 10, 'offset': 1}),
+            ('categories/', {}),
+        ]
+        for path, params in pairs:
+            expected = self.client.get(f'/wikipedia/{path}', params)
+            response = self.client.get(f'/wikipedia/async/{path}', params)
+            self.assertEqual(response.status_code, 200, path)
+            # ссылки пагинации ведут на тот же вариант эндпоинта
+            content = response.content.decode().replace('/wikipedia/async/', '/wikipedia/')
+            self.assertEqual(json.loads(content), expected.json(), (path, params))
+
+    def test_search_query_filters_list(self):
+        response = self.client.get('/wikipedia/async/article/', {'q': 'tag 2'})
+        self.assertEqual([a['slug'] for a in response.json()['results']], [self.article.slug])
+
+    def test_cache_is_per_host(self):
+        self.client.get('/wikipedia/async/tags/', HTTP_HOST='one.example.com')
+        # count и страница
+        with self.assertNumQueries(2):
+            response = self.client.get('/wikipedia/async/tags/', HTTP_HOST='two.example.com')
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail_fetches_parts_once(self):
+        url = f'/wikipedia/async/article/{self.article.pk}/'
+        # статья, теги, карусель и комментарии - по одному запросу
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        data = response.json()
+        self.assertEqual(len(data['tag']), 3)
+        self.assertEqual(len(data['carousel']), 1)
+        self.assertEqual(len(data['comments']), 3)
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+        self.assertEqual(cached.content, response.content)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    async def test_errors_match_sync_views(self):
+        for path in ['article/missing/', 'article/?tag=missing', 'article/?cursor=broken']:
+            expected = await sync_to_async(self.client.get)(f'/wikipedia/{path}')
+            response = await self.async_client.get(f'/wikipedia/async/{path}')
+            self.assertEqual(response.status_code, expected.status_code, path)
+            self.assertEqual(response.json(), expected.json(), path)
+
+    def test_change_invalidates_async_cache(self):
+        url = f'/wikipedia/async/article/{self.article.pk}/'
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(user=self.article.user, post=self.article, text='new comment')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['comments']), 4)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, ARTICLE_REVISION_SNAPSHOT_INTERVAL=8)
+class ArticleRevisionTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', 'author@mail.com', 'password')
+        category = Category.objects.create(title='Science')
+        cls.article = Article.objects.create(
+            user=cls.user, title='Article', text='first line\nsecond line\n',
+            image='article_images/image.jpg', category=category
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/wikipedia/article/{self.article.pk}/'
+
+    def edit(self, text):
+        previous = (self.article.title, self.article.text)
+        self.article.text = text
+        self.article.save()
+        return revisions.record(self.article, self.user, previous)
+
+    def test_chain_is_logarithmic(self):
+        self.assertIsNone(revisions.base_number(1))
+        self.assertIsNone(revisions.base_number(9))
+        self.assertEqual(revisions.chain(8), [8, 7, 5, 1])
+        self.assertEqual(revisions.chain(16), [16, 15, 13, 9])
+        self.assertTrue(all(len(revisions.chain(n)) <= 4 for n in range(1, 100)))
+
+    def test_delta_round_trip(self):
+        base = 'a\nb\nc\nd'
+        for text in ['a\nb\nc\nd', 'a\nc\nd\ne', '', 'x\n' * 5, 'a\nb\nc\nd\n']:
+            self.assertEqual(revisions.apply_delta(base, revisions.encode_delta(base, text)), text)
+
+    def test_update_records_revisions(self):
+        self.client.patch(self.url, {'text': 'first line\nchanged line\n'})
+        self.client.patch(self.url, {'title': 'Article'})
+        response = self.client.get(f'{self.url}revisions/')
+        self.assertEqual([item['number'] for item in response.data['results']], [2, 1])
+        self.assertEqual(response.data['results'][0]['user'], 'author')
+
+        first = self.client.get(f'{self.url}revisions/1/')
+        self.assertEqual(first.data['text'], 'first line\nsecond line\n')
+        diff = self.client.get(f'{self.url}diff/').data
+        self.assertEqual((diff['from'], diff['to']), (1, 2))
+        self.assertIn('-second line\n+changed line', diff['diff'])
+        self.assertEqual(self.client.get(f'{self.url}revisions/3/').status_code, 404)
+        self.assertEqual(self.client.get(f'{self.url}diff/?from=x').status_code, 400)
+
+    def test_every_article_viewset_records_revisions(self):
+        self.client.patch(f'/wikipedia/homepage/{self.article.pk}/', {'title': 'Homepage title'})
+        self.client.patch(f'/wikipedia/article_filter/{self.article.pk}/', {'text': 'filter text'})
+        titles = list(self.article.revisions.order_by('number').values_list('title', flat=True))
+        self.assertEqual(titles, ['Article', 'Homepage title', 'Homepage title'])
+        self.assertEqual(revisions.reconstruct(self.article.pk, 3)[1], 'filter text')
+
+    def test_failed_revision_rolls_back_update(self):
+        with mock.patch.object(revisions, 'record', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.patch(self.url, {'text': 'lost text\n'})
+        self.article.refresh_from_db()
+        self.assertEqual(self.article.text, 'first line\nsecond line\n')
+
+    def test_compaction_keeps_every_revision(self):
+        texts = [self.article.text]
+        for i in range(20):
+            text = ''.join(f'line {j}\n' for j in range(40)) + f'edit {i}\n'
+            texts.append(text if i % 7 else text.upper())
+            self.edit(texts[-1])
+        with override_settings(ARTICLE_REVISION_COMPACT_BATCH=5):
+            compact_article_revisions()
+        kinds = dict(self.article.revisions.values_list('number', 'kind'))
+        self.assertNotIn(ArticleRevision.PENDING, kinds.values())
+        self.assertEqual(kinds[1], ArticleRevision.SNAPSHOT)
+        self.assertEqual(kinds[12], ArticleRevision.DELTA)
+        # правка, переписавшая весь текст, остаётся полной копией
+        self.assertEqual(kinds[10], ArticleRevision.SNAPSHOT)
+        with self.assertNumQueries(1):
+            rebuilt = revisions.reconstruct_many(self.article.pk, range(1, len(texts) + 1))
+        self.assertEqual([rebuilt[n][1] for n in range(1, len(texts) + 1)], texts)
+
+    def test_interval_change_keeps_stored_chains(self):
+        texts = [self.article.text]
+        for i in range(12):
+            texts.append(''.join(f'line {j}\n' for j in range(40)) + f'edit {i}\n')
+            self.edit(texts[-1])
+        compact_article_revisions()
+        self.assertEqual(self.article.revisions.get(number=12).base, 11)
+        with override_settings(ARTICLE_REVISION_SNAPSHOT_INTERVAL=5):
+            rebuilt = revisions.reconstruct_many(self.article.pk, range(1, len(texts) + 1))
+        self.assertEqual([rebuilt[n][1] for n in range(1, len(texts) + 1)], texts)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TRENDING_HALF_LIFE_HOURS=24, TRENDING_RING_HOURS=48)
+class TrendingTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('author', 'author@mail.com', 'password')
+        cls.science = Category.objects.create(title='Science')
+        cls.history = Category.objects.create(title='History')
+        cls.old, cls.fresh, cls.other = [
+            Article.objects.create(
+                user=user, title=title, text='text', image='article_images/image.jpg',
+                category=category
+            )
+            for title, category in [
+                ('Old', cls.science), ('Fresh', cls.science), ('Other', cls.history)
+            ]
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.now = time.time()
+
+    def add_views(self, deltas, hours_ago=0):
+        now = self.now - hours_ago * 3600
+        Article.objects.update(trending_score=trending.score_update(deltas, now))
+        trending.record_buckets(deltas, now)
+
+    def test_old_views_decay(self):
+        self.add_views({self.old.pk: 100}, hours_ago=72)
+        self.add_views({self.fresh.pk: 20, self.other.pk: 5})
+        articles = trending.trending_articles(10, now=self.now)
+        self.assertEqual([a.pk for a in articles], [self.fresh.pk, self.old.pk, self.other.pk])
+        # 100 просмотров трое суток назад весят как 12.5 сейчас
+        self.assertAlmostEqual(articles[1].score, 12.5, places=6)
+        self.assertEqual(articles[1].recent_views, 0)
+
+    def test_score_accumulates_incrementally(self):
+        self.add_views({self.fresh.pk: 3}, hours_ago=24)
+        self.add_views({self.fresh.pk: 5})
+        [article] = trending.trending_articles(10, now=self.now)
+        self.assertAlmostEqual(article.score, 6.5, places=6)
+        self.assertEqual(article.recent_views, 5)
+
+    def test_ring_buffer_reuses_slots(self):
+        self.add_views({self.fresh.pk: 2})
+        self.add_views({self.fresh.pk: 3})
+        self.add_views({self.fresh.pk: 7}, hours_ago=48)
+        self.add_views({self.fresh.pk: 4}, hours_ago=1)
+        # 48 часов назад - тот же слот, его значение затёрто более поздним часом
+        buckets = dict(self.fresh.view_buckets.values_list('hour', 'views'))
+        hour = int(self.now // 3600)
+        self.assertEqual(buckets, {hour: 5, hour - 1: 4})
+        self.assertEqual(trending.recent_views([self.fresh.pk], self.now), {self.fresh.pk: 9})
+
+    @override_settings(ARTICLE_VIEWS_BUFFER='memory')
+    def test_flushed_views_feed_trending(self):
+        counters.apply_view_deltas({self.other.pk: 3})
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.views_count, 3)
+        self.assertGreater(self.other.trending_score, 0)
+
+    def test_endpoint_filters_by_category(self):
+        physics = Category.objects.create(title='Physics', parent_category=self.science)
+        nested = Article.objects.create(
+            user=self.old.user, title='Nested', text='text', image='article_images/image.jpg',
+            category=physics
+        )
+        self.add_views({self.old.pk: 1, self.fresh.pk: 2, self.other.pk: 3, nested.pk: 4})
+        with self.assertNumQueries(2):
+            response = self.client.get('/wikipedia/homepage/trending/', {'category': self.science.pk})
+        self.assertEqual(
+            [item['slug'] for item in response.data], [nested.pk, self.fresh.pk, self.old.pk]
+        )
+        self.assertEqual(response.data[1]['recent_views'], 2)
+        response = self.client.get('/wikipedia/homepage/trending/', {'category': physics.pk})
+        self.assertEqual([item['slug'] for item in response.data], [nested.pk])
+        response = self.client.get('/wikipedia/homepage/trending/', {'limit': 1})
+        self.assertEqual([item['slug'] for item in response.data], [nested.pk])
+
+
+class RelatedArticlesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', 'author@mail.com', 'password')
+        category = Category.objects.create(title='Misc')
+        python, history, food = [Tag.objects.create(title=title) for title in ('python', 'history', 'food')]
+        cls.articles = {}
+        for slug, title, text, tag in [
+            ('generators', 'Python generators', 'python generators yield lazy iterators', python),
+            ('iterators', 'Python iterators', 'python iterators protocol lazy generators', python),
+            ('legions', 'Roman legions', 'roman legions empire history', history),
+            ('roads', 'Roman roads', 'roman roads empire engineering', history),
+            ('pasta', 'Cooking pasta', 'pasta boiling water salt', food),
+            ('bread', 'Baking bread', 'bread flour water yeast', food),
+        ]:
+            article = Article.objects.create(
+                slug=slug, user=cls.user, title=title, text=text,
+                image='article_images/image.jpg', category=category
+            )
+            article.tag.add(tag)
+            cls.articles[slug] = article
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def neighbours(self, slug):
+        return list(
+            RelatedArticle.objects.filter(article_id=slug).order_by('-score').values_list('related_id', flat=True)
+        )
+
+    def test_batched_scores_match_direct_computation(self):
+        corpus = related.Corpus.load()
+        rows = np.arange(len(corpus.slugs))
+        texts = np.zeros(corpus.texts.shape)
+        for row in rows:
+            start, end = corpus.texts.indptr[row], corpus.texts.indptr[row + 1]
+            texts[row, corpus.texts.indices[start:end]] = corpus.texts.data[start:end]
+        np.testing.assert_allclose(corpus.texts.products(rows), texts @ texts.T)
+        with self.settings(RELATED_BATCH_CELLS=len(rows) * 2):
+            batches = list(corpus.batches(rows))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 2])
+        np.testing.assert_allclose(
+            np.vstack([corpus.scores(batch) for batch in batches]), corpus.scores(rows)
+        )
+
+    def test_rebuild_ranks_by_text_and_tags(self):
+        self.assertEqual(related.rebuild(), 6)
+        self.assertEqual(self.neighbours('generators'), ['iterators'])
+        self.assertEqual(self.neighbours('legions'), ['roads'])
+        self.assertEqual(self.neighbours('pasta'), ['bread'])
+        self.assertFalse(Article.objects.filter(related_built_at__isnull=True).exists())
+
+    def test_refresh_updates_only_changed_articles(self):
+        related.rebuild()
+        self.assertEqual(related.refresh(), 0)
+        bread = self.articles['bread']
+        bread.text = 'bread with roman legions history'
+        bread.save()
+        related.refresh()
+        self.assertEqual(self.neighbours('bread')[0], 'legions')
+        # пересчитан и top-K статей, в который bread теперь входит
+        self.assertIn('bread', self.neighbours('legions'))
+        self.assertEqual(self.neighbours('generators'), ['iterators'])
+
+    def test_refresh_tokenizes_only_dirty_articles(self):
+        related.rebuild()
+        bread = self.articles['bread']
+        bread.text = 'bread with roman legions history'
+        bread.save()
+        with mock.patch.object(related, 'count_terms', wraps=related.count_terms) as count_terms:
+            corpus = related.Corpus.load(related.dirty_slugs())
+        self.assertEqual(count_terms.call_count, 1)
+        self.assertEqual(list(corpus.recounted), ['bread'])
+        # веса из сохранённых частот совпадают с полным пересчётом
+        full = related.Corpus.load()
+        self.assertEqual(corpus.slugs, full.slugs)
+        np.testing.assert_allclose(
+            corpus.scores(np.arange(len(corpus.slugs))), full.scores(np.arange(len(full.slugs)))
+        )
+
+    def test_tag_change_marks_article_dirty(self):
+        related.rebuild()
+        self.articles['pasta'].tag.set([Tag.objects.get(title='python')])
+        self.assertEqual(related.dirty_slugs(), ['pasta'])
+        related.refresh()
+        self.assertIn('generators', self.neighbours('pasta'))
+
+    def test_deleted_article_is_replaced(self):
+        related.rebuild()
+        self.articles['roads'].delete()
+        self.assertIn('legions', related.dirty_slugs())
+        related.refresh()
+        self.assertNotIn('roads', self.neighbours('legions'))
+
+    def test_endpoint(self):
+        related.rebuild()
+        with self.assertNumQueries(2):
+            response = self.client.get('/wikipedia/article/generators/related/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['slug'] for item in response.data], ['iterators'])
+        self.assertEqual(set(response.data[0]), {'user', 'title', 'image', 'slug', 'score'})
+        # refresh сбрасывает кэш ответа
+        self.articles['pasta'].tag.set([Tag.objects.get(title='python')])
+        with self.captureOnCommitCallbacks(execute=True):
+            related.refresh()
+        response = self.client.get('/wikipedia/article/generators/related/')
+        self.assertEqual([item['slug'] for item in response.data], ['iterators', 'pasta'])
+        response = self.client.get('/wikipedia/article/missing/related/')
+        self.assertEqual(response.status_code, 404)
+
+
+class ViewBufferTestCase(FakeRedisMixin, TestCase):
+    redis_modules = (counters, )
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('author', 'author@mail.com', 'password')
+        category = Category.objects.create(title='Misc')
+        cls.first, cls.second = [
+            Article.objects.create(
+                user=user, title=title, text='text', image='article_images/image.jpg', category=category
+            )
+            for title in ('First', 'Second')
+        ]
+
+    def setUp(self):
+        super().setUp()
+        counters._pending.clear()
+
+    def views(self):
+        return dict(Article.objects.values_list('slug', 'views_count'))
+
+    @override_settings(ARTICLE_VIEWS_BUFFER='memory', ARTICLE_VIEWS_FLUSH_INTERVAL=3600)
+    def test_memory_buffer(self):
+        for slug in (self.first.pk, self.first.pk, self.second.pk):
+            counters.record_view(slug)
+        self.assertEqual(self.views(), {self.first.pk: 0, self.second.pk: 0})
+        self.assertEqual(counters.flush_views(), {self.first.pk: 2, self.second.pk: 1})
+        self.assertEqual(self.views(), {self.first.pk: 2, self.second.pk: 1})
+        self.assertEqual(counters.flush_views(), {})
+
+    @override_settings(ARTICLE_VIEWS_BUFFER='memory', ARTICLE_VIEWS_FLUSH_INTERVAL=3600)
+    def test_memory_buffer_keeps_views_on_failure(self):
+        counters.record_view(self.first.pk)
+        with mock.patch.object(counters, 'apply_view_deltas', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                counters.flush_memory_views()
+        self.assertEqual(counters.flush_memory_views(), {self.first.pk: 1})
+
+    @override_settings(ARTICLE_VIEWS_BUFFER='redis')
+    def test_redis_buffer(self):
+        for slug in (self.first.pk, self.second.pk, self.second.pk):
+            counters.record_view(slug)
+        self.assertEqual(counters.flush_views(), {self.first.pk: 1, self.second.pk: 2})
+        self.assertEqual(self.views(), {self.first.pk: 1, self.second.pk: 2})
+        self.assertEqual(self.redis.keys('articles:views*'), [])
+        # статью удалили, пока её просмотры ждали сброса
+        counters.record_view('deleted')
+        self.assertEqual(counters.flush_views(), {'deleted': 1})
+        self.assertEqual(self.views(), {self.first.pk: 1, self.second.pk: 2})
+
+    @override_settings(ARTICLE_VIEWS_BUFFER='redis')
+    def test_overlapping_flush_is_skipped(self):
+        counters.record_view(self.first.pk)
+        self.redis.set(counters.VIEWS_FLUSH_LOCK_KEY, 'other worker')
+        self.assertEqual(counters.flush_redis_views(), {})
+        self.assertEqual(self.views()[self.first.pk], 0)
+        self.redis.delete(counters.VIEWS_FLUSH_LOCK_KEY)
+        self.assertEqual(counters.flush_redis_views(), {self.first.pk: 1})
+
+    @override_settings(ARTICLE_VIEWS_BUFFER='redis')
+    def test_replay_after_crash_is_not_applied_twice(self):
+        counters.record_view(self.first.pk)
+        # воркер упал после коммита, не успев удалить хэш
+        delete = self.redis.delete
+
+        def crash_once(*keys):
+            if counters.VIEWS_FLUSHING_KEY in keys:
+                raise RuntimeError
+            return delete(*keys)
+
+        with mock.patch.object(self.redis, 'delete', side_effect=crash_once):
+            with self.assertRaises(RuntimeError):
+                counters.flush_redis_views()
+        self.assertTrue(self.redis.exists(counters.VIEWS_FLUSHING_KEY))
+        self.assertFalse(self.redis.exists(counters.VIEWS_FLUSH_LOCK_KEY))
+        counters.record_view(self.second.pk)
+        self.assertEqual(counters.flush_redis_views(), {})
+        self.assertEqual(counters.flush_redis_views(), {self.second.pk: 1})
+        self.assertEqual(self.views(), {self.first.pk: 1, self.second.pk: 1})
+        self.assertEqual(ArticleViewFlush.objects.count(), 1)
+
+    @override_settings(
+        ARTICLE_VIEWS_BUFFER='memory', ARTICLE_VIEWS_FLUSH_INTERVAL=3600, CACHES=LOCMEM_CACHES
+    )
+    def test_flush_invalidates_cached_responses(self):
+        cache.clear()
+        url = f'/wikipedia/article/{self.first.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response.data['views_count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            counters.flush_views()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['views_count'], 1)
+
+
+@override_settings(ARTICLE_VIEWS_BUFFER='memory', ARTICLE_VIEWS_FLUSH_INTERVAL=3600)
+class LeaderboardTestCase(FakeRedisMixin, TestCase):
+    redis_modules = (leaderboard, )
+
+    def setUp(self):
+        super().setUp()
+        # статьи создаются после подмены Redis, чтобы сигналы заполнили лидерборды
+        user = User.objects.create_user('author', 'author@mail.com', 'password')
+        self.science = Category.objects.create(title='Science')
+        self.history = Category.objects.create(title='History')
+        self.space = Tag.objects.create(title='space', slug='space')
+        self.mars, self.venus, self.rome = [
+            Article.objects.create(
+                user=user, title=title, slug=title.lower(), text='text',
+                image='article_images/image.jpg', category=category, views_count=views
+            )
+            for title, category, views in [
+                ('Mars', self.science, 5), ('Venus', self.science, 3), ('Rome', self.history, 4)
+            ]
+        ]
+        self.mars.tag.add(self.space)
+        self.venus.tag.add(self.space)
+
+    def board(self, key):
+        return self.redis.zrevrange(key, 0, -1, withscores=True)
+
+    def test_sync_article(self):
+        self.assertEqual(self.board(leaderboard.TOP_KEY), [('mars', 5), ('rome', 4), ('venus', 3)])
+        self.assertEqual(self.board(f'{leaderboard.TOP_KEY}:category:{self.science.pk}'), [('mars', 5), ('venus', 3)])
+        self.assertEqual(self.board(f'{leaderboard.TOP_KEY}:tag:space'), [('mars', 5), ('venus', 3)])
+        self.venus.tag.remove(self.space)
+        self.assertEqual(self.board(f'{leaderboard.TOP_KEY}:tag:space'), [('mars', 5)])
+        self.rome.delete()
+        self.assertEqual(self.board(leaderboard.TOP_KEY), [('mars', 5), ('venus', 3)])
+        self.assertFalse(self.redis.exists(leaderboard.MEMBERSHIP_KEY.format(slug='rome')))
+
+    def test_increment(self):
+        self.redis.delete(leaderboard.MEMBERSHIP_KEY.format(slug='rome'))
+        leaderboard.increment({'venus': 4, 'rome': 2})
+        self.assertEqual(self.board(f'{leaderboard.TOP_KEY}:tag:space'), [('venus', 7), ('mars', 5)])
+        # статьи без членства синхронизируются из БД
+        self.assertEqual(self.board(f'{leaderboard.TOP_KEY}:category:{self.history.pk}'), [('rome', 4)])
+
+    def test_top_articles(self):
+        self.assertEqual([a.pk for a in leaderboard.top_articles(2)], ['mars', 'rome'])
+        self.assertIn('text', leaderboard.top_articles(1)[0].get_deferred_fields())
+        self.assertEqual(
+            [a.pk for a in leaderboard.top_articles(10, category=self.history.pk)], ['rome']
+        )
+        self.assertEqual([a.pk for a in leaderboard.top_articles(10, tag='space')], ['mars', 'venus'])
+
+    def test_rebuild_replaces_boards(self):
+        self.redis.zadd(leaderboard.TOP_KEY, {'mars': 100})
+        self.redis.zadd(f'{leaderboard.TOP_KEY}:tag:deleted', {'mars': 5})
+        self.redis.sadd(leaderboard.MEMBERSHIP_KEY.format(slug='deleted'), leaderboard.TOP_KEY)
+        leaderboard.rebuild()
+        self.assertEqual(self.board(leaderboard.TOP_KEY), [('mars', 5), ('rome', 4), ('venus', 3)])
+        self.assertEqual(self.board(f'{leaderboard.TOP_KEY}:tag:space'), [('mars', 5), ('venus', 3)])
+        self.assertFalse(self.redis.exists(f'{leaderboard.TOP_KEY}:tag:deleted'))
+        self.assertFalse(self.redis.exists(leaderboard.MEMBERSHIP_KEY.format(slug='deleted')))
+        self.assertEqual(self.redis.keys('articles:rebuild*'), [])
+        self.assertEqual(self.redis.ttl(leaderboard.TOP_KEY), -1)
+
+    def test_rebuild_keeps_live_boards_and_increments(self):
+        board_keys = leaderboard.board_keys
+        calls = []
+
+        def read_article(category_id, tag_slugs):
+            calls.append(category_id)
+            if len(calls) == 3:
+                # сборка идёт: читатели видят прежний лидерборд, просмотры уже
+                # прочитанной статьи не теряются
+                self.assertEqual(len(self.board(leaderboard.TOP_KEY)), 3)
+                leaderboard.increment({'mars': 10})
+            return board_keys(category_id, tag_slugs)
+
+        with mock.patch.object(leaderboard, 'board_keys', side_effect=read_article), \
+                mock.patch.object(leaderboard, 'REBUILD_CHUNK', 1):
+            leaderboard.rebuild()
+        self.assertEqual(self.board(leaderboard.TOP_KEY), [('mars', 15), ('rome', 4), ('venus', 3)])
+
+
+def image_file(name, size=(20, 10), color='red'):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue(), name=name)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, IMAGE_VARIANT_WIDTHS=(8, 16))
+class ImageVariantsTestCase(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        media_root = self.settings(MEDIA_ROOT=media)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.user = User.objects.create_user('author', 'author@mail.com', 'password')
+        self.article = Article.objects.create(
+            user=self.user, title='Photo', text='text', image=image_file('photo.png'),
+            category=Category.objects.create(title='Misc')
+        )
+
+    def exists(self, name):
+        return self.article.image.storage.exists(name)
+
+    def test_builds_variants(self):
+        process_article_images(self.article.pk)
+        self.article.refresh_from_db()
+        widths = self.article.image_variants['widths']
+        self.assertEqual(sorted(widths, key=int), ['8', '16'])
+        self.assertEqual(self.article.thumbnail.name, widths['8'])
+        self.assertTrue(all(self.exists(name) for name in widths.values()))
+        with Image.open(self.article.image.storage.path(widths['16'])) as variant:
+            self.assertEqual((variant.format, variant.width), ('WEBP', 16))
+        response = APIClient().get(f'/wikipedia/article/{self.article.pk}/')
+        self.assertEqual(len(response.data['srcset'].split(', ')), 2)
+
+    def test_replaced_image_drops_old_variants(self):
+        process_article_images(self.article.pk)
+        self.article.refresh_from_db()
+        old = list(self.article.image_variants['widths'].values())
+        self.article.image = image_file('other.png', color='blue')
+        self.article.save()
+        process_article_images(self.article.pk)
+        self.article.refresh_from_db()
+        self.assertFalse(any(self.exists(name) for name in old))
+        self.assertTrue(all(self.exists(name) for name in self.article.image_variants['widths'].values()))
+
+    def test_delete_removes_variants(self):
+        image = ArticleImage.objects.create(article=self.article, image=image_file('slide.png'))
+        process_article_images(self.article.pk)
+        self.article.refresh_from_db()
+        image.refresh_from_db()
+        names = [*self.article.image_variants['widths'].values(), *image.variants['widths'].values()]
+        self.assertEqual(len(names), 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.article.delete()
+        self.assertFalse(any(self.exists(name) for name in names))
+
+    def test_broken_image_does_not_block_carousel(self):
+        storage = self.article.image.storage
+        with storage.open(self.article.image.name, 'wb') as broken:
+            broken.write(b'not an image')
+        image = ArticleImage.objects.create(article=self.article, image=image_file('slide.png'))
+        with self.assertLogs('apps.articles.tasks', 'WARNING'):
+            process_article_images(self.article.pk)
+        self.article.refresh_from_db()
+        image.refresh_from_db()
+        self.assertEqual(self.article.image_variants, {})
+        self.assertEqual(sorted(image.variants['widths'], key=int), ['8', '16'])
+
+    def test_homepage_serves_thumbnail_and_accepts_new_image(self):
+        process_article_images(self.article.pk)
+        self.article.refresh_from_db()
+        client = APIClient()
+        url = f'/wikipedia/homepage/{self.article.pk}/'
+        self.assertTrue(client.get(url).data['image'].endswith(self.article.thumbnail.name))
+        client.force_authenticate(self.user)
+        response = client.patch(url, {'image': image_file('other.png')}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.article.refresh_from_db()
+        self.assertIn('other', self.article.image.name)
+
+
+class ImportExportTestCase(FakeRedisMixin, TestCase):
+    redis_modules = (leaderboard,)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', 'author@mail.com', 'password')
+        science = Category.objects.create(title='Science')
+        physics = Category.objects.create(title='Physics', parent_category=science)
+        cls.optics = Category.objects.create(title='Optics', parent_category=physics)
+        # слаги длиннее Tag.title и совпадают в первых 30 символах
+        cls.long_tags = [
+            Tag.objects.create(title=f'Long {i}', slug=f'{"x" * 30}-{i}') for i in range(2)
+        ]
+        cls.article = Article.objects.create(
+            user=cls.user, title='Lenses', slug='lenses', text='text',
+            image='image.jpg', category=cls.optics
+        )
+        cls.article.tag.set(cls.long_tags)
+        Article.objects.filter(pk='lenses').update(created_at='2020-01-02T03:04:05Z')
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def round_trip(self, name):
+        path = f'{self.directory}/{name}'
+        call_command('export_articles', path, stderr=StringIO())
+        Article.objects.all().delete()
+        Category.objects.all().delete()
+        Tag.objects.all().delete()
+        call_command('import_articles', path, stdout=StringIO(), stderr=StringIO())
+        return Article.objects.get(pk='lenses')
+
+    def test_jsonl_round_trip(self):
+        article = self.round_trip('articles.jsonl')
+        self.assertEqual(article.created_at.isoformat(), '2020-01-02T03:04:05+00:00')
+        optics = Category.objects.get(pk='optics')
+        self.assertEqual(optics.parent_category_id, 'physics')
+        self.assertEqual((optics.path, optics.depth), ('science/physics/optics/', 2))
+        self.assertIsNone(Category.objects.get(pk='science').parent_category_id)
+        titles = sorted(article.tag.values_list('title', flat=True))
+        self.assertEqual(titles, [f'{"x" * 28}-2', 'x' * 30])
+
+    def test_csv_round_trip(self):
+        article = self.round_trip('articles.csv')
+        self.assertEqual(article.category.path, 'science/physics/optics/')
+        self.assertEqual(article.tag.count(), 2)
+
+    def test_invalid_created_at_is_skipped(self):
+        path = f'{self.directory}/articles.jsonl'
+        with open(path, 'w', encoding='utf-8') as stream:
+            for slug, created_at in [('bad', 'yesterday'), ('month', '2020-13-01T00:00:00Z'), ('good', '')]:
+                stream.write(json.dumps({
+                    'slug': slug, 'title': slug, 'user': self.user.pk, 'category': 'optics',
+                    'created_at': created_at
+                }) + '\n')
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_articles', path, stdout=stdout, stderr=stderr)
+        self.assertTrue(Article.objects.filter(pk='good').exists())
+        self.assertFalse(Article.objects.filter(pk__in=['bad', 'month']).exists())
+        self.assertIn('skipped 2', stdout.getvalue())
+        self.assertIn('"bad"', stderr.getvalue())
+
+    def test_import_schedules_image_processing(self):
+        with mock.patch.object(process_article_images, 'delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.round_trip('articles.jsonl')
+        delay.assert_called_once_with('lenses')
+
+
+class SeedDataTestCase(FakeRedisMixin, TestCase):
+    redis_modules = (leaderboard,)
+
+    def seed(self):
+        call_command(
+            'seed_data', users=2, categories=2, tags=3, articles=4, comments=2, images=1,
+            words=5, stdout=StringIO(), stderr=StringIO()
+        )
+
+    def test_rerun_does_not_duplicate_children(self):
+        self.seed()
+        self.seed()
+        self.assertEqual(Article.objects.count(), 4)
+        self.assertEqual(Comment.objects.count(), 8)
+        self.assertEqual(ArticleImage.objects.count(), 4)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, METRICS_TOKEN='')
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+
+    def test_closed_without_token(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+    @override_settings(DEBUG=True)
+    def test_open_without_token_in_debug(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        wrong = self.client.get('/metrics/', headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(wrong.status_code, 403)
+        response = self.client.get('/metrics/', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE http_request_duration_seconds histogram', response.content)
+
+    def test_closed_with_debug_off_in_env(self):
+        # DEBUG приходит из окружения строкой, "False" не должна открывать метрики
+        code = (
+            'import django; django.setup(); '
+            'from django.conf import settings; from django.test import Client; '
+            'print(settings.DEBUG is False, Client().get("/metrics/").status_code)'
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='config.settings', DEBUG='False', METRICS_TOKEN='')
+        output = subprocess.run(
+            [sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True
+        ).stdout
+        self.assertEqual(output.split(), ['True', '403'])
+
+    def test_middleware_records_request(self):
+        self.client.get('/wikipedia/categories/tree/')
+        collected = metrics.registry.collect()
+        (labels, histogram), = collected['http_request_duration_seconds'].items()
+        self.assertEqual(dict(labels)['method'], 'GET')
+        self.assertEqual(dict(labels)['status'], 200)
+        self.assertEqual(histogram.count, 1)
+        (_, queries), = collected['http_request_db_queries'].items()
+        self.assertEqual(queries.sum, 1)
+        self.assertNotIn('http_requests_duplicate_queries_total', collected)
+
+    def test_duplicate_queries_are_counted(self):
+        def view(request):
+            for _ in range(3):
+                list(Tag.objects.filter(pk='tag'))
+            return HttpResponse('ok')
+
+        middleware = metrics.MetricsMiddleware(view)
+        with self.assertLogs('config.metrics', 'INFO'):
+            middleware(RequestFactory().get('/'))
+        collected = metrics.registry.collect()
+        self.assertEqual(collected['http_requests_duplicate_queries_total'], {(('view', 'unresolved'),): 1})
+        (_, size), = collected['http_response_size_bytes'].items()
+        self.assertEqual(size.sum, 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, BUILD_ID='build-1')
+class SwaggerTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        swagger.swagger_ui_view.cache_clear()
+        self.addCleanup(swagger.swagger_ui_view.cache_clear)
+
+    def test_light_startup_skips_web_only_apps(self):
+        # отдельный процесс: в этом все модули уже импортированы
+        code = (
+            'import sys, django; django.setup(); '
+            'import apps.articles.tasks, apps.account.tasks; '
+            'print(",".join(m for m in ("drf_yasg", "django_filters", "rest_framework_simplejwt") '
+            'if m in sys.modules))'
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code], capture_output=True, text=True, env={
+                **os.environ, 'DJANGO_SETTINGS_MODULE': 'config.settings', 'DJANGO_LIGHT_STARTUP': '1'
+            }
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '')
+
+    def test_schema_cache_key_has_build_id(self):
+        response = self.client.get('/', {'format': 'openapi'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any(path.startswith('/wikipedia/') for path in json.loads(response.content)['paths']))
+        self.assertTrue(any('swagger:build-1' in key for key in cache._cache))
+        self.assertEqual(swagger.cache_prefix(), 'swagger:build-1')
+        with self.settings(BUILD_ID='build-2'):
+            self.assertEqual(swagger.cache_prefix(), 'swagger:build-2')
+
+    def test_schema_file_is_served(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as schema:
+            schema.write('{"swagger": "2.0", "paths": {}}')
+        self.addCleanup(os.remove, schema.name)
+        with self.settings(SWAGGER_SCHEMA_FILE=schema.name):
+            response = self.client.get('/', {'format': 'openapi'})
+            self.assertEqual(b''.join(response.streaming_content), b'{"swagger": "2.0", "paths": {}}')
+            response.close()
+        self.assertEqual(swagger.swagger_ui_view.cache_info().currsize, 0)
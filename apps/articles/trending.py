@@ -0,0 +1,105 @@
+"""
+Популярное сейчас. Просмотр в момент t весит exp(λ(t - TRENDING_EPOCH)),
+λ = ln 2 / TRENDING_HALF_LIFE_HOURS, и Article.trending_score - логарифм
+суммы весов. Вес растёт со временем вместо того, чтобы старые просмотры
+убывали, поэтому порядок статей совпадает с порядком по затухающему счёту,
+а сброс просмотров только прибавляет к счёту (logaddexp в том же UPDATE, что
+и views_count). Топ читается по индексу (-trending_score, slug). По часам
+просмотры лежат в кольцевом буфере ArticleViewBucket.
+"""
+import math
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db.models import Case, F, FloatField, PositiveIntegerField, Subquery, Sum, Value, When
+from django.db.models.functions import Exp, Greatest, Least, Ln
+
+from .models import Article, ArticleViewBucket, Category
+
+
+def epoch():
+    return datetime.fromisoformat(settings.TRENDING_EPOCH).replace(tzinfo=timezone.utc).timestamp()
+
+
+def decay_rate():
+    return math.log(2) / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+
+
+def log_weight(views, now):
+    return math.log(views) + decay_rate() * (now - epoch())
+
+
+def logaddexp(field, weight):
+    # log(e^a + e^b) без переполнения; 0 - у статьи ещё нет просмотров
+    high, low = Greatest(F(field), weight), Least(F(field), weight)
+    return Case(
+        When(**{f'{field}__lte': 0}, then=weight),
+        default=high + Ln(Value(1.0) + Exp(low - high)),
+        output_field=FloatField()
+    )
+
+
+def score_update(deltas, now):
+    """Выражение для .update(trending_score=...) по словарю slug -> просмотры."""
+    return Case(
+        *[
+            When(pk=slug, then=logaddexp('trending_score', Value(log_weight(views, now))))
+            for slug, views in deltas.items() if views > 0
+        ],
+        default=F('trending_score'),
+        output_field=FloatField()
+    )
+
+
+def record_buckets(deltas, now):
+    # слоты создаются пустыми, затем один UPDATE: тот же час - прибавить,
+    # более старый час в слоте - затереть, более новый (запоздавший сброс) - не трогать
+    ring = settings.TRENDING_RING_HOURS
+    hour = int(now // 3600)
+    slot = hour % ring
+    ArticleViewBucket.objects.bulk_create(
+        [ArticleViewBucket(article_id=slug, slot=slot, hour=hour) for slug in deltas],
+        ignore_conflicts=True
+    )
+    views = Case(
+        *[When(article_id=slug, then=Value(count)) for slug, count in deltas.items()],
+        default=Value(0),
+        output_field=PositiveIntegerField()
+    )
+    ArticleViewBucket.objects.filter(article_id__in=list(deltas), slot=slot).update(
+        views=Case(
+            When(hour=hour, then=F('views') + views),
+            When(hour__lt=hour, then=views),
+            default=F('views'),
+            output_field=PositiveIntegerField()
+        ),
+        hour=Greatest(F('hour'), Value(hour), output_field=PositiveIntegerField())
+    )
+
+
+def recent_views(slugs, now=None):
+    """Просмотры за последние TRENDING_WINDOW_HOURS часов по кольцевому буферу."""
+    hour = int((now or time.time()) // 3600)
+    window = min(settings.TRENDING_WINDOW_HOURS, settings.TRENDING_RING_HOURS)
+    buckets = ArticleViewBucket.objects.filter(article_id__in=slugs, hour__gt=hour - window)
+    return dict(buckets.values_list('article_id').annotate(total=Sum('views')).order_by())
+
+
+def trending_articles(limit, category=None, now=None):
+    """Топ по затухающему счёту; score - счёт на текущий момент, recent_views - за TRENDING_WINDOW_HOURS."""
+    now = now or time.time()
+    queryset = Article.objects.filter(trending_score__gt=0).only(
+        'slug', 'title', 'image', 'thumbnail', 'user', 'views_count', 'trending_score'
+    )
+    if category:
+        # вместе с подкатегориями: поддерево по материализованному пути
+        path = Category.objects.filter(pk=category).values('path')
+        queryset = queryset.filter(category__path__startswith=Subquery(path))
+    articles = list(queryset.order_by('-trending_score', 'slug')[:limit])
+    counts = recent_views([article.pk for article in articles], now)
+    shift = decay_rate() * (now - epoch())
+    for article in articles:
+        article.score = math.exp(article.trending_score - shift)
+        article.recent_views = counts.get(article.pk, 0)
+    return articles
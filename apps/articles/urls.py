@@ -1,6 +1,7 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 
+from . import async_views
 from .views import ArticleViewSet, CommentCreateDeleteView, TagViewSet, CategoryViewSet, ArticleFilter, HomepageViewSet
 
 
@@ -11,6 +12,12 @@ router.register('tags', TagViewSet, 'tags')
 router.register('categories', CategoryViewSet, 'category')
 router.register('article_filter', ArticleFilter, 'search')
 router.register('homepage', HomepageViewSet, 'homepage')
+# те же чтения в async-вьюхах, под ASGI обслуживаются без перехода в поток
 urlpatterns = [
+    path('async/article/', async_views.ArticleListView.as_view(), name='async-article-list'),
+    path('async/article/<str:pk>/', async_views.ArticleDetailView.as_view(), name='async-article-detail'),
+    path('async/homepage/', async_views.HomepageListView.as_view(), name='async-homepage-list'),
+    path('async/tags/', async_views.TagListView.as_view(), name='async-tags-list'),
+    path('async/categories/', async_views.CategoryListView.as_view(), name='async-category-list'),
 ]
 urlpatterns += router.urls
@@ -1,5 +1,6 @@
 from datetime import datetime
 
+
 def get_time():
     format = '%Y%m%d%M%s'
-    return datetime.now().strftime(format)
\ No newline at end of file
+    return datetime.now().strftime(format)
@@ -6,9 +6,12 @@ from rest_framework.response import Response
 from django_filters import rest_framework as rest_filter
 from rest_framework.generics import ListAPIView 
 
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
-from django.views.decorators.vary import vary_on_cookie, vary_on_headers
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
 
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -25,7 +28,9 @@ from .models import (
     Article,
     Tag,
     Comment,
-    Category
+    Category,
+    ArticleRevision,
+    RelatedArticle
 )
 from .serializers import (
     ArticleListSerializer,
@@ -35,10 +40,24 @@ from .serializers import (
     CommentSerializer,
     TagSerializer,
     CategorySerializer,
+    CategoryTreeSerializer,
     HomepageSerializer,
-    ArticleSerializerTop
+    HomepageDetailSerializer,
+    HomepageListSerializer,
+    TrendingArticleSerializer,
+    ArticleSerializerTop,
+    ArticleSearchSerializer,
+    ArticleRevisionSerializer,
+    RelatedArticleSerializer,
+    first_comments
 )
 from .permissions import IsOwner, IsStaff
+from . import leaderboard, revisions, search, tags, trending
+from .filters import FullTextSearchFilter
+from .counters import record_view
+from .cache import CachedResponseMixin, article_group
+from .pagination import ArticleCursorPagination, CommentCursorPagination, RevisionCursorPagination
+from config.db import ReplicaReadMixin
 from apps.articles import serializers
 
 # class PostListView(ListAPIView):
@@ -47,17 +66,110 @@ from apps.articles import serializers
 #     serializer_class = PostListSerializer
 
 
-class ArticleViewSet(ModelViewSet):
+# всё, что нужно карточке в списке и ключам курсорной пагинации, без text
+ARTICLE_SUMMARY_FIELDS = (
+    'slug', 'title', 'image', 'thumbnail', 'user', 'views_count', 'created_at'
+)
+ARTICLE_LIST_PLAN = {
+    'only': ARTICLE_SUMMARY_FIELDS,
+}
+
+# для экшенов, которым от статьи нужна только проверка существования
+ARTICLE_PK_PLAN = {
+    'only': ('slug', ),
+}
+
+def first_comments_prefetch():
+    # первая страница комментариев каждой статьи одним запросом (оконная функция);
+    # размер страницы читается при построении queryset, а не при импорте модуля
+    return Prefetch(
+        'comments',
+        queryset=first_comments(Comment.objects.select_related('user'))[
+            :settings.ARTICLE_COMMENTS_FIRST_PAGE + 1
+        ],
+        to_attr='first_comments'
+    )
+
+
+ARTICLE_DETAIL_PLAN = {
+    'select_related': ('user', ),
+    'prefetch_related': ('tag', 'article_images', first_comments_prefetch),
+}
+
+
+def prefetch_lookups(plan):
+    # элемент prefetch_related может быть функцией, которая строит Prefetch на каждый запрос
+    return [
+        lookup() if callable(lookup) else lookup
+        for lookup in plan.get('prefetch_related', ())
+    ]
+
+
+class QueryPlanMixin:
+    # action -> {'only': (...), 'select_related': (...), 'prefetch_related': (...)}
+    query_plans = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        plan = self.query_plans.get(self.action, {})
+        if plan.get('only'):
+            queryset = queryset.only(*plan['only'])
+        if plan.get('select_related'):
+            queryset = queryset.select_related(*plan['select_related'])
+        if plan.get('prefetch_related'):
+            queryset = queryset.prefetch_related(*prefetch_lookups(plan))
+        return queryset
+
+
+class ArticleRevisionMixin:
+    """
+    Создание и правка статьи через любой вьюсет пишут ревизию; save() и
+    ревизия - в одной транзакции, чтобы история не расходилась со статьёй.
+    """
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            article = serializer.save(user=self.request.user)
+            revisions.record(article, self.request.user)
+
+    def perform_update(self, serializer):
+        # сама ревизия - один INSERT полного текста, дельты считает compact_article_revisions
+        previous = (serializer.instance.title, serializer.instance.text)
+        with transaction.atomic():
+            article = serializer.save()
+            revisions.record(article, self.request.user, previous)
+
+
+class ArticleViewSet(
+    ArticleRevisionMixin, ReplicaReadMixin, QueryPlanMixin, CachedResponseMixin, ModelViewSet
+):
     queryset = Article.objects.all()
     serializer_class = ArticleSerializer
-    filter_backends = [filters.SearchFilter, rest_filter.DjangoFilterBackend, filters.OrderingFilter]
-    search_fields = ['title', 'user__username']
+    filter_backends = [FullTextSearchFilter, rest_filter.DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['tag']
-    ordering_fields = ['created_at']
-    
-    @method_decorator(cache_page(60*60*2))
-    def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+    ordering_fields = ['created_at', 'views_count']
+    pagination_class = ArticleCursorPagination
+    query_plans = {
+        'list': ARTICLE_LIST_PLAN,
+        'retrieve': ARTICLE_DETAIL_PLAN,
+        'update': ARTICLE_DETAIL_PLAN,
+        'partial_update': ARTICLE_DETAIL_PLAN,
+        'revisions': ARTICLE_PK_PLAN,
+        'revision': ARTICLE_PK_PLAN,
+        'diff': ARTICLE_PK_PLAN,
+        'related': ARTICLE_PK_PLAN,
+    }
+    cache_groups = ('articles', )
+    cache_per_article = True
+    replica_actions = (
+        'list', 'retrieve', 'search', 'comments', 'revisions', 'revision', 'diff', 'related'
+    )
+
+    def get_cache_groups(self):
+        if self.action == 'related':
+            # соседей пересчитывает related.refresh, карточки меняются вместе с 'articles'
+            return [article_group(self.kwargs['pk']), 'articles', 'related']
+        return super().get_cache_groups()
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -70,7 +182,7 @@ class ArticleViewSet(ModelViewSet):
         if self.action in ['create']:
             self.permission_classes = [IsAdminUser]
 
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'comments', 'revisions', 'revision', 'diff', 'related']:
             self.permission_classes = [AllowAny]
         if self.action == 'comment' and self.request.method == 'DELETE':
             self.permission_classes = [IsOwner]
@@ -87,28 +199,151 @@ class ArticleViewSet(ModelViewSet):
         article = self.get_object()
         serializer = CommentSerializer(data=request.data)
         if serializer.is_valid(raise_exception=True):
-            serializer.save(user=request.user, article=article)
+            serializer.save(user=request.user, post=article)
             return Response(
                 serializer.data, status=status.HTTP_201_CREATED
                 )
 
+    @action(detail=True, methods=['GET'])
+    def revisions(self, request, pk=None):
+        return self.dispatch_cached(self.list_revisions, request, pk=pk)
+
+    def list_revisions(self, request, pk=None):
+        article = self.get_object()
+        queryset = article.revisions.select_related('user').defer('data')
+        paginator = RevisionCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = ArticleRevisionSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['GET'], url_path=r'revisions/(?P<number>\d+)')
+    def revision(self, request, pk=None, number=None):
+        return self.dispatch_cached(self.get_revision, request, pk=pk, number=number)
+
+    def get_revision(self, request, pk=None, number=None):
+        article = self.get_object()
+        try:
+            revision, text = revisions.reconstruct(article.pk, int(number))
+        except ArticleRevision.DoesNotExist:
+            raise NotFound()
+        data = ArticleRevisionSerializer(revision).data
+        data['text'] = text
+        return Response(data)
+
+    @action(detail=True, methods=['GET'])
+    def diff(self, request, pk=None):
+        return self.dispatch_cached(self.get_diff, request, pk=pk)
+
+    def get_diff(self, request, pk=None):
+        # ?from=&to=, по умолчанию - последняя правка
+        article = self.get_object()
+        try:
+            new = int(request.query_params['to'])
+        except KeyError:
+            new = article.revisions.order_by('-number').values_list('number', flat=True).first()
+            if new is None:
+                raise NotFound()
+        except ValueError:
+            raise ValidationError({'to': 'Expected a revision number'})
+        try:
+            old = int(request.query_params.get('from', new - 1))
+        except ValueError:
+            raise ValidationError({'from': 'Expected a revision number'})
+        try:
+            text = revisions.diff(article.pk, old, new)
+        except ArticleRevision.DoesNotExist:
+            raise NotFound()
+        return Response({'from': old, 'to': new, 'diff': text})
+
+    @action(detail=True, methods=['GET'])
+    def related(self, request, pk=None):
+        return self.dispatch_cached(self.list_related, request, pk=pk)
+
+    def list_related(self, request, pk=None):
+        # top-K соседей заранее посчитаны задачами refresh/rebuild_related_articles
+        article = self.get_object()
+        links = RelatedArticle.objects.filter(article_id=article.pk).select_related('related').only(
+            'score', *[f'related__{field}' for field in ARTICLE_SUMMARY_FIELDS]
+        ).order_by('-score', 'related_id')
+        articles = []
+        for link in links:
+            link.related.score = link.score
+            articles.append(link.related)
+        serializer = RelatedArticleSerializer(
+            articles, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['GET'])
+    def comments(self, request, pk=None):
+        return self.dispatch_cached(self.list_comments, request, pk=pk)
+
+    def list_comments(self, request, pk=None):
+        article = self.get_object()
+        queryset = article.comments.select_related('user')
+        since = request.query_params.get('since')
+        if since:
+            # опрос новых комментариев: только созданные после since
+            since = parse_datetime(since)
+            if since is None:
+                raise ValidationError({'since': 'Expected an ISO 8601 datetime'})
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            queryset = queryset.filter(created_at__gt=since)
+        paginator = CommentCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = CommentSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['GET'])
+    def search(self, request):
+        query = request.query_params.get(FullTextSearchFilter.search_param, '').strip()
+        if not query:
+            return Response([])
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), settings.SEARCH_RESULTS_MAX)
+        except ValueError:
+            limit = 20
+        articles = search.search_articles(query, max(limit, 1))
+        serializer = ArticleSearchSerializer(
+            articles, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
     def retrieve(self, request, *args, **kwargs):
-        instance: Article = self.get_object() # Article
-        instance.views_count += 1
-        instance.save()
-        return super().retrieve(request, *args, **kwargs)
+        # ответ может прийти из кэша, поэтому просмотр считается по pk из URL
+        response = super().retrieve(request, *args, **kwargs)
+        record_view(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        return response
 
 class CommentCreateDeleteView(
+    mixins.ListModelMixin,
     mixins.DestroyModelMixin,
     GenericViewSet
     ):
-    queryset = Comment.objects.all()
+    queryset = Comment.objects.select_related('user')
     serializer_class = CommentSerializer
     permission_classes = [IsOwner]
+    filter_backends = [rest_filter.DjangoFilterBackend]
+    filterset_fields = ['post']
+    pagination_class = CommentCursorPagination
+
+    def get_permissions(self):
+        # IsOwner проверяет только объект, список открыт явно
+        if self.action == 'list':
+            self.permission_classes = [AllowAny]
+        return super().get_permissions()
 
+    def list(self, request, *args, **kwargs):
+        # только комментарии одной статьи, общего списка по всему сайту нет
+        if not request.query_params.get('post'):
+            raise ValidationError({'post': 'This query parameter is required'})
+        return super().list(request, *args, **kwargs)
 
 
 class TagViewSet(
+    ReplicaReadMixin,
+    CachedResponseMixin,
     mixins.ListModelMixin,
     mixins.CreateModelMixin,
     mixins.DestroyModelMixin,
@@ -116,8 +351,10 @@ class TagViewSet(
     GenericViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
-    permission_classes = TagSerializer
-    @method_decorator(cache_page(60*60*2))
+    cache_groups = ('tags', )
+    cache_actions = ('list', 'retrieve', 'autocomplete', 'cloud')
+    replica_actions = ('list', 'retrieve', 'autocomplete', 'cloud')
+
     def get_permissions(self):
         if self.action == 'create':
             self.permission_classes = [IsAuthenticated]
@@ -125,31 +362,106 @@ class TagViewSet(
             self.permission_classes = [IsAdminUser]
         return super().get_permissions()
 
-class CategoryViewSet(ModelViewSet):
+    @action(detail=False, methods=['GET'])
+    def autocomplete(self, request):
+        return self.dispatch_cached(self.list_autocomplete, request)
+
+    def list_autocomplete(self, request):
+        prefix = request.query_params.get('q', '').strip()
+        if not prefix:
+            return Response([])
+        limit = tags.get_limit(
+            request.query_params.get('limit'),
+            settings.TAG_AUTOCOMPLETE_DEFAULT, settings.TAG_AUTOCOMPLETE_MAX
+        )
+        return Response(tags.index.autocomplete(prefix, limit))
+
+    @action(detail=False, methods=['GET'])
+    def cloud(self, request):
+        return self.dispatch_cached(self.list_cloud, request)
+
+    def list_cloud(self, request):
+        limit = tags.get_limit(
+            request.query_params.get('limit'),
+            settings.TAG_CLOUD_DEFAULT, settings.TAG_CLOUD_MAX
+        )
+        return Response(tags.index.cloud(limit))
+
+class CategoryViewSet(ReplicaReadMixin, CachedResponseMixin, ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    cache_groups = ('categories', )
+    replica_actions = ('list', 'retrieve', 'tree', 'breadcrumbs', 'articles')
+
+    @action(detail=False, methods=['GET'])
+    def tree(self, request):
+        # все категории одним запросом, дерево собирается по parent_category_id
+        categories = list(Category.objects.order_by('path'))
+        roots = []
+        by_slug = {category.pk: category for category in categories}
+        for category in categories:
+            category.tree_children = []
+        for category in categories:
+            parent = by_slug.get(category.parent_category_id)
+            if parent is None:
+                roots.append(category)
+            else:
+                parent.tree_children.append(category)
+        return Response(CategoryTreeSerializer(roots, many=True).data)
+
+    @action(detail=True, methods=['GET'])
+    def breadcrumbs(self, request, pk=None):
+        category = self.get_object()
+        ancestors = list(category.get_ancestors()) + [category]
+        return Response(CategorySerializer(ancestors, many=True).data)
 
-class ArticleFilter(ModelViewSet):
+    @action(detail=True, methods=['GET'])
+    def articles(self, request, pk=None):
+        # статьи категории и всех её потомков, без обхода дерева по уровням
+        category = self.get_object()
+        queryset = Article.objects.filter(
+            category__path__startswith=category.path
+        ).only(*ARTICLE_SUMMARY_FIELDS)
+        paginator = ArticleCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = ArticleListSerializer(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
+class ArticleFilter(
+    ArticleRevisionMixin, ReplicaReadMixin, QueryPlanMixin, CachedResponseMixin, ModelViewSet
+):
     queryset = Article.objects.all()
     serializer_class = ArticleSerializer
-    filter_backends = [filters.SearchFilter, rest_filter.DjangoFilterBackend, filters.OrderingFilter]
-    search_fields = ['title']
+    filter_backends = [FullTextSearchFilter, rest_filter.DjangoFilterBackend, filters.OrderingFilter]
+    pagination_class = ArticleCursorPagination
+    query_plans = {
+        'list': ARTICLE_DETAIL_PLAN,
+        'retrieve': ARTICLE_DETAIL_PLAN,
+    }
+    cache_groups = ('articles', )
+    cache_per_article = True
 
-class HomepageViewSet(ModelViewSet):
+class HomepageViewSet(
+    ArticleRevisionMixin, ReplicaReadMixin, QueryPlanMixin, CachedResponseMixin, ModelViewSet
+):
     queryset = Article.objects.all()
     serializer_class = HomepageSerializer
-    filter_backends = [filters.SearchFilter, rest_filter.DjangoFilterBackend, filters.OrderingFilter]
-    search_fields = ['title', 'user__username']
+    filter_backends = [FullTextSearchFilter, rest_filter.DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['tag']
-    ordering_fields = ['created_at']
-    
-    @method_decorator(cache_page(60*60*2))
-    def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+    ordering_fields = ['created_at', 'views_count']
+    pagination_class = ArticleCursorPagination
+    query_plans = {
+        'list': ARTICLE_LIST_PLAN,
+    }
+    cache_groups = ('articles', )
+    cache_per_article = True
+    replica_actions = ('list', 'retrieve', 'first_ten_top', 'trending')
 
     def get_serializer_class(self):
         if self.action == 'list':
-            return HomepageSerializer
+            return HomepageListSerializer
+        elif self.action == 'retrieve':
+            return HomepageDetailSerializer
         elif self.action == 'create':
             return ArticleCreateSerializer
         return super().get_serializer_class()
@@ -175,7 +487,7 @@ class HomepageViewSet(ModelViewSet):
         article = self.get_object()
         serializer = CommentSerializer(data=request.data)
         if serializer.is_valid(raise_exception=True):
-            serializer.save(user=request.user, article=article)
+            serializer.save(user=request.user, post=article)
             return Response(
                 serializer.data, status=status.HTTP_201_CREATED
                 )
@@ -187,12 +499,25 @@ class HomepageViewSet(ModelViewSet):
     #     return super().retrieve(request, *args, **kwargs)
     @action(methods=["GET"], detail=False, url_path="test")
     def first_ten_top(self, request):
-        articles = Article.objects.order_by('-views_count').values()
-        print(articles)
-        serializer = ArticleSerializerTop(articles, many=True).data[:10]
+        articles = leaderboard.top_articles(
+            leaderboard.get_limit(request.query_params.get('limit')),
+            category=request.query_params.get('category'),
+            tag=request.query_params.get('tag')
+        )
+        serializer = ArticleSerializerTop(articles, many=True).data
 
         return Response(data=serializer)
 
+    @action(methods=["GET"], detail=False)
+    def trending(self, request):
+        # в отличие от first_ten_top старые просмотры затухают (см. trending)
+        articles = trending.trending_articles(
+            leaderboard.get_limit(request.query_params.get('limit')),
+            category=request.query_params.get('category')
+        )
+        serializer = TrendingArticleSerializer(articles, many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
+
 
 """  
 actions
@@ -4,6 +4,9 @@ from celery import Celery
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# system checks грузят URLconf со всеми вьюхами; они выполняются при деплое
+# (manage.py check), воркеру при каждом старте они не нужны
+os.environ.setdefault('CELERY_SKIP_CHECKS', '1')
 
 app = Celery('config')
 
@@ -0,0 +1,70 @@
+"""
+Сжатие ответов по Accept-Encoding: brotli (если установлен) или gzip.
+Ответы меньше COMPRESSION_MIN_SIZE байт и уже сжатые не трогаются.
+"""
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.regex_helper import _lazy_re_compile
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODING_RE = _lazy_re_compile(r'^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*$')
+
+
+def accepted_encodings(header):
+    encodings = {}
+    for part in header.split(','):
+        match = ENCODING_RE.match(part)
+        if not match:
+            continue
+        try:
+            quality = float(match[2]) if match[2] else 1.0
+        except ValueError:
+            continue
+        encodings[match[1].lower()] = quality
+    return {encoding for encoding, quality in encodings.items() if quality > 0}
+
+
+def negotiate(header):
+    accepted = accepted_encodings(header)
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return compress_string(content)
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    # MiddlewareMixin умеет и sync, и async: под ASGI цепочка не уходит в поток
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding', ))
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # байты другие, поэтому сильный ETag становится слабым (как в GZipMiddleware)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,83 @@
+"""
+Чтение с реплик. Вьюсеты с ReplicaReadMixin включают чтение с реплики на время
+безопасного запроса (list/retrieve/...), всё остальное идёт в default. После
+успешной записи пользователь на REPLICA_PIN_SECONDS закрепляется за primary,
+чтобы сразу видеть свои изменения несмотря на отставание реплик.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_KEY = 'db:pin:{user}'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def pin_to_primary(user):
+    if user.is_authenticated and settings.DATABASE_REPLICAS:
+        cache.set(PIN_KEY.format(user=user.pk), 1, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user):
+    return user.is_authenticated and cache.get(PIN_KEY.format(user=user.pk)) is not None
+
+
+@contextmanager
+def replica_reads():
+    # для кода вне вьюсетов (async-вьюхи): контекст копируется и в sync_to_async
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or not _replica_reads.get():
+            return DEFAULT_DB_ALIAS
+        # внутри транзакции читаем то, что в ней же записали
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # иначе объект, прочитанный с реплики, сохранился бы в неё же
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        return obj1._state.db in aliases and obj2._state.db in aliases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaReadMixin:
+    # экшены, которые можно читать с реплики
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            request.method in SAFE_METHODS
+            and self.action in self.replica_actions
+            and settings.DATABASE_REPLICAS
+            and not is_pinned(request.user)
+        ):
+            self.replica_token = _replica_reads.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, 'replica_token', None)
+        if token is not None:
+            _replica_reads.reset(token)
+            self.replica_token = None
+        elif request.method not in SAFE_METHODS and response.status_code < 400:
+            pin_to_primary(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,253 @@
+"""
+Метрики запросов в памяти процесса: латентность, число и время SQL-запросов,
+повторяющиеся запросы (признак N+1) и размер ответа по каждому view/action.
+
+Каждый поток пишет в свой шард, поэтому на пути запроса нет блокировок;
+шарды складываются только при чтении /metrics/ (формат Prometheus).
+"""
+import logging
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger('config.metrics')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+METRICS = {
+    'http_request_duration_seconds': ('histogram', DURATION_BUCKETS, 'Request latency'),
+    'http_request_db_queries': ('histogram', QUERY_BUCKETS, 'SQL queries per request'),
+    'http_request_db_duration_seconds': ('histogram', DURATION_BUCKETS, 'Time spent in SQL per request'),
+    'http_response_size_bytes': ('histogram', SIZE_BUCKETS, 'Response body size'),
+    'http_requests_duplicate_queries_total': ('counter', None, 'Requests with repeated SQL (N+1)'),
+}
+
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LIST_RE = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self.local = threading.local()
+        self.shards = []
+        self.shards_lock = threading.Lock()
+
+    def shard(self):
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = self.local.shard = defaultdict(dict)
+            # блокировка берётся один раз на поток, не на запрос
+            with self.shards_lock:
+                self.shards.append(shard)
+        return shard
+
+    def observe(self, name, labels, value):
+        series = self.shard()[name]
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = Histogram(METRICS[name][1])
+        histogram.observe(value)
+
+    def inc(self, name, labels, value=1):
+        series = self.shard()[name]
+        series[labels] = series.get(labels, 0) + value
+
+    def collect(self):
+        with self.shards_lock:
+            shards = list(self.shards)
+        merged = defaultdict(dict)
+        for shard in shards:
+            for name, series in list(shard.items()):
+                for labels, value in list(series.items()):
+                    if isinstance(value, Histogram):
+                        total = merged[name].get(labels)
+                        if total is None:
+                            total = merged[name][labels] = Histogram(value.buckets)
+                        total.counts = [a + b for a, b in zip(total.counts, value.counts)]
+                        total.sum += value.sum
+                        total.count += value.count
+                    else:
+                        merged[name][labels] = merged[name].get(labels, 0) + value
+        return merged
+
+    def reset(self):
+        with self.shards_lock:
+            for shard in self.shards:
+                shard.clear()
+
+
+registry = Registry()
+
+
+def format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    body = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in pairs
+    )
+    return '{' + body + '}' if body else ''
+
+
+def render_prometheus():
+    lines = []
+    collected = registry.collect()
+    for name, (kind, buckets, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(collected.get(name, {}).items()):
+            if kind == 'counter':
+                lines.append(f'{name}{format_labels(labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, value.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{format_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{name}_bucket{format_labels(labels, le="+Inf")} {value.count}')
+            lines.append(f'{name}_sum{format_labels(labels)} {value.sum}')
+            lines.append(f'{name}_count{format_labels(labels)} {value.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def query_signature(sql):
+    signature = LITERAL_RE.sub('?', sql).replace('%s', '?')
+    return IN_LIST_RE.sub('(...)', signature)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.signatures = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.signatures[query_signature(sql)] += 1
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    name = match.view_name or match._func_path
+    actions = getattr(match.func, 'actions', None)
+    if actions:
+        action = actions.get(request.method.lower())
+        if action:
+            return f'{name}:{action}'
+    return name
+
+
+def wrap_connections(stack, recorder):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(recorder))
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            wrap_connections(stack, recorder)
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        self.record(request, response, duration, recorder)
+        return response
+
+    async def __acall__(self, request):
+        # соединения у каждого потока свои, а async ORM ходит в базу из потока
+        # sync_to_async (один на запрос), поэтому обёртка ставится там же
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        stack = ExitStack()
+        await sync_to_async(wrap_connections)(stack, recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        duration = time.perf_counter() - started
+        self.record(request, response, duration, recorder)
+        return response
+
+    def record(self, request, response, duration, recorder):
+        view = view_label(request)
+        labels = (('view', view), ('method', request.method), ('status', response.status_code))
+        registry.observe('http_request_duration_seconds', labels, duration)
+        view_labels = (('view', view), )
+        registry.observe('http_request_db_queries', view_labels, recorder.count)
+        registry.observe('http_request_db_duration_seconds', view_labels, recorder.duration)
+        size = len(response.content) if not response.streaming else 0
+        registry.observe('http_response_size_bytes', view_labels, size)
+
+        duplicates = {
+            sql: count for sql, count in recorder.signatures.items()
+            if count >= settings.METRICS_DUPLICATE_QUERY_THRESHOLD
+        }
+        if duplicates:
+            registry.inc('http_requests_duplicate_queries_total', view_labels)
+            for sql, count in duplicates.items():
+                logger.info('Repeated query in %s (%d times): %s', view, count, sql)
+
+        if (
+            duration * 1000 >= settings.METRICS_SLOW_REQUEST_MS
+            and random.random() < settings.METRICS_SLOW_REQUEST_SAMPLE_RATE
+        ):
+            logger.warning(
+                'Slow request %s %s (%s): %.1f ms, %d queries in %.1f ms, %d bytes',
+                request.method, request.get_full_path(), view, duration * 1000,
+                recorder.count, recorder.duration * 1000, size
+            )
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    # без токена метрики отдаются только при DEBUG, в продакшене закрыты
+    if not token and not settings.DEBUG:
+        return HttpResponseForbidden()
+    if token:
+        provided = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not constant_time_compare(provided, token):
+            return HttpResponseForbidden()
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4')
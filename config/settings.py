@@ -11,8 +11,9 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 from datetime import timedelta
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -25,7 +26,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = config('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = config('DEBUG')
+DEBUG = config('DEBUG', cast=bool)
 
 ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='*').split(',')
 
@@ -49,8 +50,19 @@ INSTALLED_APPS = [
     'django_filters'
 ]
 
+# Celery-воркеру не нужны админка, swagger, JWT и фильтры API: без них django.setup()
+# не импортирует drf_yasg, django_filters, simplejwt (и pkg_resources) и admin.py
+LIGHT_STARTUP = config(
+    'DJANGO_LIGHT_STARTUP', default=os.path.basename(sys.argv[0]) == 'celery', cast=bool
+)
+WEB_ONLY_APPS = ('django.contrib.admin', 'drf_yasg', 'django_filters', 'rest_framework_simplejwt')
+if LIGHT_STARTUP:
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in WEB_ONLY_APPS]
+
 MIDDLEWARE = [
+    'config.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'config.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -83,6 +95,9 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# выставляется в config/asgi.py
+ASGI = config('DJANGO_ASGI', default=False, cast=bool)
+
 DATABASES = {
     'default': {
         'ENGINE': config('DB_ENGINE'),
@@ -90,10 +105,27 @@ DATABASES = {
         'USER': config('DB_USER'),
         'PORT': config('DB_PORT'),
         'HOST': config('DB_HOST'),
-        'PASSWORD': config('DB_PASSWORD')
+        'PASSWORD': config('DB_PASSWORD'),
+        # постоянные соединения, перед переиспользованием проверяются; под ASGI
+        # запросы идут из разных потоков sync_to_async и каждый держал бы своё
+        # соединение, поэтому по умолчанию соединение закрывается после запроса
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=0 if ASGI else 60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# реплики для чтения: для PostgreSQL - хосты, для SQLite - пути к файлам баз
+DATABASE_REPLICAS = []
+for number, replica in enumerate(config('DB_REPLICAS', default='', cast=Csv())):
+    alias = f'replica{number}'
+    key = 'NAME' if 'sqlite' in DATABASES['default']['ENGINE'] else 'HOST'
+    DATABASES[alias] = {**DATABASES['default'], key: replica, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['config.db.ReplicaRouter']
+# сколько секунд после записи пользователь читает только с primary
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -137,13 +169,20 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = 'article_images/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'article_images')
 
+# ширины WebP-вариантов картинок статей, самый узкий отдаётся в списках
+IMAGE_VARIANT_WIDTHS = (320, 640, 1280)
+IMAGE_VARIANT_QUALITY = 80
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-EMAIL_BACKENDS = 'django.core.mail.backends.smtp.EmailBackend' # класс отвечающий за отправку писем
+# класс отвечающий за отправку писем; для тестов и стендов подходят
+# django.core.mail.backends.locmem.EmailBackend и ...filebased.EmailBackend
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = config('EMAIL_FILE_PATH', default=str(BASE_DIR / 'sent_emails'))
 EMAIL_HOST_USER = config('EMAIL_HOST_USER') # почта с которой отправляются письма
 EMAIL_PORT = config('EMAIL_PORT', default=587)
 EMAIL_HOST = config('EMAIL_HOST') # какой хост используется для отправки писем
@@ -152,15 +191,51 @@ EMAIL_USE_TLS = config('EMAIL_USE_TLS', cast=bool) # вид соединения
 
 AUTH_USER_MODEL = 'account.User'
 
+SITE_URL = config('SITE_URL', default='http://localhost:8000')
+
+# redis - письма копятся в очереди и уходят пачками по одному соединению,
+# celery - отдельная задача на каждое письмо
+ACCOUNT_MAIL_QUEUE = config('ACCOUNT_MAIL_QUEUE', default='redis')
+ACCOUNT_MAIL_BATCH_SIZE = 50
+ACCOUNT_MAIL_BATCH_DELAY = config('ACCOUNT_MAIL_BATCH_DELAY', default=2, cast=int)
+ACCOUNT_MAIL_MAX_RETRIES = 5
+ACCOUNT_MAIL_RETRY_DELAY = 10
+# после стольких неудачных отправок письмо уходит в account:mail:dead
+ACCOUNT_MAIL_MAX_ATTEMPTS = 5
+ACCOUNT_MAIL_LOCK_TIMEOUT = 60 * 5
+
+# одноразовые коды активации и восстановления пароля
+ACCOUNT_CODE_LENGTH = {'activation': 20, 'restore': 8}
+ACCOUNT_CODE_TTL = {'activation': 60 * 60 * 48, 'restore': 60 * 15}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.account.authentication.CachedJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'config.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 2,
     'SEARCH_PARAM': 'q'
 }
 
+# ответы меньше порога не сжимаются: выигрыш меньше накладных расходов
+COMPRESSION_MIN_SIZE = config('COMPRESSION_MIN_SIZE', default=1024, cast=int)
+COMPRESSION_BROTLI_QUALITY = 5
+
+# схема Swagger строится при первом запросе и кэшируется; если файл задан
+# (python manage.py generate_swagger <файл> при деплое), отдаётся он
+SWAGGER_SETTINGS = {'DEFAULT_INFO': 'config.api_info.info'}
+SWAGGER_CACHE_TIMEOUT = config('SWAGGER_CACHE_TIMEOUT', default=60 * 60 * 24, cast=int)
+SWAGGER_SCHEMA_FILE = config('SWAGGER_SCHEMA_FILE', default='')
+# маркер сборки (тег образа, git sha): входит в ключ кэша схемы Swagger
+BUILD_ID = config('BUILD_ID', default='')
+
+# сколько секунд пользователь из JWT живёт в кэше
+AUTH_USER_CACHE_TIMEOUT = config('AUTH_USER_CACHE_TIMEOUT', default=60, cast=int)
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=120),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -169,5 +244,108 @@ SIMPLE_JWT = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
 }
 
-CELERY_BROKER_URL = 'redis://127.0.0.1:6379/0'
-CELERY_RESULT_BACKEND = 'redis://127.0.0.1:6379/0'
\ No newline at end of file
+REDIS_URL = config('REDIS_URL', default='redis://127.0.0.1:6379/0')
+
+# пустой CACHE_URL - кэш в памяти процесса (локальная разработка, тесты)
+CACHE_URL = config('CACHE_URL', default=REDIS_URL)
+
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'wiki',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+API_CACHE_TIMEOUT = config('API_CACHE_TIMEOUT', default=60 * 5, cast=int)
+
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
+CELERY_BEAT_SCHEDULE = {
+    'compact-article-revisions': {
+        'task': 'apps.articles.tasks.compact_article_revisions',
+        'schedule': 60 * 60,
+    },
+    'deliver-account-mail': {
+        'task': 'apps.account.tasks.deliver_outbox',
+        'schedule': 60,
+    },
+    'flush-article-views': {
+        'task': 'apps.articles.tasks.flush_article_views',
+        'schedule': config('ARTICLE_VIEWS_FLUSH_INTERVAL', default=10, cast=int),
+    },
+    'purge-expired-codes': {
+        'task': 'apps.account.tasks.purge_expired_codes',
+        'schedule': 60 * 60,
+    },
+    'rebuild-leaderboards': {
+        'task': 'apps.articles.tasks.rebuild_leaderboards',
+        'schedule': 60 * 60,
+    },
+    'rebuild-related-articles': {
+        'task': 'apps.articles.tasks.rebuild_related_articles',
+        'schedule': 24 * 60 * 60,
+    },
+    'refresh-related-articles': {
+        'task': 'apps.articles.tasks.refresh_related_articles',
+        'schedule': 10 * 60,
+    },
+}
+
+# redis - просмотры копятся в хэше и сбрасываются задачей flush_article_views,
+# memory - в памяти процесса, сброс раз в ARTICLE_VIEWS_FLUSH_INTERVAL секунд
+ARTICLE_VIEWS_BUFFER = config('ARTICLE_VIEWS_BUFFER', default='redis')
+ARTICLE_VIEWS_FLUSH_INTERVAL = config('ARTICLE_VIEWS_FLUSH_INTERVAL', default=10, cast=int)
+
+# сколько комментариев встраивается в детальную страницу статьи
+ARTICLE_COMMENTS_FIRST_PAGE = 20
+
+# история правок: полный снимок раз в N ревизий, между ними - дельты (цепочка до log2(N) шагов)
+ARTICLE_REVISION_SNAPSHOT_INTERVAL = 64
+ARTICLE_REVISION_COMPACT_BATCH = 500
+
+# похожие статьи: top-K соседей, score = вес текста * косинус TF-IDF + остаток * Жаккар по тегам
+RELATED_ARTICLES_COUNT = 10
+RELATED_TEXT_WEIGHT = 0.7
+RELATED_TITLE_WEIGHT = 3
+# термы чаще, чем в этой доле статей, не учитываются
+RELATED_MAX_DF = 0.5
+# размер пачки: ячеек B x N в плотном блоке score и пар из постингов термов
+RELATED_BATCH_CELLS = 2_000_000
+RELATED_BATCH_POSTINGS = 5_000_000
+
+TAG_AUTOCOMPLETE_DEFAULT = 10
+TAG_AUTOCOMPLETE_MAX = 50
+TAG_CLOUD_DEFAULT = 50
+TAG_CLOUD_MAX = 200
+# число градаций веса в облаке тегов
+TAG_CLOUD_WEIGHTS = 5
+
+TOP_ARTICLES_DEFAULT = 10
+TOP_ARTICLES_MAX = 100
+
+# популярное сейчас: вес просмотра вдвое меньше каждые TRENDING_HALF_LIFE_HOURS часов,
+# TRENDING_EPOCH - точка отсчёта весов (в прошлом); оба входят в сохранённый
+# Article.trending_score, поэтому это константы: менять только вместе с пересчётом
+TRENDING_HALF_LIFE_HOURS = 24
+TRENDING_EPOCH = '2024-01-01'
+TRENDING_RING_HOURS = 48
+TRENDING_WINDOW_HOURS = 24
+
+# конфигурация полнотекстового поиска PostgreSQL
+SEARCH_CONFIG = config('SEARCH_CONFIG', default='russian')
+SEARCH_RESULTS_MAX = 50
+
+# метрики запросов, отдаются на /metrics/ в формате Prometheus;
+# без METRICS_TOKEN эндпоинт открыт только при DEBUG
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_DUPLICATE_QUERY_THRESHOLD = 3
+METRICS_SLOW_REQUEST_MS = config('METRICS_SLOW_REQUEST_MS', default=500, cast=int)
+METRICS_SLOW_REQUEST_SAMPLE_RATE = config('METRICS_SLOW_REQUEST_SAMPLE_RATE', default=1.0, cast=float)
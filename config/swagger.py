@@ -0,0 +1,39 @@
+"""
+Swagger без затрат на старте: drf_yasg импортируется и схема строится
+при первом запросе, дальше ответ берётся из кэша (SWAGGER_CACHE_TIMEOUT).
+Ключ кэша содержит BUILD_ID, чтобы после деплоя не отдавалась старая схема;
+без BUILD_ID - время старта процесса. Заранее собранная схема
+(SWAGGER_SCHEMA_FILE, manage.py generate_swagger) отдаётся как есть.
+"""
+import os
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import FileResponse
+
+STARTED_AT = int(time.time())
+
+
+def cache_prefix():
+    return f'swagger:{settings.BUILD_ID or STARTED_AT}'
+
+
+@lru_cache(maxsize=None)
+def swagger_ui_view():
+    from drf_yasg.views import get_schema_view
+    from rest_framework import permissions
+
+    # описание API берётся из SWAGGER_SETTINGS['DEFAULT_INFO'], как и в generate_swagger
+    schema_view = get_schema_view(public=True, permission_classes=[permissions.AllowAny])
+    return schema_view.with_ui(
+        'swagger', cache_timeout=settings.SWAGGER_CACHE_TIMEOUT,
+        cache_kwargs={'key_prefix': cache_prefix()}
+    )
+
+
+def schema_view(request, *args, **kwargs):
+    path = settings.SWAGGER_SCHEMA_FILE
+    if path and request.GET.get('format') == 'openapi' and os.path.exists(path):
+        return FileResponse(open(path, 'rb'), content_type='application/json')
+    return swagger_ui_view()(request, *args, **kwargs)